@@ -1,22 +1,27 @@
 # app.py
 import streamlit as st
+from src.database import ensure_db_ready
 from src.views.sidebar import show_sidebar
-from src.views.dashboard import show_dashboard
-from src.views.operations import show_operations
-from src.views.catalog import show_catalog
-from src.views.ai_doctor import show_ai_doctor
 
 st.set_page_config(page_title="HomeMeds Pro", page_icon="💊", layout="wide")
 
-# 1. 加载侧边栏，获取当前页面选择和开发者状态
-menu, dev_mode = show_sidebar()
+# 0. 表结构与种子数据检查 (每个进程只执行一次，之后的重跑直接跳过)
+ensure_db_ready()
 
-# 2. 路由分发
+# 1. 加载侧边栏，获取当前页面选择、开发者状态和当前家庭
+menu, dev_mode, household_id = show_sidebar()
+
+# 2. 路由分发：页面模块按需导入，冷启动只加载当前页面用到的依赖
+#    (AI 页面的 openai/httpx 在第一次提问时才导入，见 services.ai_service)
 if menu == "🏠 药箱看板":
-    show_dashboard()
+    from src.views.dashboard import show_dashboard
+    show_dashboard(household_id)
 elif menu == "💊 药品操作":
-    show_operations(dev_mode)  # 传入开发者模式状态
+    from src.views.operations import show_operations
+    show_operations(dev_mode, household_id)  # 传入开发者模式状态
 elif menu == "📖 公共药库":
+    from src.views.catalog import show_catalog
     show_catalog(dev_mode)
 elif menu == "🤖 AI 药剂师":
-    show_ai_doctor()
\ No newline at end of file
+    from src.views.ai_doctor import show_ai_doctor
+    show_ai_doctor(household_id)
@@ -0,0 +1,65 @@
+# benchmarks/bench_barcode_lookup.py
+"""
+扫码入库基准：连续扫描条码时每次查询药库的耗时
+对比 旧实现 (pandas 读单行) / 主键直查 (LRU 未命中) / LRU 命中
+用法 (项目根目录): python -m benchmarks.bench_barcode_lookup
+"""
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from src import database
+from src.services import catalog
+
+CATALOG_SIZES = (1_000, 10_000, 100_000)
+SCANS = 2_000
+
+def fill_catalog(conn, n_rows):
+    conn.execute("DELETE FROM medicine_catalog")
+    conn.executemany(
+        "INSERT INTO medicine_catalog (barcode, name, unit, tags) VALUES (?, ?, '片', '感冒 退烧')",
+        ((f"69{i:011d}", f"基准测试药{i}") for i in range(n_rows)))
+    conn.commit()
+    database.bump_catalog_version()
+
+def legacy_lookup(barcode):
+    """旧实现：pandas 读出单行再转 dict"""
+    with database.borrow_connection() as conn:
+        df = pd.read_sql_query("SELECT * FROM medicine_catalog WHERE barcode = ?", conn, params=(barcode,))
+        return df.iloc[0].fillna("").to_dict() if not df.empty else None
+
+def cold_lookup(barcode):
+    """每次都清空 LRU，测量主键直查的成本"""
+    database.bump_catalog_version()
+    return catalog.lookup_barcode(barcode)
+
+def per_scan_us(func, codes):
+    start = time.perf_counter()
+    for code in codes:
+        assert func(code) is not None
+    return (time.perf_counter() - start) / len(codes) * 1e6
+
+def main():
+    tmp_dir = tempfile.mkdtemp(prefix="homemeds_bench_")
+    database.set_db_path(os.path.join(tmp_dir, "bench.db"))
+    database.init_db()
+
+    print(f"{'catalog':>8} | {'pandas 旧实现 (µs)':>18} | {'主键直查 (µs)':>14} | {'LRU 命中 (µs)':>14}")
+    print("-" * 66)
+    for n_rows in CATALOG_SIZES:
+        with database.borrow_connection() as conn:
+            fill_catalog(conn, n_rows)
+        # 一次入库会话：几百种药反复扫描 (同一盒药多件、同一批次)
+        hot = [f"69{random.randrange(n_rows):011d}" for _ in range(300)]
+        codes = [random.choice(hot) for _ in range(SCANS)]
+        legacy_us = per_scan_us(legacy_lookup, codes[:200])
+        cold_us = per_scan_us(cold_lookup, codes)
+        for code in hot: catalog.lookup_barcode(code)
+        warm_us = per_scan_us(catalog.lookup_barcode, codes)
+        print(f"{n_rows:>8} | {legacy_us:>18.1f} | {cold_us:>14.1f} | {warm_us:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bench_dashboard_metrics.py
+"""
+看板统计耗时基准：库存从 1k 增长到 100k 行时 get_dashboard_metrics 的耗时
+用法 (项目根目录): python -m benchmarks.bench_dashboard_metrics
+"""
+import os
+import inspect
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+from src import database
+from src.services import queries, alerts
+
+SIZES = (1_000, 10_000, 100_000)
+REPEAT = 20
+
+def fill_inventory(conn, n_rows):
+    """写入 n_rows 条随机过期日期的库存 (过去一年到未来两年)"""
+    conn.execute("DELETE FROM expiry_buckets")
+    conn.execute("DELETE FROM inventory")
+    conn.execute(
+        "INSERT OR IGNORE INTO medicine_catalog (barcode, name, unit) VALUES ('BENCH0001', '基准测试药', '片')"
+    )
+    today = date.today()
+    rows = (
+        ("BENCH0001", (today + timedelta(days=random.randint(-365, 730))).isoformat(), 10, "公用", "")
+        for _ in range(n_rows)
+    )
+    conn.executemany(
+        "INSERT INTO inventory (barcode, expiry_date, quantity_val, owner, my_dosage) VALUES (?, ?, ?, ?, ?)", rows
+    )
+    conn.commit()
+
+def refresh_buckets(conn):
+    """整表计算过期分档 (定时任务/跨天时的成本)，返回耗时 ms"""
+    start = time.perf_counter()
+    alerts.refresh_expiry_buckets(conn, date.today().isoformat())
+    database.set_meta(conn, "expiry_buckets_on", date.today().isoformat())  # 与后台任务一样标记为今天已刷新
+    conn.commit()
+    return (time.perf_counter() - start) * 1000
+
+def legacy_metrics():
+    """旧实现：整表读入 pandas 再过滤 (作为对照)"""
+    df = queries.inventory_frame(
+        inspect.unwrap(queries._load_inventory_rows)(database.DEFAULT_HOUSEHOLD_ID, date.today().isoformat()))
+    if df.empty: return 0, 0, 0
+    dates = pd.to_datetime(df['expiry_date']).dt.date
+    today = date.today()
+    return len(df), len(dates[dates < today]), len(dates[(dates >= today) & (dates <= (today + timedelta(days=90)))])
+
+def sql_metrics():
+    """新实现 (绕过版本缓存，测量真实查询成本)"""
+    return queries._count_expiry_buckets.__wrapped__(date.today().isoformat(), database.DEFAULT_HOUSEHOLD_ID)
+
+def best_of(func, repeat=REPEAT):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    tmp_dir = tempfile.mkdtemp(prefix="homemeds_bench_")
+    database.set_db_path(os.path.join(tmp_dir, "bench.db"))
+    database.init_db()
+
+    print(f"{'rows':>8} | {'分档计数 (ms)':>14} | {'分档刷新 (ms)':>14} | {'pandas 旧实现 (ms)':>18}")
+    print("-" * 65)
+    for n_rows in SIZES:
+        with database.borrow_connection() as conn:
+            fill_inventory(conn, n_rows)
+            refresh_ms = refresh_buckets(conn)
+        assert sql_metrics() == legacy_metrics()
+        sql_ms = best_of(sql_metrics)
+        legacy_ms = best_of(legacy_metrics, repeat=3)
+        print(f"{n_rows:>8} | {sql_ms:>14.2f} | {refresh_ms:>14.2f} | {legacy_ms:>18.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_importtime.py
+"""
+冷启动基准：每个场景在全新的子进程里执行 python -X importtime，统计导入耗时
+对比 “旧 app.py 一次性导入全部页面” 与 “按页面延迟导入” 各入口真正需要加载的模块
+用法 (项目根目录):
+  python -m benchmarks.bench_importtime
+  python -m benchmarks.bench_importtime --repeat 5 --top 15 --budget-ms 1500
+非 AI 场景如果加载了 openai，或任一场景超过 --budget-ms，以退出码 1 结束
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (场景名, 导入语句, 是否允许加载 openai)
+SCENARIOS = [
+    ("streamlit (基线)", "import streamlit", False),
+    ("看板 (侧边栏+dashboard)", "import src.views.sidebar, src.views.dashboard", False),
+    ("药品操作", "import src.views.sidebar, src.views.operations", False),
+    ("公共药库", "import src.views.sidebar, src.views.catalog", False),
+    ("AI 药剂师 (含首次提问)", "import src.views.sidebar, src.views.ai_doctor, openai, httpx", True),
+    ("旧 app.py (全部页面)",
+     "import src.views.sidebar, src.views.dashboard, src.views.operations, src.views.catalog, src.views.ai_doctor",
+     False),
+]
+
+def run_once(statement):
+    """返回 (墙钟耗时 ms, {顶层模块: 累计导入耗时 µs}, 已加载的模块集合)"""
+    code = f"{statement}\nimport sys\nprint('\\n'.join(sys.modules))"
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                          capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "子进程失败")
+
+    # stderr 每行: "import time:   self [us] | cumulative | imported package"，缩进表示被谁导入
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"): continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit(): continue
+        name = parts[2]
+        if name.startswith("  "): continue  # 只统计顶层导入，子模块已计入父模块的累计值
+        cumulative[name.strip()] = int(parts[1])
+    return wall_ms, cumulative, set(proc.stdout.split())
+
+def measure(statement, repeat):
+    """取墙钟最快的一次 (第一次运行顺便生成 .pyc，不计入)"""
+    run_once(statement)
+    return min((run_once(statement) for _ in range(repeat)), key=lambda r: r[0])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按页面统计冷启动导入耗时")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景运行次数 (取最快)")
+    parser.add_argument("--top", type=int, default=8, help="每个场景列出最慢的顶层模块数")
+    parser.add_argument("--budget-ms", type=float, help="任一场景墙钟耗时超过该值即判定失败")
+    args = parser.parse_args(argv)
+
+    failures = []
+    print(f"{'场景':<28} | {'墙钟 (ms)':>10} | {'导入合计 (ms)':>13} | {'模块数':>6} | openai")
+    print("-" * 80)
+    details = []
+    for name, statement, allow_openai in SCENARIOS:
+        wall_ms, cumulative, modules = measure(statement, args.repeat)
+        has_openai = "openai" in modules
+        print(f"{name:<28} | {wall_ms:>10.1f} | {sum(cumulative.values()) / 1000:>13.1f} | {len(modules):>6} | "
+              f"{'是' if has_openai else '否'}")
+        details.append((name, cumulative))
+        if has_openai and not allow_openai:
+            failures.append(f"{name}: 不应加载 openai")
+        if args.budget_ms and wall_ms > args.budget_ms:
+            failures.append(f"{name}: {wall_ms:.0f} ms 超过预算 {args.budget_ms:.0f} ms")
+
+    for name, cumulative in details:
+        print(f"\n🐢 {name} 最慢的顶层导入:")
+        for module, us in sorted(cumulative.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+            print(f"  {us / 1000:>9.1f} ms  {module}")
+
+    if failures:
+        print("\n⚠️ " + "\n⚠️ ".join(failures))
+        return 1
+    print("\n✅ 冷启动检查通过")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# benchmarks/bench_row_models.py
+"""
+读路径基准：pandas.read_sql_query + iterrows (旧实现) 对比 __slots__ 行对象
+分别统计 每次请求耗时 与 分配的内存峰值 (tracemalloc)，缓存未命中 (直接调用未缓存的函数)
+用法 (项目根目录): python -m benchmarks.bench_row_models
+"""
+import os
+import time
+import inspect
+import tempfile
+import tracemalloc
+from datetime import date
+
+import pandas as pd
+
+from src import database
+from src.services import queries, catalog
+from src.services.rows import CATALOG_SELECT
+from benchmarks.datagen import populate
+
+SIZES = (1_000, 10_000)
+REPEAT = 20
+
+def legacy_inventory_page(page_size):
+    """旧实现：读成 DataFrame 再 iterrows 逐行取字段 (与旧版下拉框/卡片循环相同)"""
+    with database.borrow_connection() as conn:
+        df = pd.read_sql_query(queries._inventory_select(date.today().isoformat()) + " WHERE i.household_id = ? ORDER BY i.expiry_date ASC "
+                               "LIMIT ?", conn, params=(database.DEFAULT_HOUSEHOLD_ID, page_size))
+    df['quantity_display'] = df['quantity_val'].astype(str) + " " + df['unit'].fillna('')
+    return [f"{r['name']} | 剩: {r['quantity_display']}" for _, r in df.iterrows()]
+
+def rows_inventory_page(page_size):
+    rows, _ = inspect.unwrap(queries._load_inventory_page)(0, page_size, None, None, database.DEFAULT_HOUSEHOLD_ID, (),
+                                                            date.today().isoformat())
+    return [f"{r.name} | 剩: {r.quantity_display}" for r in rows]
+
+def legacy_catalog_all():
+    with database.borrow_connection() as conn:
+        df = pd.read_sql_query(CATALOG_SELECT + " ORDER BY is_standard DESC, created_at DESC", conn)
+    return [r['barcode'] for _, r in df.iterrows()]
+
+def rows_catalog_all():
+    return [r.barcode for r in inspect.unwrap(catalog.load_catalog_rows)()]
+
+def measure(func):
+    func()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+    elapsed_ms = (time.perf_counter() - start) / REPEAT * 1000
+    tracemalloc.start()
+    func()
+    peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return elapsed_ms, peak_kb
+
+def main():
+    tmp_dir = tempfile.mkdtemp(prefix="homemeds_bench_")
+    database.set_db_path(os.path.join(tmp_dir, "bench.db"))
+    database.init_db()
+
+    cases = [
+        ("库存一页 (24 条)", lambda: legacy_inventory_page(24), lambda: rows_inventory_page(24)),
+        ("库存一页 (500 条)", lambda: legacy_inventory_page(500), lambda: rows_inventory_page(500)),
+        ("药库全表", legacy_catalog_all, rows_catalog_all),
+    ]
+    print(f"{'药库':>7} | {'项目':<16} | {'pandas (ms)':>11} | {'行对象 (ms)':>11} | "
+          f"{'pandas 峰值 (KB)':>15} | {'行对象峰值 (KB)':>15}")
+    print("-" * 96)
+    for n_catalog in SIZES:
+        with database.borrow_connection() as conn:
+            populate(conn, n_catalog, n_catalog)
+        for name, legacy, lean in cases:
+            assert legacy() == lean()
+            legacy_ms, legacy_kb = measure(legacy)
+            lean_ms, lean_kb = measure(lean)
+            print(f"{n_catalog:>7} | {name:<16} | {legacy_ms:>11.2f} | {lean_ms:>11.2f} | "
+                  f"{legacy_kb:>15.0f} | {lean_kb:>15.0f}")
+
+if __name__ == "__main__":
+    main()
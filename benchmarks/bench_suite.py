@@ -0,0 +1,182 @@
+# benchmarks/bench_suite.py
+"""
+服务层热点路径基准：在 1k / 10k / 100k 规模的合成数据上逐项计时，可保存结果并与基线对比
+每一项测的都是缓存未命中时的真实成本 (计时前递增数据版本/药库版本)
+用法 (项目根目录):
+  python -m benchmarks.bench_suite --save benchmarks/results/base.json          # 改动前
+  python -m benchmarks.bench_suite --baseline benchmarks/results/base.json      # 改动后对比
+  python -m benchmarks.bench_suite --sizes 1000,10000 --only search
+与基线相比变慢超过 --threshold (默认 15%) 的项目会标记出来，并以退出码 1 结束
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+
+from src import database
+from src.services import queries, catalog, search, ai_service, tags, safety, sync
+from benchmarks.datagen import populate, write_seed_file
+
+SIZES = (1_000, 10_000, 100_000)
+INVENTORY_RATIO = 0.5      # 库存条数 = 药库条数 * 比例
+DEFAULT_REPEAT = 7
+DEFAULT_THRESHOLD = 0.15
+SYNC_DELTA = 50            # 增量同步一批的变化条数 (成本应与库的规模无关)
+
+def _uncached(func):
+    """每次调用前让所有读缓存失效，测量真实查询成本"""
+    def run():
+        database.bump_catalog_version()
+        return func()
+    return run
+
+def _sync_cases():
+    """最近 SYNC_DELTA 条变化的读取与应用；应用时每次换一个更新的时间戳，保证都会写入"""
+    with database.borrow_connection() as conn:
+        cursor = max(0, sync.head_seq(conn) - SYNC_DELTA)
+    changes = sync.read_changes(cursor, limit=SYNC_DELTA)["changes"]
+    counter = iter(range(1, 1 << 40))
+    def apply():
+        stamp = f"9999-{next(counter):012d}Z"
+        return sync.apply_remote_changes([dict(c, changed_at=stamp, origin="bench") for c in changes])
+    return [
+        (f"read_changes (增量 {SYNC_DELTA} 条)", lambda: sync.read_changes(cursor, limit=SYNC_DELTA), DEFAULT_REPEAT),
+        (f"apply_remote_changes ({SYNC_DELTA} 条)", apply, DEFAULT_REPEAT),
+    ]
+
+def build_cases(n_catalog, members):
+    """(名称, 函数, 重复次数)；重复次数少的是整表级别的重操作"""
+    barcode = f"69{n_catalog // 2:011d}"
+    owner = members[1]
+    hh = database.DEFAULT_HOUSEHOLD_ID
+    return [
+        ("load_inventory_rows", _uncached(lambda: queries.load_inventory_rows(hh)), 3),
+        ("load_data", _uncached(lambda: queries.load_data(hh)), 3),
+        ("load_inventory_page", _uncached(lambda: queries.load_inventory_page(0, 24, None, None, hh)), DEFAULT_REPEAT),
+        ("get_dashboard_metrics", _uncached(lambda: queries.get_dashboard_metrics(hh)), DEFAULT_REPEAT),
+        ("load_catalog_rows", _uncached(catalog.load_catalog_rows), 3),
+        ("load_catalog_data", _uncached(catalog.load_catalog_data), 3),
+        ("load_catalog_page", _uncached(lambda: catalog.load_catalog_page(0, 24)), DEFAULT_REPEAT),
+        ("get_catalog_info (条码)", _uncached(lambda: catalog.get_catalog_info(barcode)), DEFAULT_REPEAT),
+        ("get_catalog_info (药名)", _uncached(lambda: catalog.get_catalog_info("布洛芬缓释胶囊")), DEFAULT_REPEAT),
+        ("get_inventory_str_for_ai", _uncached(lambda: ai_service.get_inventory_str_for_ai("孩子发烧咳嗽怎么办", household_id=hh)), 3),
+        ("screen_medicine (冷)", _uncached(lambda: safety.screen_medicine(barcode, owner, hh)), 3),
+        ("screen_medicine", lambda: safety.screen_medicine(barcode, owner, hh), DEFAULT_REPEAT),
+        ("screen_household", _uncached(lambda: safety.screen_household(hh, ai_service.AI_CONFLICT_LIMIT)), 3),
+        ("search_catalog (短词)", lambda: search.search_catalog("感冒"), DEFAULT_REPEAT),
+        ("search_catalog (全文)", lambda: search.search_catalog("布洛芬缓释"), DEFAULT_REPEAT),
+        ("search_inventory", lambda: search.search_inventory("退烧", household_id=hh), DEFAULT_REPEAT),
+        ("load_inventory_page (搜索+归属人)",
+         _uncached(lambda: queries.load_inventory_page(0, 24, "咳嗽", owner, hh)), DEFAULT_REPEAT),
+        ("catalog_tag_facets (标签)", _uncached(tags.catalog_tag_facets), DEFAULT_REPEAT),
+        ("inventory_tag_facets (标签)", _uncached(lambda: tags.inventory_tag_facets(hh)), DEFAULT_REPEAT),
+        ("load_catalog_page (标签×2)",
+         _uncached(lambda: catalog.load_catalog_page(0, 24, None, ("感冒", "儿童"))), DEFAULT_REPEAT),
+        ("load_inventory_page (标签×2)",
+         _uncached(lambda: queries.load_inventory_page(0, 24, None, None, hh, ("感冒", "儿童"))), DEFAULT_REPEAT),
+        ("load_inventory_page (搜索+标签)",
+         _uncached(lambda: queries.load_inventory_page(0, 24, "布洛芬", None, hh, ("发烧",))), DEFAULT_REPEAT),
+        ("export_seed_data", database.export_seed_data, 3),
+    ] + _sync_cases()
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"best_ms": round(min(samples), 3), "median_ms": round(statistics.median(samples), 3)}
+
+def run_size(n_catalog, only=None):
+    """在独立的临时数据库上生成 n_catalog 规模的数据并逐项计时，返回 {名称: 结果}"""
+    tmp_dir = tempfile.mkdtemp(prefix="homemeds_bench_")
+    # 种子文件与导出文件都指向临时目录，不碰 data/ 下的真实文件
+    database.SEED_FILE = os.path.join(tmp_dir, "catalog_seed.jsonl")
+    database.LEGACY_SEED_FILE = os.path.join(tmp_dir, "catalog_seed.json")
+    database.set_db_path(os.path.join(tmp_dir, "bench.db"))
+    database.init_db()
+
+    results = {}
+    write_seed_file(database.SEED_FILE, n_catalog)
+    if not only or only in "import_seed_data":
+        with database.borrow_connection() as conn:
+            conn.execute("DELETE FROM medicine_catalog")
+            conn.commit()
+            start = time.perf_counter()
+            database.import_seed_data(conn, force=True)
+            results["import_seed_data (全新)"] = {"best_ms": round((time.perf_counter() - start) * 1000, 3)}
+            results["import_seed_data (无变化)"] = measure(lambda: database.import_seed_data(conn, force=True), 3)
+
+    with database.borrow_connection() as conn:
+        members = populate(conn, n_catalog, int(n_catalog * INVENTORY_RATIO))
+    for name, func, repeat in build_cases(n_catalog, members):
+        if only and only not in name: continue
+        func()  # 预热 (建立连接、编译语句)
+        results[name] = measure(func, repeat)
+    return results
+
+def compare(current, baseline, threshold):
+    """打印与基线的对比，返回变慢超过阈值的项目 [(规模, 名称, 比值)]"""
+    regressions = []
+    print(f"\n{'规模':>8} | {'项目':<36} | {'基线 (ms)':>10} | {'当前 (ms)':>10} | {'变化':>8}")
+    print("-" * 86)
+    for size, items in current.items():
+        for name, result in items.items():
+            base = baseline.get(size, {}).get(name)
+            if not base: continue
+            ratio = result["best_ms"] / base["best_ms"] if base["best_ms"] else 1.0
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = " ⚠️"
+                regressions.append((size, name, ratio))
+            elif ratio < 1 - threshold:
+                flag = " 🚀"
+            print(f"{size:>8} | {name:<36} | {base['best_ms']:>10.2f} | {result['best_ms']:>10.2f} | "
+                  f"{(ratio - 1) * 100:>+7.1f}%{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="服务层热点路径基准")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES), help="药库规模，逗号分隔")
+    parser.add_argument("--only", help="只运行名称包含该字符串的项目")
+    parser.add_argument("--save", help="把结果保存为 JSON (作为之后对比的基线)")
+    parser.add_argument("--baseline", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="判定变慢的比例")
+    args = parser.parse_args(argv)
+
+    current = {}
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"\n📦 药库 {size} 条 / 库存 {int(size * INVENTORY_RATIO)} 条")
+        current[str(size)] = results = run_size(size, args.only)
+        for name, result in results.items():
+            median = f"{result['median_ms']:>10.2f}" if "median_ms" in result else f"{'-':>10}"
+            print(f"  {name:<36} best {result['best_ms']:>10.2f} ms | median {median} ms")
+
+    if args.save:
+        folder = os.path.dirname(args.save)
+        if folder: os.makedirs(folder, exist_ok=True)
+        meta = {"created_at": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version, "platform": platform.platform()}
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": current}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已保存: {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n📊 基线: {args.baseline} ({baseline['meta'].get('created_at', '?')})")
+        regressions = compare(current, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} 项变慢超过 {args.threshold:.0%}")
+            return 1
+        print("\n✅ 没有明显变慢的项目")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# benchmarks/datagen.py
+"""
+合成测试数据：带真实感中文药名/厂商/标签的药库、家庭成员、库存
+同一个 seed 生成的数据完全相同，基准结果可以前后对比
+用法 (项目根目录):
+  python -m benchmarks.datagen --db /tmp/synthetic.db --catalog 10000 --inventory 5000
+  python -m benchmarks.datagen --seed-file /tmp/catalog_seed.jsonl --catalog 100000
+"""
+import json
+import random
+import argparse
+from datetime import date, timedelta
+
+from src import database
+from src.services.alerts import refresh_expiry_buckets
+
+# 药名 = 前缀 + 通用名 + 剂型 (如 “小儿布洛芬混悬液”)
+_PREFIXES = ("", "", "", "", "复方", "小儿", "盐酸")
+_GENERICS = (
+    "阿莫西林", "布洛芬", "对乙酰氨基酚", "头孢克洛", "头孢克肟", "氯雷他定", "西替利嗪", "蒙脱石", "奥美拉唑",
+    "连花清瘟", "板蓝根", "感冒灵", "双黄连", "藿香正气", "银黄", "氨溴索", "右美沙芬", "甘草", "阿奇霉素",
+    "罗红霉素", "莫匹罗星", "红霉素", "炉甘石", "硝苯地平", "二甲双胍", "阿司匹林", "益生菌", "葡萄糖酸钙",
+    "蒲地蓝", "金银花", "枸橼酸", "多潘立酮", "铝碳酸镁", "健胃消食", "开塞露", "云南白药", "创可贴",
+)
+_FORMS = (("片", "片剂", "片"), ("胶囊", "胶囊", "粒"), ("颗粒", "颗粒剂", "袋"), ("口服液", "口服液", "支"),
+          ("混悬液", "混悬液", "ml"), ("软膏", "软膏剂", "g"), ("缓释胶囊", "胶囊", "粒"), ("分散片", "片剂", "片"),
+          ("滴剂", "滴剂", "ml"), ("喷雾剂", "喷雾剂", "瓶"))
+_MAKERS = ("华北制药", "哈药集团", "扬子江药业", "石药集团", "白云山制药", "修正药业", "同仁堂", "云南白药集团",
+           "上海医药", "太极集团", "以岭药业", "葵花药业", "仁和药业", "三九医药", "东阿阿胶", "强生制药")
+_SYMPTOMS = ("感冒", "发烧", "退烧", "咳嗽", "止咳", "化痰", "咽痛", "腹泻", "便秘", "胃痛", "消化不良", "过敏",
+             "鼻炎", "湿疹", "皮炎", "外伤", "消炎", "抗病毒", "抗生素", "头痛", "止痛", "高血压", "降糖",
+             "补钙", "儿童", "中成药", "清热解毒", "肺炎", "支气管炎", "中耳炎")
+_MEMBERS = ("爸爸", "妈妈", "爷爷", "奶奶", "外公", "外婆", "宝宝", "哥哥", "姐姐", "公用")
+
+def generate_catalog(n, seed=0):
+    """产出 n 条药库条目 (dict，字段同种子文件)，条码唯一且按顺序递增"""
+    rng = random.Random(seed)
+    for i in range(n):
+        suffix, form, unit = rng.choice(_FORMS)
+        name = f"{rng.choice(_PREFIXES)}{rng.choice(_GENERICS)}{suffix}"
+        tags = rng.sample(_SYMPTOMS, rng.randint(1, 4))
+        yield {
+            "barcode": f"69{i:011d}",
+            "name": name,
+            "manufacturer": f"{rng.choice(_MAKERS)}{'有限公司' if rng.random() < 0.7 else '股份有限公司'}",
+            "spec": f"{rng.choice((0.1, 0.125, 0.25, 0.5, 1, 10, 100))}{rng.choice(('g', 'mg', 'ml'))}"
+                    f"*{rng.choice((6, 10, 12, 24, 36))}{unit}",
+            "form": form,
+            "unit": unit,
+            "tags": " ".join(tags),
+            "indications": f"用于{'、'.join(tags)}等症状的缓解。" * rng.randint(1, 3),
+            "std_usage": f"口服。成人一次{rng.randint(1, 3)}{unit}，一日{rng.randint(1, 3)}次。",
+            "adverse_reactions": rng.choice(("偶见恶心、皮疹。", "尚不明确。", "可见头晕、乏力等。")),
+            "contraindications": rng.choice(("对本品过敏者禁用。", "孕妇禁用。", "", "严重肝肾功能不全者禁用。")),
+            "precautions": "用药期间忌烟酒及辛辣食物。",
+            "pregnancy_lactation_use": rng.choice(("孕妇及哺乳期妇女慎用。", "尚不明确。", "")),
+            "child_use": rng.choice(("儿童用量请咨询医师。", "儿童必须在成人监护下使用。", "")),
+            "elderly_use": rng.choice(("老年患者酌情减量。", "")),
+        }
+
+def write_seed_file(path, n, seed=0):
+    """写出 n 条的 JSON Lines 种子文件 (与 export_seed_data 格式相同)"""
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for item in generate_catalog(n, seed):
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    return path
+
+def populate(conn, n_catalog, n_inventory, n_members=6, household_id=database.DEFAULT_HOUSEHOLD_ID,
+             standard_ratio=0.5, seed=0):
+    """
+    向已初始化的数据库写入合成数据 (先清空药库与库存)，返回成员名单
+    库存的过期日期分布在过去一年到未来两年，条码偏向少数常用药 (更接近真实家庭)
+    """
+    rng = random.Random(seed)
+    cols = database.SEED_COLUMNS
+    conn.execute("DELETE FROM expiry_buckets")
+    conn.execute("DELETE FROM inventory")
+    conn.execute("DELETE FROM medicine_catalog")
+    conn.executemany(
+        f"INSERT INTO medicine_catalog ({', '.join(cols)}, is_standard) VALUES ({', '.join('?' * len(cols))}, ?)",
+        (tuple(item[c] for c in cols) + (1 if rng.random() < standard_ratio else 0,)
+         for item in generate_catalog(n_catalog, seed)))
+    database.sync_catalog_tags(conn)
+
+    members = list(_MEMBERS[:n_members])
+    conn.executemany("INSERT OR IGNORE INTO family_members (household_id, name) VALUES (?, ?)",
+                     ((household_id, m) for m in members))
+
+    today = date.today()
+    hot = max(1, n_catalog // 10)
+    conn.executemany(
+        "INSERT INTO inventory (household_id, barcode, expiry_date, quantity_val, owner, my_dosage) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        ((household_id,
+          f"69{(rng.randrange(hot) if rng.random() < 0.8 else rng.randrange(n_catalog)):011d}",
+          (today + timedelta(days=rng.randint(-365, 730))).isoformat(),
+          rng.choice((0.5, 1, 2, 6, 10, 12, 24, 100)), rng.choice(members), rng.choice(("", "一次1片", "遵医嘱")))
+         for _ in range(n_inventory)))
+    refresh_expiry_buckets(conn, today.isoformat(), household_id)
+    conn.commit()
+    database.bump_catalog_version()
+    return members
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成家庭药箱合成测试数据")
+    parser.add_argument("--db", help="写入的 SQLite 文件 (不存在时自动建表)")
+    parser.add_argument("--seed-file", help="另外写出一份 JSON Lines 种子文件")
+    parser.add_argument("--catalog", type=int, default=10_000, help="药库条目数")
+    parser.add_argument("--inventory", type=int, default=5_000, help="库存条目数")
+    parser.add_argument("--members", type=int, default=6, help="家庭成员数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+    if not args.db and not args.seed_file:
+        parser.error("请指定 --db 或 --seed-file")
+
+    if args.seed_file:
+        write_seed_file(args.seed_file, args.catalog, args.seed)
+        print(f"🌱 已写出 {args.catalog} 条种子数据: {args.seed_file}")
+    if args.db:
+        database.set_db_path(args.db)
+        database.init_db()
+        with database.borrow_connection() as conn:
+            populate(conn, args.catalog, args.inventory, args.members, seed=args.seed)
+        print(f"✅ 已生成 药库 {args.catalog} / 库存 {args.inventory} / 成员 {args.members}: {args.db}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
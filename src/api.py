@@ -0,0 +1,428 @@
+# src/api.py
+"""
+无界面的 REST/JSON API (ASGI)，直接复用 services 层，不依赖 Streamlit
+启动: uvicorn src.api:app --host 127.0.0.1 --port 8000 --workers 4
+- 默认只监听本机；写接口 (POST/PUT/PATCH/DELETE) 与 /api/sync* 需要请求头 Authorization: Bearer <令牌>，
+  令牌由环境变量 HOMEMEDS_API_TOKEN 配置，未配置时这些接口一律拒绝 (只读接口不受影响)
+- 列表接口分页: ?page=0&page_size=50 (page 从 0 开始)，返回 {items, page, page_size, total}
+- 列表接口带 ETag，客户端回传 If-None-Match 且内容未变时返回 304
+- 请求头 Accept: application/x-ndjson 时不分页，逐行流式输出全部结果 (JSON Lines)
+- 药库/库存列表可按标签筛选: ?tag=感冒&tag=儿童 (同时具有)；/api/tags 与 .../tags 返回各标签的数量
+- .../screen?barcode=&owner=&population=child 用药安全筛查 (本地规则)；不带 barcode 时返回成员现有药品间的冲突
+- /api/sync/changes 实例之间的增量同步: GET ?since=游标 拉取之后的变化，POST {"changes": [...]} 推送 (见 services.sync)
+服务函数是同步的 (SQLite/psycopg)，统一放到线程池里执行，不阻塞事件循环。
+GET /metrics 输出本进程的性能指标 (Prometheus 文本格式，多 worker 时每个进程各自统计)
+"""
+import os
+import hmac
+import json
+import math
+import hashlib
+import functools
+from datetime import date
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from src.database import ensure_db_ready
+from src.metrics import render_prometheus
+from src.services.catalog import (get_catalog_info, lookup_barcode, upsert_catalog_item, delete_catalog_item,
+                                  load_catalog_page, iter_catalog_rows)
+from src.services.inventory import add_inventory_item, update_quantity, decrease_quantity, delete_medicine
+from src.services.members import get_all_members, add_member, delete_member, get_all_households, add_household
+from src.services.queries import load_inventory_page, iter_inventory_rows, get_dashboard_metrics
+from src.services.tags import normalize_tags, catalog_tag_facets, inventory_tag_facets
+from src.services.safety import screen_medicine, screen_household, POPULATIONS
+from src.services.sync import sync_info, read_changes, apply_remote_changes, SYNC_BATCH, MAX_SYNC_BATCH
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+NDJSON = "application/x-ndjson"
+API_TOKEN_ENV = "HOMEMEDS_API_TOKEN"
+
+# 药库条目可写字段 (顺序与 upsert_catalog_item 的参数一致，barcode 取自路径)
+CATALOG_FIELDS = (
+    "name", "manufacturer", "spec", "form", "unit", "tags",
+    "indications", "std_usage", "adverse_reactions",
+    "contraindications", "precautions",
+    "pregnancy_lactation_use", "child_use", "elderly_use",
+)
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+# --- 序列化与通用响应 ---
+
+def _dumps(payload):
+    # default=str: PostgreSQL 返回的 date/datetime 直接转成 ISO 字符串
+    return json.dumps(payload, ensure_ascii=False, default=str)
+
+def _json(payload, status=200):
+    return Response(_dumps(payload), status_code=status, media_type="application/json")
+
+def _cached_json(request, payload):
+    """
+    带 ETag 的 JSON 响应：ETag 取响应体的哈希，不依赖进程内状态，
+    所以负载均衡到任意实例都能得到一致的 304
+    """
+    body = _dumps(payload).encode("utf-8")
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def _ndjson(rows):
+    """把同步的行生成器包装成流式 JSON Lines 响应 (每次在线程池里取下一行)"""
+    async def body():
+        try:
+            async for row in iterate_in_threadpool(rows):
+                yield _dumps(row) + "\n"
+        finally:
+            rows.close()  # 客户端中途断开时也及时归还连接
+    return StreamingResponse(body(), media_type=NDJSON)
+
+def _wants_ndjson(request):
+    return NDJSON in request.headers.get("accept", "")
+
+def _int_param(request, name, default, minimum=0, maximum=None):
+    raw = request.query_params.get(name)
+    if raw in (None, ""): return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ApiError(400, f"参数 {name} 必须是整数")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ApiError(400, f"参数 {name} 超出范围")
+    return value
+
+def _paging(request):
+    return (_int_param(request, "page", 0),
+            _int_param(request, "page_size", DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE))
+
+def _tags(request):
+    """?tag=a&tag=b 或 ?tag=a,b -> 标签元组"""
+    return normalize_tags(request.query_params.getlist("tag"))
+
+def _facets_payload(facets, tags):
+    return {"items": [{"tag": name, "count": n} for name, n in facets], "selected": list(tags)}
+
+async def _body(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        raise ApiError(400, "请求体必须是 JSON")
+    if not isinstance(data, dict):
+        raise ApiError(400, "请求体必须是 JSON 对象")
+    return data
+
+def _require(data, *names):
+    missing = [n for n in names if data.get(n) in (None, "")]
+    if missing:
+        raise ApiError(400, f"缺少字段: {', '.join(missing)}")
+
+def _number(data, name, minimum=None, positive=False):
+    """数字字段 (拒绝布尔值、NaN/无穷)；minimum 为下限，positive 要求大于 0"""
+    _require(data, name)
+    value = data[name]
+    try:
+        if isinstance(value, bool): raise TypeError
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{name} 必须是数字")
+    if not math.isfinite(value):
+        raise ApiError(400, f"{name} 必须是数字")
+    if positive and value <= 0:
+        raise ApiError(400, f"{name} 必须大于 0")
+    if minimum is not None and value < minimum:
+        raise ApiError(400, f"{name} 不能小于 {minimum:g}")
+    return value
+
+def _text(data, name, default=None):
+    """字符串字段，去掉首尾空白；default 为 None 时必填 (不能为空)"""
+    value = data.get(name)
+    if value is None and default is not None:
+        return default
+    if not isinstance(value, str):
+        raise ApiError(400, f"缺少字段: {name}" if value is None else f"{name} 必须是字符串")
+    value = value.strip()
+    if not value:
+        if default is not None: return default
+        raise ApiError(400, f"缺少字段: {name}")
+    return value
+
+def _iso_date(data, name):
+    """YYYY-MM-DD 日期，统一成 ISO 格式再入库 (看板等查询按字符串比较日期)"""
+    value = _text(data, name)
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ApiError(400, f"{name} 必须是 YYYY-MM-DD 格式的日期")
+
+def _authorize(request):
+    token = os.environ.get(API_TOKEN_ENV, "")
+    if not token:
+        raise ApiError(403, f"服务端未配置 {API_TOKEN_ENV}，写接口与同步接口已禁用")
+    scheme, _, given = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(given.strip().encode(), token.encode()):
+        raise ApiError(401, "缺少或错误的访问令牌")
+
+def _protected(handler):
+    """需要访问令牌的接口 (写入与实例同步)"""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        _authorize(request)
+        return await handler(request)
+    return wrapper
+
+async def _ensure_household(household_id):
+    households = dict(await run_in_threadpool(get_all_households))
+    if household_id not in households:
+        raise ApiError(404, "家庭不存在")
+
+# --- 公共药库 ---
+
+async def list_catalog(request):
+    tags = _tags(request)
+    if _wants_ndjson(request):
+        return _ndjson(iter_catalog_rows(tags=tags))
+    page, page_size = _paging(request)
+    search = request.query_params.get("q") or None
+    rows, total = await run_in_threadpool(load_catalog_page, page, page_size, search, tags)
+    return _cached_json(request, {"items": [r.to_dict() for r in rows], "page": page, "page_size": page_size,
+                                  "total": total})
+
+async def get_catalog(request):
+    """条码精确匹配优先，否则返回搜索排名第一的条目"""
+    info = await run_in_threadpool(get_catalog_info, request.path_params["query"])
+    if info is None:
+        raise ApiError(404, "药库中没有找到该药品")
+    return _cached_json(request, info)
+
+async def put_catalog(request):
+    """新建或修改药库条目；是否为标准库条目只能由种子数据决定，修改时保持原值"""
+    data = await _body(request)
+    if "is_standard" in data:
+        raise ApiError(400, "is_standard 不能通过接口设置")
+    fields = [_text(data, f, default=None if f == "name" else "") for f in CATALOG_FIELDS]
+    barcode = request.path_params["barcode"]
+    existing = await run_in_threadpool(lookup_barcode, barcode)
+    ok = await run_in_threadpool(upsert_catalog_item, barcode, *fields,
+                                 is_standard=existing["is_standard"] if existing else 0)
+    if not ok:
+        raise ApiError(500, "更新失败")
+    return _json(await run_in_threadpool(lookup_barcode, request.path_params["barcode"]))
+
+async def remove_catalog(request):
+    if not await run_in_threadpool(delete_catalog_item, request.path_params["barcode"]):
+        raise ApiError(409, "删除失败 (可能仍有库存引用该药品)")
+    return Response(status_code=204)
+
+async def list_catalog_tags(request):
+    """药库标签分面：各标签的条目数 (带 tag 参数时为已选标签范围内的数量)"""
+    tags = _tags(request)
+    limit = _int_param(request, "limit", None, minimum=1)
+    facets = await run_in_threadpool(catalog_tag_facets, tags, limit)
+    return _cached_json(request, _facets_payload(facets, tags))
+
+# --- 家庭与成员 ---
+
+async def list_households(request):
+    rows = await run_in_threadpool(get_all_households)
+    return _cached_json(request, {"items": [{"id": i, "name": n} for i, n in rows]})
+
+async def create_household(request):
+    name = _text(await _body(request), "name")
+    ok, res = await run_in_threadpool(add_household, name)
+    if not ok:
+        raise ApiError(409 if res == "该家庭已存在" else 400, res)
+    return _json({"id": res, "name": name}, status=201)
+
+async def list_members(request):
+    household_id = request.path_params["household_id"]
+    await _ensure_household(household_id)
+    return _cached_json(request, {"items": await run_in_threadpool(get_all_members, household_id)})
+
+async def create_member(request):
+    household_id = request.path_params["household_id"]
+    await _ensure_household(household_id)
+    name = _text(await _body(request), "name")
+    ok, msg = await run_in_threadpool(add_member, name, household_id)
+    if not ok:
+        raise ApiError(409 if msg == "该成员已存在" else 400, msg)
+    return _json({"name": name}, status=201)
+
+async def remove_member(request):
+    ok = await run_in_threadpool(delete_member, request.path_params["name"], request.path_params["household_id"])
+    if not ok:
+        raise ApiError(500, "删除失败")
+    return Response(status_code=204)
+
+# --- 库存 ---
+
+async def list_inventory(request):
+    household_id = request.path_params["household_id"]
+    owner = request.query_params.get("owner") or None
+    tags = _tags(request)
+    if _wants_ndjson(request):
+        return _ndjson(iter_inventory_rows(household_id, owner=owner, tags=tags))
+    page, page_size = _paging(request)
+    search = request.query_params.get("q") or None
+    rows, total = await run_in_threadpool(load_inventory_page, page, page_size, search, owner, household_id, tags)
+    return _cached_json(request, {"items": [r.to_dict() for r in rows], "page": page, "page_size": page_size,
+                                  "total": total})
+
+async def list_inventory_tags(request):
+    """库存标签分面，可配合 owner / tag 参数缩小范围"""
+    household_id = request.path_params["household_id"]
+    tags = _tags(request)
+    owner = request.query_params.get("owner") or None
+    limit = _int_param(request, "limit", None, minimum=1)
+    facets = await run_in_threadpool(inventory_tag_facets, household_id, tags, owner, limit)
+    return _cached_json(request, _facets_payload(facets, tags))
+
+async def create_inventory(request):
+    household_id = request.path_params["household_id"]
+    await _ensure_household(household_id)
+    data = await _body(request)
+    barcode = _text(data, "barcode")
+    expiry_date = _iso_date(data, "expiry_date")
+    quantity = _number(data, "quantity_val", minimum=0)
+    owner = _text(data, "owner", default="公用")
+    my_dosage = _text(data, "my_dosage", default="")
+    ok = await run_in_threadpool(add_inventory_item, barcode, expiry_date, quantity, owner, my_dosage, household_id)
+    if not ok:
+        raise ApiError(409, "入库失败 (条码不存在于公共药库?)")
+    return _json({"ok": True}, status=201)
+
+async def patch_inventory(request):
+    quantity = _number(await _body(request), "quantity_val", minimum=0)
+    ok = await run_in_threadpool(update_quantity, request.path_params["med_id"], quantity,
+                                 request.path_params["household_id"])
+    if not ok:
+        raise ApiError(404, "找不到记录")
+    return _json({"id": request.path_params["med_id"], "quantity_val": quantity})
+
+async def consume_inventory(request):
+    """服药打卡：原子扣减，返回剩余数量"""
+    amount = _number(await _body(request), "amount", positive=True)
+    ok, res = await run_in_threadpool(decrease_quantity, request.path_params["med_id"], amount,
+                                      request.path_params["household_id"])
+    if not ok:
+        raise ApiError(404 if res == "找不到记录" else 500, res)
+    return _json({"id": request.path_params["med_id"], "quantity_val": res})
+
+async def remove_inventory(request):
+    ok = await run_in_threadpool(delete_medicine, request.path_params["med_id"], request.path_params["household_id"])
+    if not ok:
+        raise ApiError(500, "删除失败")
+    return Response(status_code=204)
+
+async def screen(request):
+    """
+    用药安全筛查：?barcode=拟用药&owner=成员 (不填则逐个成员检查)
+    &population=child&population=pregnancy 指定特殊人群，不传时按成员名推断
+    不带 barcode 时返回成员现有药品之间的冲突，最多 limit 条
+    """
+    household_id = request.path_params["household_id"]
+    barcode = request.query_params.get("barcode") or None
+    owner = request.query_params.get("owner") or None
+    populations = request.query_params.getlist("population")
+    unknown = [p for p in populations if p not in POPULATIONS]
+    if unknown:
+        raise ApiError(400, f"未知的人群: {', '.join(unknown)} (可选: {', '.join(POPULATIONS)})")
+    if not barcode:
+        limit = _int_param(request, "limit", DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+        warnings = await run_in_threadpool(screen_household, household_id, limit)
+    else:
+        warnings = await run_in_threadpool(screen_medicine, barcode, owner, household_id, tuple(populations) or None)
+        if warnings is None:
+            raise ApiError(404, "药库中没有该条码")
+    return _cached_json(request, {"barcode": barcode, "owner": owner, "warnings": warnings})
+
+# --- 实例同步 ---
+
+async def get_sync_info(request):
+    return _json(await run_in_threadpool(sync_info))
+
+async def pull_changes(request):
+    """?since=游标&household_id=&exclude_origin=对方实例 id&limit=，返回 {origin, cursor, more, changes}"""
+    since = _int_param(request, "since", 0)
+    household_id = _int_param(request, "household_id", None, minimum=1)
+    limit = _int_param(request, "limit", SYNC_BATCH, minimum=1, maximum=MAX_SYNC_BATCH)
+    exclude_origin = request.query_params.get("exclude_origin") or None
+    return _json(await run_in_threadpool(read_changes, since, exclude_origin, household_id, limit))
+
+async def push_changes(request):
+    """{"changes": [...], "household_id": 写入哪个家庭 (可选)}，返回应用统计"""
+    data = await _body(request)
+    changes = data.get("changes")
+    if not isinstance(changes, list) or not all(isinstance(c, dict) for c in changes):
+        raise ApiError(400, "changes 必须是对象数组")
+    household_id = data.get("household_id")
+    if household_id is not None:
+        if not isinstance(household_id, int):
+            raise ApiError(400, "household_id 必须是整数")
+        await _ensure_household(household_id)
+    try:
+        stats = await run_in_threadpool(apply_remote_changes, changes, household_id)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return _json(stats)
+
+async def metrics(request):
+    total, expired, soon = await run_in_threadpool(get_dashboard_metrics, request.path_params["household_id"])
+    return _cached_json(request, {"total": total, "expired": expired, "expiring_soon": soon})
+
+async def health(request):
+    return _json({"status": "ok"})
+
+async def prometheus_metrics(request):
+    return Response(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# --- 应用 ---
+
+async def api_error(request, exc):
+    return JSONResponse({"error": exc.message}, status_code=exc.status)
+
+@asynccontextmanager
+async def lifespan(app):
+    # 每个 worker 启动时确认表结构 (幂等)；多实例部署建议先单独执行一次 python src/database.py
+    await run_in_threadpool(ensure_db_ready)
+    yield
+
+HH = "/api/households/{household_id:int}"
+
+routes = [
+    Route("/api/health", health),
+    Route("/metrics", prometheus_metrics),
+    Route("/api/catalog", list_catalog),
+    Route("/api/tags", list_catalog_tags),
+    Route("/api/catalog/{query}", get_catalog, methods=["GET"]),
+    Route("/api/catalog/{barcode}", _protected(put_catalog), methods=["PUT"]),
+    Route("/api/catalog/{barcode}", _protected(remove_catalog), methods=["DELETE"]),
+    Route("/api/households", list_households, methods=["GET"]),
+    Route("/api/households", _protected(create_household), methods=["POST"]),
+    Route(HH + "/members", list_members, methods=["GET"]),
+    Route(HH + "/members", _protected(create_member), methods=["POST"]),
+    Route(HH + "/members/{name}", _protected(remove_member), methods=["DELETE"]),
+    Route(HH + "/inventory", list_inventory, methods=["GET"]),
+    Route(HH + "/tags", list_inventory_tags),
+    Route(HH + "/inventory", _protected(create_inventory), methods=["POST"]),
+    Route(HH + "/inventory/{med_id:int}", _protected(patch_inventory), methods=["PATCH"]),
+    Route(HH + "/inventory/{med_id:int}", _protected(remove_inventory), methods=["DELETE"]),
+    Route(HH + "/inventory/{med_id:int}/consume", _protected(consume_inventory), methods=["POST"]),
+    Route(HH + "/screen", screen),
+    Route(HH + "/metrics", metrics),
+    Route("/api/sync", _protected(get_sync_info)),
+    Route("/api/sync/changes", _protected(pull_changes), methods=["GET"]),
+    Route("/api/sync/changes", _protected(push_changes), methods=["POST"]),
+]
+
+app = Starlette(routes=routes, exception_handlers={ApiError: api_error}, lifespan=lifespan)
@@ -1,116 +1,505 @@
 # src/database.py
 import sqlite3
 import os
+import re
 import sys
 import json
+import queue
+import time
+import atexit
+import threading
+import hashlib
+import uuid
+from datetime import datetime, timezone
+from contextlib import contextmanager
 
 # --- 1. 路径配置 ---
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if __name__ == "__main__" and PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)  # 以脚本方式运行时也能导入 src.database_pg
+from src import metrics
 DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 DB_PATH = os.path.join(DATA_DIR, "medicines.db")
-SEED_FILE = os.path.join(DATA_DIR, "catalog_seed.json")
+SEED_FILE = os.path.join(DATA_DIR, "catalog_seed.jsonl")          # JSON Lines，按条码排序
+LEGACY_SEED_FILE = os.path.join(DATA_DIR, "catalog_seed.json")    # 旧版整体 JSON 数组 (只读兼容)
+
+# 多家庭：未指定家庭时使用的默认家庭，以及新家庭的默认成员
+DEFAULT_HOUSEHOLD_ID = 1
+DEFAULT_MEMBERS = ("公用", "爸爸", "妈妈", "宝宝", "老人")
 
 # --- 2. 基础连接 ---
 
-def get_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON;")
+# 连接调优参数：WAL 允许读写并发，NORMAL 在 WAL 下足够安全且少一次 fsync
+PRAGMAS = (
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA cache_size = -16000;",      # 约 16MB 页缓存
+    "PRAGMA mmap_size = 134217728;",    # 128MB 内存映射
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA busy_timeout = 5000;",      # 写锁冲突时最多等待 5 秒
+    "PRAGMA recursive_triggers = ON;",  # 让 INSERT OR REPLACE 的隐式删除也触发同步触发器
+)
+
+class _TimedCursor(sqlite3.Cursor):
+    """
+    记录每条语句的执行耗时与行数 (查询为取回的行数，写入为影响的行数)
+    sqlite3 的 execute 只执行到第一行，整表读取的耗时体现在调用它的服务函数上
+    """
+    _sql = None
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._sql = sql
+            metrics.observe_sql(sql, time.perf_counter() - start, super().rowcount)
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            self._sql = sql
+            metrics.observe_sql(sql, time.perf_counter() - start, super().rowcount)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None: metrics.add_sql_rows(self._sql, 1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        metrics.add_sql_rows(self._sql, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        metrics.add_sql_rows(self._sql, len(rows))
+        return rows
+
+    def __iter__(self):
+        # 逐行迭代时批量取行再计数，避免每行都加锁
+        while True:
+            rows = self.fetchmany(256)
+            if not rows: return
+            yield from rows
+
+class _TimedConnection(sqlite3.Connection):
+    # Connection.execute 不会走子类的 cursor()，这里显式转给计时游标
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+def _open_connection(db_path):
+    """新建一个已调优的连接 (WAL + PRAGMA)；开启性能埋点时使用计时连接"""
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0,
+                           factory=_TimedConnection if metrics.ENABLED else sqlite3.Connection)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL;")
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+class ConnectionPool:
+    """
+    线程安全的 SQLite 长连接池
+    Streamlit 每个会话/每次重跑都在不同线程里执行，按线程缓存连接会不断泄漏，
+    所以这里用一个共享的空闲队列：借出 -> 使用 -> 归还，连接本身长期复用。
+    """
+
+    def __init__(self, db_path, max_idle=8):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._all = set()
+        self._closed = False
+
+    def acquire(self):
+        """借出一个连接 (没有空闲就新建)"""
+        with metrics.timer("sqlite", kind="pool"):
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            conn = _open_connection(self.db_path)
+            with self._lock:
+                if self._closed:
+                    conn.close()
+                    raise RuntimeError("连接池已关闭")
+                self._all.add(conn)
+            return conn
+
+    def release(self, conn):
+        """归还连接：回滚残留事务，超出空闲上限则直接关闭"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            keep = not self._closed and self._idle.qsize() < self.max_idle
+            if not keep:
+                self._all.discard(conn)
+        if keep:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ... 用完自动归还"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """关闭所有连接 (进程退出或切换数据库时调用)"""
+        with self._lock:
+            self._closed = True
+            conns, self._all = self._all, set()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass  # 其他线程仍在使用中，忽略
+
+class SQLiteBackend:
+    """默认后端：本地 SQLite 文件 + 上面的长连接池"""
+    name = "sqlite"
+    supports_fts = True
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+
+    def connection(self):
+        return self.pool.connection()
+
+    @contextmanager
+    def write_transaction(self):
+        # IMMEDIATE 一开始就拿写锁，避免多个会话从读锁升级写锁时互相等待
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def change_token(self):
+        """数据库文件和 WAL 的修改时间/大小：任何进程提交写入后都会变化 (只是一次 stat，开销很小)"""
+        token = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                st = os.stat(path)
+                token.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                token.append(None)
+        return tuple(token)
+
+    def close(self):
+        self.pool.close_all()
+
+# --- 存储后端选择 ---
+# 默认使用 data/medicines.db；设置 HOMEMEDS_DATABASE_URL=postgresql://... 时改用 PostgreSQL
+# (见 src/database_pg.py)。服务层只通过 borrow_connection / write_transaction 访问数据库。
+DATABASE_URL_ENV = "HOMEMEDS_DATABASE_URL"
+
+def create_backend(url=None):
+    """按连接串创建后端：空 -> 默认 SQLite 文件；sqlite:///路径；postgresql://..."""
+    if not url:
+        return SQLiteBackend(DB_PATH)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("postgresql://", "postgres://")):
+        from src.database_pg import PostgresBackend
+        return PostgresBackend(url)
+    raise ValueError(f"不支持的数据库连接串: {url}")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """当前进程使用的存储后端 (首次调用时按环境变量创建)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(os.environ.get(DATABASE_URL_ENV))
+    return _backend
+
+def set_backend(backend):
+    """切换存储后端 (基准测试/同步等场景)，旧后端的连接会被关闭"""
+    global _backend
+    with _backend_lock:
+        old, _backend = _backend, backend
+    if old is not None:
+        old.close()
+    bump_catalog_version()
+
+def get_pool():
+    """当前进程共享的 SQLite 连接池 (仅 SQLite 后端)"""
+    return get_backend().pool
+
+def set_db_path(db_path):
+    """切换数据库文件 (基准测试/同步等场景)，旧连接池会被关闭"""
+    global DB_PATH
+    DB_PATH = db_path
+    set_backend(SQLiteBackend(db_path))
+
+def is_sqlite():
+    return get_backend().name == "sqlite"
+
+def row_lock_clause():
+    """SELECT 加行锁的后缀：SQLite 的写事务本身已独占写锁，PostgreSQL 需要 FOR UPDATE"""
+    return "" if is_sqlite() else " FOR UPDATE"
+
+def borrow_connection():
+    """
+    从连接池借用连接 (服务层统一入口)
+    用法: with borrow_connection() as conn: ...
+    """
+    return get_backend().connection()
+
+@contextmanager
+def write_transaction():
+    """
+    写事务：借连接 -> 开启事务 -> 提交并递增数据版本 (异常时回滚)
+    整批操作只提交一次，也就只有一次 fsync。
+    """
+    with get_backend().write_transaction() as conn:
+        yield conn
+    bump_data_version()
+
+def current_db_path():
+    """当前 SQLite 后端的数据库文件 (HOMEMEDS_DATABASE_URL=sqlite:///路径 或 set_db_path 指定，默认 DB_PATH)"""
+    return get_backend().db_path
+
+def get_connection(db_path=None):
+    """获取一个独立的 SQLite 连接 (调用方负责 close，服务层请使用 borrow_connection)；db_path 默认为当前数据库"""
+    return _open_connection(db_path or current_db_path())
+
+@atexit.register
+def close_pool():
+    """进程退出时干净地关闭所有池化连接"""
+    if _backend is not None:
+        _backend.close()
+
+# --- 数据版本号 (读缓存的失效依据) ---
+# 每个写路径在 commit 之后调用 bump_data_version()，读缓存比较版本号即可判断是否过期。
+# 多进程部署 (API 多 worker / 多实例) 时别的进程的写入不会调用本进程的 bump，
+# 所以读版本号时还会比较后端的 “变更标记”，变了就同样递增版本号。
+
+_data_version = 0
+_change_token = None
+_version_lock = threading.Lock()
+
+def get_data_version():
+    """当前进程内的数据版本号 (已计入其他进程的写入)"""
+    global _data_version, _change_token
+    token = get_backend().change_token()
+    if token != _change_token:
+        with _version_lock:
+            if token != _change_token:
+                _change_token = token
+                _data_version += 1
+    return _data_version
+
+def bump_data_version():
+    """数据发生写入后递增版本号，使所有读缓存失效"""
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+        return _data_version
+
+# 药库单独的版本号：条码快速通道的 LRU 只在药库变化时失效 (库存写入很频繁，不应清掉它)
+_catalog_version = 0
+
+def get_catalog_version():
+    return _catalog_version
+
+def bump_catalog_version():
+    """药库条目增删改后调用 (同时递增数据版本)"""
+    global _catalog_version
+    with _version_lock:
+        _catalog_version += 1
+    return bump_data_version()
+
 # --- 3. 核心功能：初始化与重置 ---
 
 def init_db():
     """初始化数据库表结构，并自动加载种子数据"""
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
+    if not is_sqlite():
+        return _init_server_db()
 
-    conn = get_connection()
-    cursor = conn.cursor()
+    try:
+        open_sqlite_db(current_db_path()).close()
+    except Exception as e:
+        print(f"❌ 初始化失败: {e}")
 
+def open_sqlite_db(db_path):
+    """打开 (必要时创建) 一个 SQLite 数据库文件并完成初始化，返回独立连接 (调用方负责 close)"""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = get_connection(db_path)
     try:
-        print("🏗️ 正在检查数据库表结构 (v0.8 Tags)...")
-
-        # 表1: Catalog (基础库) - 包含 tags 字段
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS medicine_catalog (
-            barcode TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            manufacturer TEXT,
-            spec TEXT,
-            form TEXT,
-            unit TEXT,
-            tags TEXT,                      -- 🆕 v0.8 新增：标签 (如：感冒,消炎)
-            indications TEXT,
-            std_usage TEXT,
-            adverse_reactions TEXT,
-            contraindications TEXT,
-            precautions TEXT,
-            pregnancy_lactation_use TEXT,
-            child_use TEXT,
-            elderly_use TEXT,
-            is_standard BOOLEAN DEFAULT 0,  -- 0=用户私有, 1=官方标准
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """)
+        bootstrap_db(conn)
+    except Exception:
+        conn.close()
+        raise
+    return conn
 
-        # 表2: Inventory (库存库) - 无 location
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS inventory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            barcode TEXT NOT NULL,
-            expiry_date DATE NOT NULL,
-            quantity_val REAL NOT NULL,
-            owner TEXT,
-            my_dosage TEXT,
-            is_opened BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (barcode) REFERENCES medicine_catalog(barcode)
-        );
-        """)
+def bootstrap_db(conn):
+    """在给定的 SQLite 连接上建表 -> 迁移 -> 默认成员 -> 种子数据 (可重复执行)"""
+    cursor = conn.cursor()
+    print("🏗️ 正在检查数据库表结构 (v0.8 Tags)...")
 
-        # 表3: Family Members (家庭成员表) - v0.7 新增
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS family_members (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            is_default BOOLEAN DEFAULT 0
-        );
-        """)
+    # 表1: Catalog (基础库) - 包含 tags 字段
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS medicine_catalog (
+        barcode TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        manufacturer TEXT,
+        spec TEXT,
+        form TEXT,
+        unit TEXT,
+        tags TEXT,                      -- 🆕 v0.8 新增：标签 (如：感冒,消炎)
+        indications TEXT,
+        std_usage TEXT,
+        adverse_reactions TEXT,
+        contraindications TEXT,
+        precautions TEXT,
+        pregnancy_lactation_use TEXT,
+        child_use TEXT,
+        elderly_use TEXT,
+        is_standard BOOLEAN DEFAULT 0,  -- 0=用户私有, 1=官方标准
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+    # 表2: Inventory (库存库) - 无 location
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS inventory (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        barcode TEXT NOT NULL,
+        expiry_date DATE NOT NULL,
+        quantity_val REAL NOT NULL,
+        owner TEXT,
+        my_dosage TEXT,
+        is_opened BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (barcode) REFERENCES medicine_catalog(barcode)
+    );
+    """)
+
+    # 表3: Family Members (家庭成员表) - v0.7 新增
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS family_members (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        is_default BOOLEAN DEFAULT 0
+    );
+    """)
+
+    conn.commit()
+
+    # 在基础表之上执行增量迁移 (索引、新字段等)
+    migrate(conn)
+    print(f"✅ 数据库结构就绪 (schema v{get_schema_version(conn)})。")
 
+    # 初始化默认家庭成员 (如果默认家庭还没有成员)
+    cursor.execute("SELECT count(*) FROM family_members WHERE household_id = ?", (DEFAULT_HOUSEHOLD_ID,))
+    if cursor.fetchone()[0] == 0:
+        print("初始化默认家庭成员...")
+        cursor.executemany("INSERT OR IGNORE INTO family_members (household_id, name) VALUES (?, ?)",
+                           [(DEFAULT_HOUSEHOLD_ID, m) for m in DEFAULT_MEMBERS])
         conn.commit()
-        print(f"✅ 数据库结构就绪。")
-        
-        # 初始化默认家庭成员 (如果表是空的)
-        cursor.execute("SELECT count(*) FROM family_members")
-        if cursor.fetchone()[0] == 0:
-            print("初始化默认家庭成员...")
-            defaults = [("公用",), ("爸爸",), ("妈妈",), ("宝宝",), ("老人",)]
-            cursor.executemany("INSERT OR IGNORE INTO family_members (name) VALUES (?)", defaults)
+
+    # 尝试加载种子数据
+    import_seed_data(conn)
+
+def _init_server_db():
+    """服务器数据库 (PostgreSQL) 的初始化：表结构由 database_pg 的迁移维护，其余与 SQLite 相同"""
+    from src import database_pg
+    with borrow_connection() as conn:
+        try:
+            print(f"🏗️ 正在检查数据库表结构 ({get_backend().name})...")
+            database_pg.migrate(conn)
+            print(f"✅ 数据库结构就绪 (schema v{database_pg.get_schema_version(conn)})。")
+            if conn.execute("SELECT count(*) FROM family_members WHERE household_id = ?",
+                            (DEFAULT_HOUSEHOLD_ID,)).fetchone()[0] == 0:
+                print("初始化默认家庭成员...")
+                conn.executemany("INSERT OR IGNORE INTO family_members (household_id, name) VALUES (?, ?)",
+                                 [(DEFAULT_HOUSEHOLD_ID, m) for m in DEFAULT_MEMBERS])
             conn.commit()
-        
-        # 尝试加载种子数据
-        import_seed_data(conn)
+            import_seed_data(conn)
+        except Exception as e:
+            print(f"❌ 初始化失败: {e}")
 
-    except Exception as e:
-        print(f"❌ 初始化失败: {e}")
-    finally:
-        conn.close()
+# 表结构/种子检查每个进程只需要做一次：Streamlit 每次交互都会重跑 app.py，
+# 这里按当前后端记录是否已初始化 (切换后端后会重新检查)
+_ready_backend = None
+_ready_lock = threading.Lock()
+
+def ensure_db_ready():
+    """init_db 的一次性版本，返回本次是否真正执行了初始化"""
+    global _ready_backend
+    backend = get_backend()
+    if _ready_backend is backend:
+        return False
+    with _ready_lock:
+        if _ready_backend is backend:
+            return False
+        init_db()
+        _ready_backend = backend
+    return True
 
 def reset_db():
     """暴力重置：删表 -> 建表 -> 自动导回数据"""
-    print(f"🔧 正在连接数据库: {DB_PATH}")
+    print(f"🔧 正在连接数据库: {current_db_path() if is_sqlite() else get_backend().name}")
     if input("⚠️ 警告：这将清空所有库存！但会保留 JSON 中的公共库。确认？(y/n): ").lower() != 'y':
         return
 
+    if not is_sqlite():
+        from src import database_pg
+        with borrow_connection() as conn:
+            database_pg.drop_all(conn)
+        print("💥 旧表已清除。")
+        init_db()
+        print("🎉 重置成功！")
+        return
+
     conn = get_connection()
     cursor = conn.cursor()
     try:
+        cursor.execute("DROP TABLE IF EXISTS expiry_alerts;")
+        cursor.execute("DROP TABLE IF EXISTS expiry_buckets;")
+        cursor.execute("DROP TABLE IF EXISTS inventory_ledger;")
+        cursor.execute("DROP TABLE IF EXISTS consumption_daily;")
         cursor.execute("DROP TABLE IF EXISTS inventory;")
+        cursor.execute("DROP TABLE IF EXISTS catalog_tags;")
+        cursor.execute("DROP TABLE IF EXISTS tags;")
         cursor.execute("DROP TABLE IF EXISTS medicine_catalog;")
         cursor.execute("DROP TABLE IF EXISTS family_members;")
+        cursor.execute("DROP TABLE IF EXISTS households;")
+        cursor.execute("DROP TABLE IF EXISTS catalog_fts;")
+        cursor.execute("DROP TABLE IF EXISTS change_log;")
+        cursor.execute("DROP TABLE IF EXISTS sync_context;")
+        cursor.execute("DROP TABLE IF EXISTS app_meta;")
+        # 表已清空，迁移需要从头再跑一遍
+        cursor.execute("PRAGMA user_version = 0;")
         conn.commit()
         print("💥 旧表已清除。")
         conn.close()
@@ -120,79 +509,696 @@ def reset_db():
     except Exception as e:
         print(f"❌ 重置失败: {e}")
 
+# --- 迁移 (Schema Migrations) ---
+# 每条迁移: (版本号, 说明, 步骤列表)。步骤可以是 SQL 字符串，也可以是 func(conn)。
+# 已执行的版本记录在 PRAGMA user_version 中，只会向前执行一次；
+# 步骤本身也要写成幂等的 (IF NOT EXISTS / add_column_if_missing)，方便老库补跑。
+# ⚠️ 已发布的迁移不要修改，新的结构变化请追加新编号。
+
+def add_column_if_missing(conn, table, column, ddl):
+    """幂等地新增字段: ddl 形如 'TEXT DEFAULT NULL'"""
+    cols = {r['name'] for r in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+def _create_catalog_fts(conn):
+    """药库全文索引: FTS5 + trigram 分词 (中文子串可搜)，由触发器与主表保持同步"""
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5(
+            name, manufacturer, tags, indications,
+            content='medicine_catalog', content_rowid='rowid',
+            tokenize='trigram'
+        );
+        """)
+    except sqlite3.OperationalError as e:
+        # 老版本 SQLite (<3.34) 没有 trigram，搜索服务会自动回退为 LIKE
+        print(f"⚠️ 当前 SQLite 不支持 FTS5 trigram，跳过全文索引: {e}")
+        return
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS catalog_fts_ai AFTER INSERT ON medicine_catalog BEGIN
+        INSERT INTO catalog_fts (rowid, name, manufacturer, tags, indications)
+        VALUES (new.rowid, new.name, new.manufacturer, new.tags, new.indications);
+    END;
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS catalog_fts_ad AFTER DELETE ON medicine_catalog BEGIN
+        INSERT INTO catalog_fts (catalog_fts, rowid, name, manufacturer, tags, indications)
+        VALUES ('delete', old.rowid, old.name, old.manufacturer, old.tags, old.indications);
+    END;
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS catalog_fts_au AFTER UPDATE ON medicine_catalog BEGIN
+        INSERT INTO catalog_fts (catalog_fts, rowid, name, manufacturer, tags, indications)
+        VALUES ('delete', old.rowid, old.name, old.manufacturer, old.tags, old.indications);
+        INSERT INTO catalog_fts (rowid, name, manufacturer, tags, indications)
+        VALUES (new.rowid, new.name, new.manufacturer, new.tags, new.indications);
+    END;
+    """)
+    # 默认排名 bm25 列权重：药名 > 标签 > 厂商 > 适应症
+    conn.execute("INSERT INTO catalog_fts (catalog_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 5.0, 1.0)');")
+    # 为已有数据建立索引
+    conn.execute("INSERT INTO catalog_fts (catalog_fts) VALUES ('rebuild');")
+
+def _rekey_catalog_fts(conn):
+    """
+    全文索引改为按显式的 fts_id 关联药库：medicine_catalog 的主键是 TEXT，隐式 rowid 在 VACUUM 时可能被重新编号，
+    外部内容表仍按旧 rowid 对应就会错位 (搜出别的药)。fts_id 是写入时分配的普通字段，VACUUM 不会改变它
+    """
+    add_column_if_missing(conn, "medicine_catalog", "fts_id", "INTEGER")
+    conn.execute("UPDATE medicine_catalog SET fts_id = rowid WHERE fts_id IS NULL")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_catalog_fts_id ON medicine_catalog(fts_id)")
+    for trigger in ("catalog_fts_ai", "catalog_fts_ad", "catalog_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS catalog_fts")
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE catalog_fts USING fts5(
+            name, manufacturer, tags, indications,
+            content='medicine_catalog', content_rowid='fts_id',
+            tokenize='trigram'
+        );
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ 当前 SQLite 不支持 FTS5 trigram，跳过全文索引: {e}")
+        return
+
+    # 新条目取当前最大 fts_id + 1 (有唯一索引，MAX 只读索引末端)，再写入全文索引
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS catalog_fts_ai AFTER INSERT ON medicine_catalog BEGIN
+        UPDATE medicine_catalog SET fts_id = (SELECT COALESCE(MAX(fts_id), 0) + 1 FROM medicine_catalog)
+        WHERE rowid = new.rowid AND fts_id IS NULL;
+        INSERT INTO catalog_fts (rowid, name, manufacturer, tags, indications)
+        SELECT fts_id, name, manufacturer, tags, indications FROM medicine_catalog WHERE rowid = new.rowid;
+    END;
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS catalog_fts_ad AFTER DELETE ON medicine_catalog BEGIN
+        INSERT INTO catalog_fts (catalog_fts, rowid, name, manufacturer, tags, indications)
+        VALUES ('delete', old.fts_id, old.name, old.manufacturer, old.tags, old.indications);
+    END;
+    """)
+    # 只在被索引的字段变化时重建这一行 (上面回填 fts_id 的 UPDATE 不会触发)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS catalog_fts_au AFTER UPDATE OF name, manufacturer, tags, indications
+    ON medicine_catalog BEGIN
+        INSERT INTO catalog_fts (catalog_fts, rowid, name, manufacturer, tags, indications)
+        VALUES ('delete', old.fts_id, old.name, old.manufacturer, old.tags, old.indications);
+        INSERT INTO catalog_fts (rowid, name, manufacturer, tags, indications)
+        VALUES (new.fts_id, new.name, new.manufacturer, new.tags, new.indications);
+    END;
+    """)
+    conn.execute("INSERT INTO catalog_fts (catalog_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 5.0, 1.0)');")
+    conn.execute("INSERT INTO catalog_fts (catalog_fts) VALUES ('rebuild');")
+
+def _rebuild_family_members_per_household(conn):
+    """成员名从全局唯一改为 “家庭内唯一”：SQLite 不能直接改约束，只能重建表"""
+    cols = {r['name'] for r in conn.execute("PRAGMA table_info(family_members)")}
+    if "household_id" in cols:
+        return
+    conn.execute("""
+    CREATE TABLE family_members_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        household_id INTEGER NOT NULL DEFAULT 1,
+        name TEXT NOT NULL,
+        is_default BOOLEAN DEFAULT 0,
+        UNIQUE (household_id, name)
+    );
+    """)
+    conn.execute("""
+    INSERT INTO family_members_new (id, household_id, name, is_default)
+    SELECT id, 1, name, is_default FROM family_members;
+    """)
+    conn.execute("DROP TABLE family_members;")
+    conn.execute("ALTER TABLE family_members_new RENAME TO family_members;")
+
+# --- 标签索引 ---
+# medicine_catalog.tags 仍是用户填写的原文 (空格/逗号分隔)，规范化后的标签另存两张表:
+# tags (标签字典) + catalog_tags (标签 ↔ 条码)，标签筛选/统计只走这两张表的索引。
+# SQLite 触发器里不能用 CTE 拆分字符串，所以由写药库的代码显式调用 sync_catalog_tags。
+
+_TAG_SEPARATORS = re.compile(r"[\s,，、;；]+")
+
+def split_tags(text):
+    """标签原文 -> 去重后的标签列表 (保持原顺序)，空格、中英文逗号、顿号、分号都算分隔符"""
+    if not text: return []
+    return list(dict.fromkeys(t for t in _TAG_SEPARATORS.split(text) if t))
+
+def sync_catalog_tags(conn, barcodes=None):
+    """
+    按 medicine_catalog.tags 重建这些条码的标签索引；barcodes 为 None 时全表重建
+    只在调用方的事务里执行，不提交
+    """
+    if barcodes is None:
+        conn.execute("DELETE FROM catalog_tags")
+        rows = conn.execute("SELECT barcode, tags FROM medicine_catalog").fetchall()
+    else:
+        barcodes, rows = list(barcodes), []
+        for start in range(0, len(barcodes), 500):
+            chunk = barcodes[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM catalog_tags WHERE barcode IN ({marks})", chunk)
+            rows += conn.execute(f"SELECT barcode, tags FROM medicine_catalog WHERE barcode IN ({marks})",
+                                 chunk).fetchall()
+    pairs = [(barcode, tag) for barcode, text in rows for tag in split_tags(text)]
+    if not pairs: return 0
+    conn.executemany("INSERT INTO tags (name) VALUES (?) ON CONFLICT (name) DO NOTHING",
+                     ((name,) for name in {tag for _, tag in pairs}))
+    # 标签字典只有几百到几千个词，整表读出比按名字分批查更简单
+    tag_ids = {name: tag_id for tag_id, name in conn.execute("SELECT id, name FROM tags")}
+    # 按主键顺序插入，B 树只在末尾追加
+    conn.executemany("INSERT INTO catalog_tags (tag_id, barcode) VALUES (?, ?)",
+                     sorted((tag_ids[tag], barcode) for barcode, tag in pairs))
+    return len(pairs)
+
+# 种子文件里的药品字段 (导入时 is_standard 固定为 1，created_at 由数据库维护)
+SEED_COLUMNS = (
+    "barcode", "name", "manufacturer", "spec", "form", "unit", "tags",
+    "indications", "std_usage", "adverse_reactions",
+    "contraindications", "precautions",
+    "pregnancy_lactation_use", "child_use", "elderly_use",
+)
+# 对外读取/导出的药库字段：不含 fts_id 这类只在本实例有意义的内部字段
+CATALOG_COLUMNS = SEED_COLUMNS + ("is_standard", "created_at")
+
+# --- 变更日志 (Change Data Capture) ---
+# 药库、家庭成员、库存的每次增删改都由触发器记入 change_log，供实例之间增量同步 (services.sync)：
+# - 每个 (表, 家庭, 行键) 只保留最新的一条，seq 单调递增；拉取方记住上次同步到的 seq 即可
+# - 行键: 药库用条码，成员用名字，库存用全局唯一的 uid (自增 id 在不同实例之间会撞)
+# - changed_at 为 UTC 毫秒时间戳，origin 为产生这次变化的实例 id，用于 “后写为准” 的冲突裁决
+# - sync_context 只在同步写入的事务里有一行：触发器改用其中对方的 origin / changed_at；
+#   origin 为 NULL 表示不记录 (官方种子由各实例各自导入，不需要同步)
+
+# 表 -> (行键字段, 是否按家庭分区)；顺序即写入对方变化时的依赖顺序 (库存引用药库条码)
+CHANGE_TABLES = {
+    "medicine_catalog": ("barcode", False),
+    "family_members": ("name", True),
+    "inventory": ("uid", True),
+}
+
+# 同步时随变化一起传输的字段 (household_id 由变化本身携带)
+SYNC_COLUMNS = {
+    "medicine_catalog": SEED_COLUMNS + ("is_standard",),
+    "family_members": ("name", "is_default"),
+    "inventory": ("uid", "barcode", "expiry_date", "quantity_val", "owner", "my_dosage", "is_opened"),
+}
+
+_SQLITE_NOW = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+def utc_timestamp():
+    """变更日志的时间戳 (UTC，精确到毫秒)，字符串比较即时间先后"""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+def _log_change_sql(table, op, ref, key, when="1"):
+    """
+    触发器里记一条变更 (ref 为 new / old)：先删掉这一行的旧记录再插入，拿到新的 seq
+    不用 INSERT OR REPLACE：外层语句带 OR IGNORE 时，触发器内的冲突策略会被外层覆盖
+    """
+    household = f"{ref}.household_id" if CHANGE_TABLES[table][1] else "0"
+    standard = f"COALESCE({ref}.is_standard, 0)" if table == "medicine_catalog" else "0"
+    guard = f"({when}) AND NOT EXISTS (SELECT 1 FROM sync_context WHERE origin IS NULL)"
+    return f"""
+        DELETE FROM change_log WHERE tbl = '{table}' AND household_id = {household} AND row_key = {key}
+            AND {guard};
+        INSERT INTO change_log (tbl, household_id, row_key, op, standard, changed_at, origin)
+        SELECT '{table}', {household}, {key}, '{op}', {standard},
+               COALESCE((SELECT changed_at FROM sync_context), {_SQLITE_NOW}),
+               COALESCE((SELECT origin FROM sync_context), (SELECT value FROM app_meta WHERE key = 'instance_id'))
+        WHERE {guard};"""
+
+def _create_change_triggers(conn):
+    """SQLite 的变更日志触发器 (PostgreSQL 见 database_pg 的 log_change)"""
+    for table, (key, partitioned) in CHANGE_TABLES.items():
+        columns = [c for c in SYNC_COLUMNS[table] if c != "uid"] + (["household_id"] if partitioned else [])
+        changed = " OR ".join(f"old.{c} IS NOT new.{c}" for c in columns)
+        # 行键或家庭变了：对方要先删掉旧键对应的行
+        moved = f"old.{key} IS NOT new.{key}" + (" OR old.household_id IS NOT new.household_id" if partitioned else "")
+        assign_uid, new_key = "", f"new.{key}"
+        if table == "inventory":
+            # 本地新增的库存在这里分配 uid (同步写入的库存自带 uid)
+            assign_uid = "UPDATE inventory SET uid = lower(hex(randomblob(16))) WHERE id = new.id AND uid IS NULL;"
+            new_key = "(SELECT uid FROM inventory WHERE id = new.id)"
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_cdc_ai AFTER INSERT ON {table} BEGIN
+            {assign_uid}{_log_change_sql(table, 'upsert', 'new', new_key)}
+        END;
+        """)
+        # 只有业务字段真的变化才记录 (uid 回填、无变化的 UPSERT 都不产生变更)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_cdc_au AFTER UPDATE ON {table} WHEN {changed} BEGIN
+            {_log_change_sql(table, 'delete', 'old', f'old.{key}', moved)}
+            {_log_change_sql(table, 'upsert', 'new', f'new.{key}')}
+        END;
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_cdc_ad AFTER DELETE ON {table} BEGIN
+            {_log_change_sql(table, 'delete', 'old', f'old.{key}')}
+        END;
+        """)
+
+def init_change_log(conn):
+    """
+    生成本实例的 id，并为已有数据补记变更 (两种后端的迁移共用)
+    官方条目由各实例从种子文件导入，只补记用户自建的药品
+    """
+    conn.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('instance_id', ?)", (uuid.uuid4().hex,))
+    origin, now = get_meta(conn, "instance_id"), utc_timestamp()
+    for table, (key, partitioned) in CHANGE_TABLES.items():
+        household = "household_id" if partitioned else "0"
+        where = "WHERE COALESCE(is_standard, 0) = 0" if table == "medicine_catalog" else ""
+        conn.execute(f"INSERT OR IGNORE INTO change_log (tbl, household_id, row_key, op, standard, changed_at, origin) "
+                     f"SELECT '{table}', {household}, {key}, 'upsert', 0, ?, ? FROM {table} {where}", (now, origin))
+
+def set_change_origin(conn, origin, changed_at=None):
+    """
+    本事务接下来的写入以 origin / changed_at 记入变更日志；origin=None 表示不记录
+    提交前必须调用 clear_change_origin (回滚时这一行随事务一起撤销)
+    """
+    conn.execute("INSERT INTO sync_context (id, origin, changed_at) VALUES (1, ?, ?) "
+                 "ON CONFLICT(id) DO UPDATE SET origin = excluded.origin, changed_at = excluded.changed_at",
+                 (origin, changed_at))
+
+def clear_change_origin(conn):
+    conn.execute("DELETE FROM sync_context")
+
+MIGRATIONS = [
+    (1, "热点查询索引", [
+        # load_inventory_rows / AI 上下文的联表键，以及删除药库条目时的外键检查
+        "CREATE INDEX IF NOT EXISTS idx_inventory_barcode ON inventory(barcode);",
+        # 看板统计 (过期/临期) 与 ORDER BY expiry_date
+        "CREATE INDEX IF NOT EXISTS idx_inventory_expiry ON inventory(expiry_date);",
+        # 看板归属人筛选
+        "CREATE INDEX IF NOT EXISTS idx_inventory_owner ON inventory(owner);",
+        # load_catalog_rows 的排序
+        "CREATE INDEX IF NOT EXISTS idx_catalog_std_created ON medicine_catalog(is_standard DESC, created_at DESC);",
+    ]),
+    (2, "药库全文索引 (FTS5 trigram)", [
+        _create_catalog_fts,
+    ]),
+    (3, "元数据表 (种子文件哈希等)", [
+        "CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT);",
+    ]),
+    (4, "多家庭: household_id 分区与复合索引", [
+        """
+        CREATE TABLE IF NOT EXISTS households (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        f"INSERT OR IGNORE INTO households (id, name) VALUES ({DEFAULT_HOUSEHOLD_ID}, '我的家');",
+        # 已有库存/成员全部归入默认家庭 (ADD COLUMN 带 REFERENCES 时默认值只能是 NULL，所以不加外键)
+        lambda conn: add_column_if_missing(conn, "inventory", "household_id",
+                                           f"INTEGER NOT NULL DEFAULT {DEFAULT_HOUSEHOLD_ID}"),
+        _rebuild_family_members_per_household,
+        # 所有库存查询都带 household_id 前缀，单个家庭的查询只扫描本家庭的数据
+        "CREATE INDEX IF NOT EXISTS idx_inventory_hh_expiry ON inventory(household_id, expiry_date);",
+        "CREATE INDEX IF NOT EXISTS idx_inventory_hh_owner ON inventory(household_id, owner);",
+        "CREATE INDEX IF NOT EXISTS idx_inventory_hh_barcode ON inventory(household_id, barcode);",
+        # 被上面的复合索引取代 (idx_inventory_barcode 保留，删除药库条目时的外键检查要用)
+        "DROP INDEX IF EXISTS idx_inventory_expiry;",
+        "DROP INDEX IF EXISTS idx_inventory_owner;",
+    ]),
+    (5, "过期分档物化表与提醒去重记录", [
+        # 每条库存的过期分档 (expired / soon / ok)，由 services.alerts 刷新；库存删除时级联删除
+        """
+        CREATE TABLE IF NOT EXISTS expiry_buckets (
+            inventory_id INTEGER PRIMARY KEY REFERENCES inventory(id) ON DELETE CASCADE,
+            household_id INTEGER NOT NULL,
+            bucket TEXT NOT NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_expiry_buckets_hh ON expiry_buckets(household_id, bucket);",
+        "CREATE INDEX IF NOT EXISTS idx_expiry_buckets_bucket ON expiry_buckets(bucket);",
+        # 已发送的提醒：同一条库存 + 同一过期日期 + 同一阈值 + 同一通道只发一次
+        """
+        CREATE TABLE IF NOT EXISTS expiry_alerts (
+            inventory_id INTEGER NOT NULL REFERENCES inventory(id) ON DELETE CASCADE,
+            threshold TEXT NOT NULL,
+            expiry_date DATE NOT NULL,
+            channel TEXT NOT NULL,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (inventory_id, threshold, expiry_date, channel)
+        );
+        """,
+    ]),
+    (6, "库存变动台账与每日用量汇总", [
+        # 只追加的数量变动台账 (服药/调整/盘点)，与数量修改在同一事务里写入
+        # 不加外键：库存删除后历史仍然保留，用于统计用量
+        """
+        CREATE TABLE IF NOT EXISTS inventory_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventory_id INTEGER NOT NULL,
+            household_id INTEGER NOT NULL,
+            barcode TEXT NOT NULL,
+            owner TEXT,
+            kind TEXT NOT NULL,
+            delta REAL NOT NULL,
+            quantity_after REAL NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ledger_inventory ON inventory_ledger(inventory_id, id);",
+        # 按天汇总的用量 (由 services.usage 增量汇总)，看板与预测只读这张表
+        """
+        CREATE TABLE IF NOT EXISTS consumption_daily (
+            household_id INTEGER NOT NULL,
+            barcode TEXT NOT NULL,
+            owner TEXT NOT NULL DEFAULT '',
+            day DATE NOT NULL,
+            consumed REAL NOT NULL DEFAULT 0,
+            doses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (household_id, barcode, owner, day)
+        );
+        """,
+    ]),
+    (7, "标签规范化: 标签字典与 标签 ↔ 药品 关联表", [
+        "CREATE TABLE IF NOT EXISTS tags (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE);",
+        # 主键 (tag_id, barcode): 某个标签下的全部条码是一段连续的索引，多标签筛选就是几段索引求交集
+        """
+        CREATE TABLE IF NOT EXISTS catalog_tags (
+            tag_id INTEGER NOT NULL REFERENCES tags(id),
+            barcode TEXT NOT NULL REFERENCES medicine_catalog(barcode) ON DELETE CASCADE,
+            PRIMARY KEY (tag_id, barcode)
+        ) WITHOUT ROWID;
+        """,
+        # 按条码反查标签 (重建单个条目的标签、库存按标签统计)
+        "CREATE INDEX IF NOT EXISTS idx_catalog_tags_barcode ON catalog_tags(barcode);",
+        sync_catalog_tags,
+    ]),
+    (8, "变更日志: 实例之间的增量同步", [
+        # AUTOINCREMENT: seq 永不复用，删掉最大的一条后新记录的 seq 仍然更大
+        """
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            household_id INTEGER NOT NULL DEFAULT 0,
+            row_key TEXT NOT NULL,
+            op TEXT NOT NULL,
+            standard INTEGER NOT NULL DEFAULT 0,
+            changed_at TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            UNIQUE (tbl, household_id, row_key)
+        );
+        """,
+        "CREATE TABLE IF NOT EXISTS sync_context (id INTEGER PRIMARY KEY CHECK (id = 1), origin TEXT, changed_at TEXT);",
+        lambda conn: add_column_if_missing(conn, "inventory", "uid", "TEXT"),
+        "UPDATE inventory SET uid = lower(hex(randomblob(16))) WHERE uid IS NULL;",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_uid ON inventory(uid);",
+        init_change_log,
+        _create_change_triggers,
+    ]),
+    (9, "全文索引改用稳定的 fts_id 关联药库 (VACUUM 安全)", [
+        _rekey_catalog_fts,
+    ]),
+]
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """把数据库升级到最新版本 (非破坏性，替代 --reset)"""
+    current = get_schema_version(conn)
+    for version, desc, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"🔼 执行迁移 v{version}: {desc}")
+        try:
+            conn.execute("BEGIN")
+            for step in steps:
+                if callable(step): step(conn)
+                else: conn.execute(step)
+            # user_version 与迁移内容在同一事务里提交，失败则整体回滚
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = version
+    return current
+
+# 热点查询与期望命中的索引，用于 --check 校验 (EXPLAIN QUERY PLAN)
+HOT_QUERY_PLANS = [
+    ("看板库存联表 (load_inventory_rows)",
+     """SELECT i.id, c.name FROM inventory i
+        LEFT JOIN medicine_catalog c ON i.barcode = c.barcode
+        WHERE i.household_id = ? ORDER BY i.expiry_date ASC""",
+     (DEFAULT_HOUSEHOLD_ID,), "idx_inventory_hh_expiry"),
+    ("看板统计 (临期)",
+     """SELECT COUNT(*) FROM inventory
+        WHERE household_id = ?1 AND expiry_date >= DATE(?2) AND expiry_date <= DATE(?2, '+90 days')""",
+     (DEFAULT_HOUSEHOLD_ID, "2000-01-01"), "idx_inventory_hh_expiry"),
+    ("按条码查库存",
+     "SELECT id FROM inventory WHERE barcode = ?", ("0",), "idx_inventory_barcode"),
+    ("归属人筛选",
+     "SELECT id FROM inventory WHERE household_id = ? AND owner = ?", (DEFAULT_HOUSEHOLD_ID, "公用"),
+     "idx_inventory_hh_owner"),
+    ("药库列表排序 (load_catalog_rows)",
+     "SELECT * FROM medicine_catalog ORDER BY is_standard DESC, created_at DESC", (), "idx_catalog_std_created"),
+    ("看板分档计数",
+     "SELECT COUNT(*) FROM expiry_buckets WHERE household_id = ? AND bucket = 'expired'", (DEFAULT_HOUSEHOLD_ID,),
+     "idx_expiry_buckets_hh"),
+    ("到期提醒候选",
+     "SELECT inventory_id FROM expiry_buckets WHERE bucket IN ('expired', 'soon')", (), "idx_expiry_buckets_bucket"),
+    ("用量预测 (每日汇总)",
+     "SELECT barcode, owner, SUM(consumed) FROM consumption_daily WHERE household_id = ? AND day >= ? GROUP BY barcode, owner",
+     (DEFAULT_HOUSEHOLD_ID, "2000-01-01"), "sqlite_autoindex_consumption_daily_1"),
+    ("标签筛选",
+     "SELECT barcode FROM catalog_tags WHERE tag_id = ? INTERSECT SELECT barcode FROM catalog_tags WHERE tag_id = ?",
+     (1, 2), "PRIMARY KEY (tag_id=?)"),
+    ("库存按标签统计",
+     """SELECT ct.tag_id, SUM(i.n) FROM (SELECT barcode, COUNT(*) AS n FROM inventory
+        WHERE household_id = ? GROUP BY barcode) i JOIN catalog_tags ct ON ct.barcode = i.barcode GROUP BY ct.tag_id""",
+     (DEFAULT_HOUSEHOLD_ID,), "idx_catalog_tags_barcode"),
+]
+
+def explain_query_plan(conn, sql, params=()):
+    """返回 EXPLAIN QUERY PLAN 的 detail 文本"""
+    return "\n".join(r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+def check_query_plans(conn):
+    """
+    校验热点查询都命中了预期索引
+    返回未命中的 [(名称, 期望索引, 实际计划)]，为空表示全部通过
+    """
+    failures = []
+    for name, sql, params, index in HOT_QUERY_PLANS:
+        plan = explain_query_plan(conn, sql, params)
+        if index not in plan:
+            failures.append((name, index, plan))
+    return failures
+
 # --- 4. 种子数据管理 (Seed Data) ---
 
+def _iter_json_array(f, chunk_size=1 << 16):
+    """流式解析旧版 JSON 数组文件，逐个产出元素，不把整个文件读进内存"""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def more():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk: eof = True
+        buf, pos = buf[pos:] + chunk, 0
+
+    def skip(chars):
+        # 跳过空白和给定分隔符，必要时继续读
+        nonlocal pos
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] in chars):
+                pos += 1
+            if pos < len(buf) or eof: return
+            more()
+
+    skip("")
+    if buf[pos:pos + 1] != "[":
+        raise ValueError("种子文件不是 JSON 数组")
+    pos += 1
+    while True:
+        skip(",")
+        if pos >= len(buf): raise ValueError("种子文件 JSON 数组不完整")
+        if buf[pos] == "]": return
+        try:
+            item, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof: raise
+            more()
+            continue
+        yield item
+
+def seed_file_path():
+    """当前生效的种子文件：优先 JSON Lines，没有时回退到旧版 JSON 数组"""
+    if os.path.exists(SEED_FILE): return SEED_FILE
+    if os.path.exists(LEGACY_SEED_FILE): return LEGACY_SEED_FILE
+    return None
+
+def iter_seed_items(path):
+    """
+    逐条读取种子文件 (生成器，内存占用与文件大小无关)
+    自动识别格式：首个非空字符是 '[' 为旧版数组，否则按 JSON Lines 处理
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            yield from _iter_json_array(f)
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
 def export_seed_data():
     """
-    [维护者专用] 将数据库中标记为 '官方(is_standard=1)' 的数据导出为 JSON
+    [维护者专用] 将数据库中标记为 '官方(is_standard=1)' 的数据导出为 JSON Lines
     这样 Git 里永远只保存官方清洗过的数据，不包含用户的私人测试数据。
+    按条码排序、一行一条，流式写出：内存占用恒定，改一条药品只产生一行 git diff。
     """
-    conn = get_connection()
-    try:
-        # 只导出 is_standard = 1 的数据
-        # 这里的 SELECT * 会自动把 tags 字段也读出来，dict(row) 也会自动包含 tags
-        rows = conn.execute("SELECT * FROM medicine_catalog WHERE is_standard = 1").fetchall()
-        data = [dict(row) for row in rows]
-        
-        with open(SEED_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            
-        print(f"💾 已导出 {len(data)} 条【官方标准数据】到: {SEED_FILE}")
-        return len(data)
-    except Exception as e:
-        print(f"❌ 导出失败: {e}")
-        raise e
-    finally:
-        conn.close()
+    with borrow_connection() as conn:
+        tmp_path = SEED_FILE + ".tmp"
+        try:
+            # 只导出 is_standard = 1 的数据；字段显式列出，fts_id 等本地内部字段不进种子文件
+            rows = conn.execute(f"SELECT {', '.join(CATALOG_COLUMNS)} FROM medicine_catalog "
+                                "WHERE is_standard = 1 ORDER BY barcode")
+            count = 0
+            with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+                for row in rows:
+                    f.write(json.dumps(dict(row), ensure_ascii=False, default=str))
+                    f.write("\n")
+                    count += 1
+            # 先写临时文件再替换，导出中途失败不会留下半个种子文件
+            os.replace(tmp_path, SEED_FILE)
+                
+            print(f"💾 已导出 {count} 条【官方标准数据】到: {SEED_FILE}")
+            return count
+        except Exception as e:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            print(f"❌ 导出失败: {e}")
+            raise e
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM app_meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else default
 
-def import_seed_data(conn):
+def set_meta(conn, key, value):
+    conn.execute("INSERT INTO app_meta (key, value) VALUES (?, ?) "
+                 "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+def import_seed_data(conn, force=False):
     """
-    [自动调用] 从 JSON 文件加载数据
+    [自动调用] 从种子文件 (JSON Lines 或旧版 JSON 数组) 流式加载数据
     强制策略：JSON 里的数据就是权威数据，强制覆盖本地，并标记为 is_standard=1
+    - 种子文件哈希未变化时直接跳过 (force=True 强制执行)
+    - 先批量写入临时表，再在一个事务里按差异 新增/更新，未变化的行不动 (保留 created_at)
+    - 种子里已删除的官方条目降级为用户数据，而不是物理删除 (可能仍被库存引用)
+    返回 {'inserted', 'updated', 'removed', 'unchanged'}；跳过或失败时返回 None
     """
-    if not os.path.exists(SEED_FILE):
-        return
+    seed_path = seed_file_path()
+    if not seed_path:
+        return None
 
     try:
-        with open(SEED_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        print(f"🌱 正在加载 {len(data)} 条官方种子数据...")
-        cursor = conn.cursor()
-        
-        # 使用 INSERT OR REPLACE 确保官方数据覆盖用户的同名数据
-        # ⚠️ 注意：这里必须显式包含 tags 字段，否则新 json 里的 tags 存不进去
-        sql = """
-        INSERT OR REPLACE INTO medicine_catalog (
-            barcode, name, manufacturer, spec, form, unit, tags, 
-            indications, std_usage, adverse_reactions, 
-            contraindications, precautions, 
-            pregnancy_lactation_use, child_use, elderly_use,
-            is_standard
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
-        """
-        
-        for item in data:
-            cursor.execute(sql, (
-                item.get('barcode'), item.get('name'), item.get('manufacturer'), 
-                item.get('spec'), item.get('form'), item.get('unit'),
-                item.get('tags', ''),  # 🆕 获取 tags，默认空字符串
-                item.get('indications'), item.get('std_usage'), 
-                item.get('adverse_reactions'), item.get('contraindications'), 
-                item.get('precautions'), item.get('pregnancy_lactation_use'), 
-                item.get('child_use'), item.get('elderly_use')
-            ))
-            
+        seed_hash = _file_sha256(seed_path)
+        if not force and get_meta(conn, "seed_sha256") == seed_hash:
+            print("🌱 官方种子数据未变化，跳过导入。")
+            return None
+
+        print(f"🌱 正在加载官方种子数据: {os.path.basename(seed_path)}")
+        cols = ", ".join(SEED_COLUMNS)
+        marks = ", ".join("?" * len(SEED_COLUMNS))
+
+        conn.execute("BEGIN")
+        # 官方数据各实例各自导入，不记入变更日志
+        set_change_origin(conn, None)
+        staging_cols = ", ".join(f"{c} TEXT" for c in SEED_COLUMNS)
+        conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS seed_staging ({staging_cols}, PRIMARY KEY (barcode))")
+        conn.execute("DELETE FROM seed_staging")
+        # 同一条码出现多次时以最后一条为准 (与旧的 INSERT OR REPLACE 行为一致)
+        restage = ", ".join(f"{c} = excluded.{c}" for c in SEED_COLUMNS[1:])
+        conn.executemany(
+            f"INSERT INTO seed_staging ({cols}) VALUES ({marks}) ON CONFLICT(barcode) DO UPDATE SET {restage}",
+            (tuple(item.get('tags', '') if c == 'tags' else item.get(c) for c in SEED_COLUMNS)
+             for item in iter_seed_items(seed_path))
+        )
+        staged = conn.execute("SELECT COUNT(*) FROM seed_staging").fetchone()[0]
+
+        changed = " OR ".join(f"c.{c} IS NOT s.{c}" for c in SEED_COLUMNS[1:]) + " OR c.is_standard IS NOT 1"
+        stats = {
+            "inserted": conn.execute(
+                "SELECT COUNT(*) FROM seed_staging s "
+                "WHERE NOT EXISTS (SELECT 1 FROM medicine_catalog c WHERE c.barcode = s.barcode)").fetchone()[0],
+            "updated": conn.execute(
+                f"SELECT COUNT(*) FROM seed_staging s JOIN medicine_catalog c ON c.barcode = s.barcode "
+                f"WHERE {changed}").fetchone()[0],
+            "removed": conn.execute(
+                "SELECT COUNT(*) FROM medicine_catalog WHERE is_standard = 1 "
+                "AND barcode NOT IN (SELECT barcode FROM seed_staging)").fetchone()[0],
+        }
+        stats["unchanged"] = staged - stats["inserted"] - stats["updated"]
+        # 标签有变化 (含新增) 的条码，写入后只重建这些条码的标签索引
+        retag = [r[0] for r in conn.execute(
+            "SELECT s.barcode FROM seed_staging s LEFT JOIN medicine_catalog c ON c.barcode = s.barcode "
+            "WHERE c.tags IS NOT s.tags")]
+
+        # ON CONFLICT DO UPDATE 只改有差异的行；INSERT ... SELECT 需要 WHERE true 消除语法歧义
+        updates = ", ".join(f"{c} = excluded.{c}" for c in SEED_COLUMNS[1:])
+        # 列名带上表名：PostgreSQL 在这里不允许不加限定的列名 (与 excluded 有歧义)
+        differs = (" OR ".join(f"medicine_catalog.{c} IS NOT excluded.{c}" for c in SEED_COLUMNS[1:])
+                   + " OR medicine_catalog.is_standard IS NOT 1")
+        conn.execute(f"""
+        INSERT INTO medicine_catalog ({cols}, is_standard)
+        SELECT {cols}, 1 FROM seed_staging WHERE true
+        ON CONFLICT(barcode) DO UPDATE SET {updates}, is_standard = 1
+        WHERE {differs}
+        """)
+        conn.execute("""
+        UPDATE medicine_catalog SET is_standard = 0
+        WHERE is_standard = 1 AND barcode NOT IN (SELECT barcode FROM seed_staging)
+        """)
+        sync_catalog_tags(conn, retag)
+        conn.execute("DELETE FROM seed_staging")
+        set_meta(conn, "seed_sha256", seed_hash)
+        clear_change_origin(conn)
         conn.commit()
-        print("✅ 官方数据同步完成。")
+        bump_catalog_version()
+        print(f"✅ 官方数据同步完成: 新增 {stats['inserted']} / 更新 {stats['updated']} / "
+              f"移出官方 {stats['removed']} / 未变 {stats['unchanged']}")
+        return stats
         
     except Exception as e:
+        if conn.in_transaction: conn.rollback()
         print(f"⚠️ 种子加载失败: {e}")
+        return None
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         cmd = sys.argv[1]
         if cmd == "--reset": reset_db()
         elif cmd == "--export": export_seed_data()
+        elif cmd == "--import":
+            init_db()
+            with borrow_connection() as conn:
+                import_seed_data(conn, force=True)
+        elif cmd == "--check":
+            if not is_sqlite():
+                print("ℹ️ --check 只校验 SQLite 的查询计划，PostgreSQL 请使用 EXPLAIN 自行检查。")
+                sys.exit(0)
+            init_db()
+            with borrow_connection() as conn:
+                failures = check_query_plans(conn)
+            for name, index, plan in failures:
+                print(f"❌ {name} 未使用索引 {index}:\n{plan}")
+            if failures: sys.exit(1)
+            print("✅ 热点查询全部命中索引。")
     else:
         init_db()
\ No newline at end of file
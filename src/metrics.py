@@ -0,0 +1,204 @@
+# src/metrics.py
+"""
+轻量性能埋点：进程内的耗时直方图 + SQL 语句计时/行数
+- @timed / timer(): 服务函数 (kind="call")、页面渲染 (kind="view") 的耗时
+- observe_sql / add_sql_rows: 由数据库连接层调用 (见 database.py / database_pg.py)
+- 连接池借出耗时 (kind="pool")
+导出方式: render_prometheus() 文本 (API 的 /metrics)、write_metrics_file() 落盘、
+侧边栏开发者模式下的 “性能面板”
+设置环境变量 HOMEMEDS_METRICS=0 关闭；HOMEMEDS_METRICS_FILE=路径 时进程退出前自动落盘
+每次记录只是一次 perf_counter 差值 + 一次加锁计数，开销在微秒级
+"""
+import os
+import re
+import time
+import atexit
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("HOMEMEDS_METRICS", "1") != "0"
+METRICS_FILE_ENV = "HOMEMEDS_METRICS_FILE"
+
+# 直方图桶上界 (秒)，与 Prometheus 的 le 标签一致
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SQL_LABELS = 500  # 语句种类上限，超出的记为 “(other)”，防止标签无限增长
+
+# kind -> (Prometheus 指标名, 标签名)
+_FAMILIES = {
+    "call": ("homemeds_function_duration_seconds", "func"),
+    "view": ("homemeds_view_duration_seconds", "view"),
+    "sql": ("homemeds_sql_duration_seconds", "statement"),
+    "pool": ("homemeds_connection_acquire_seconds", "backend"),
+}
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最后一格是 +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+
+    def quantile(self, q):
+        """按桶线性插值估算分位数 (秒)"""
+        if not self.count: return 0.0
+        rank, seen, lower = q * self.count, 0, 0.0
+        for i, n in enumerate(self.counts):
+            upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+            if n and seen + n >= rank:
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+            lower = upper
+        return self.max
+
+_lock = threading.Lock()
+_histograms = {}  # (kind, name) -> Histogram
+_sql_rows = {}    # 语句 -> 返回/影响的行数
+
+def observe(kind, name, seconds):
+    key = (kind, name)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(seconds)
+
+@contextmanager
+def timer(name, kind="call"):
+    """with timer("导入种子"): ... 记录一段代码的耗时"""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(kind, name, time.perf_counter() - start)
+
+def timed(func=None, *, name=None, kind="call"):
+    """
+    记录函数每次调用的耗时 (异常也计入)，默认名称为 “模块.函数” (去掉 src. 前缀)
+    和 @cached_by_data_version 一起用时放在最外层，缓存命中的耗时也算在内
+    """
+    if func is None:
+        return lambda f: timed(f, name=name, kind=kind)
+    if not ENABLED:
+        return func
+    label = name or f"{func.__module__.removeprefix('src.')}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe(kind, label, time.perf_counter() - start)
+    return wrapper
+
+# --- SQL ---
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?\d*(?:\s*,\s*\?\d*)+")
+
+@functools.lru_cache(maxsize=2048)
+def sql_label(sql):
+    """语句归一化为标签：压缩空白，IN (?, ?, ...) 这类不定长占位符合并，截断到 160 字"""
+    text = _PLACEHOLDER_LIST.sub("?…", _WHITESPACE.sub(" ", sql).strip())
+    return text if len(text) <= 160 else text[:159] + "…"
+
+def _sql_key(sql):
+    label = sql_label(sql)
+    if ("sql", label) not in _histograms and len(_sql_rows) >= MAX_SQL_LABELS:
+        return "(other)"
+    return label
+
+def observe_sql(sql, seconds, rows=0):
+    """记录一次语句执行；rows 为影响的行数 (查询的返回行数另由 add_sql_rows 累加)"""
+    label = _sql_key(sql)
+    observe("sql", label, seconds)
+    with _lock:
+        _sql_rows[label] = _sql_rows.get(label, 0) + max(rows, 0)
+
+def add_sql_rows(sql, rows):
+    if not rows: return
+    label = _sql_key(sql)
+    with _lock:
+        _sql_rows[label] = _sql_rows.get(label, 0) + rows
+
+# --- 导出 ---
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _sql_rows.clear()
+
+def snapshot(kind=None):
+    """
+    汇总表 (按总耗时倒序)，供性能面板展示:
+    [{kind, name, count, total_ms, avg_ms, p50_ms, p95_ms, max_ms, rows}]
+    """
+    with _lock:
+        items = [(k, n, h.count, h.total, h.quantile(0.5), h.quantile(0.95), h.max, _sql_rows.get(n) if k == "sql" else None)
+                 for (k, n), h in _histograms.items() if kind is None or k == kind]
+    rows = [{"kind": k, "name": n, "count": c, "total_ms": round(t * 1000, 3),
+             "avg_ms": round(t * 1000 / c, 3) if c else 0.0, "p50_ms": round(p50 * 1000, 3),
+             "p95_ms": round(p95 * 1000, 3), "max_ms": round(mx * 1000, 3), "rows": r}
+            for k, n, c, t, p50, p95, mx, r in items]
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def render_prometheus():
+    """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+    with _lock:
+        items = sorted(((k, n, list(h.counts), h.count, h.total) for (k, n), h in _histograms.items()))
+        rows = dict(_sql_rows)
+    lines = []
+    for kind, (metric, label_name) in _FAMILIES.items():
+        family = [item for item in items if item[0] == kind]
+        if not family: continue
+        lines.append(f"# TYPE {metric} histogram")
+        for _, name, counts, count, total in family:
+            label = f'{label_name}="{_escape(name)}"'
+            cumulative = 0
+            for upper, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{label},le="{upper}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum{{{label}}} {total:.6f}")
+            lines.append(f"{metric}_count{{{label}}} {count}")
+    if rows:
+        lines.append("# TYPE homemeds_sql_rows_total counter")
+        for name, n in sorted(rows.items()):
+            lines.append(f'homemeds_sql_rows_total{{statement="{_escape(name)}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+def write_metrics_file(path=None):
+    """把当前指标写入文件 (先写临时文件再替换，可以被 node_exporter 的 textfile 收集器读取)"""
+    path = path or os.environ.get(METRICS_FILE_ENV)
+    if not path: return None
+    folder = os.path.dirname(path)
+    if folder: os.makedirs(folder, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+@atexit.register
+def _dump_at_exit():
+    if ENABLED and os.environ.get(METRICS_FILE_ENV):
+        try:
+            write_metrics_file()
+        except OSError as e:
+            print(f"⚠️ 性能指标落盘失败: {e}")
@@ -1,23 +1,254 @@
 # src/services/ai_service.py
-import pandas as pd
-from src.database import get_connection
+import re
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+from src.database import borrow_connection, DEFAULT_HOUSEHOLD_ID
+from src.services.cache import cached_by_data_version
+from src.services.safety import load_profiles, screen_household, format_warning
+from src.metrics import timed
 
-def get_inventory_str_for_ai():
-    conn = get_connection()
-    try:
+# 库存上下文的字符预算 (中文大约 1 字 ≈ 1 token)，超出时只保留与问题最相关的药品
+AI_CONTEXT_BUDGET = 3000
+# 上下文里最多列出的用药冲突条数 (本地规则筛查结果，按严重程度排序)
+AI_CONFLICT_LIMIT = 10
+
+_NON_WORD = re.compile(r"[\s\W_]+")
+
+def _bigrams(text):
+    """中文没有空格分词，用相邻两字作为匹配单位"""
+    text = _NON_WORD.sub("", str(text or "").lower())
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+@cached_by_data_version
+def _load_ai_entries(today_iso, household_id):
+    """
+    未过期库存按药品 (条码) 去重合并，预先渲染好每种药的一行描述
+    只在库存/药库变化时重建 (数据版本缓存)
+    """
+    with borrow_connection() as conn:
         sql = """
-        SELECT i.id, c.name, c.manufacturer, i.quantity_val, c.unit, i.owner, 
-               c.indications, c.contraindications, c.child_use, i.my_dosage, c.is_standard
+        SELECT i.barcode, c.name, i.quantity_val, c.unit, i.owner,
+               c.tags, c.indications, c.is_standard
         FROM inventory i LEFT JOIN medicine_catalog c ON i.barcode = c.barcode
-        WHERE i.expiry_date >= DATE('now')
+        WHERE i.household_id = ? AND i.expiry_date >= ?
+        ORDER BY i.expiry_date
         """
-        df = pd.read_sql_query(sql, conn)
-        if df.empty: return "库存为空。"
-        
-        lines = []
-        for _, r in df.iterrows():
-            tag = "[官方]" if r['is_standard'] else "[用户]"
-            lines.append(f"- {r['name']}{tag} | 剩:{r['quantity_val']}{r['unit']} | 属:{r['owner']} | 禁:{str(r['contraindications'])[:20]} | 儿:{str(r['child_use'])[:20]}")
-        return "\n".join(lines)
+        entries = {}
+        for r in conn.execute(sql, (household_id, today_iso)):
+            entry = entries.get(r['barcode'])
+            if entry is None:
+                entry = entries[r['barcode']] = {"row": r, "holdings": []}
+            entry["holdings"].append(f"{r['owner']} {r['quantity_val']}{r['unit'] or ''}")
+        profiles = load_profiles(conn, list(entries))
+
+    result = []
+    for barcode, entry in entries.items():
+        r = entry["row"]
+        tag = "[官方]" if r['is_standard'] else "[用户]"
+        line = f"- {r['name']}{tag} | 剩:{', '.join(entry['holdings'])}"
+        profile = profiles.get(barcode)
+        if profile and profile.ingredients:
+            line += f" | 含:{'、'.join(sorted(profile.ingredients))}"
+        if profile and profile.flags():
+            line += f" | {profile.flags()}"
+        result.append({
+            "line": line,
+            # 相关度打分用的词袋：药名权重最高，其次标签，再次适应症
+            "name": _bigrams(r['name']),
+            "tags": _bigrams(r['tags']),
+            "indications": _bigrams(r['indications']),
+        })
+    return result
+
+def _relevance(entry, prompt_grams):
+    return (3 * len(prompt_grams & entry["name"])
+            + 2 * len(prompt_grams & entry["tags"])
+            + len(prompt_grams & entry["indications"]))
+
+@timed
+def get_inventory_str_for_ai(prompt=None, budget_chars=AI_CONTEXT_BUDGET, household_id=DEFAULT_HOUSEHOLD_ID):
+    """
+    构建给 AI 的库存上下文 (只包含指定家庭的库存)
+    同一种药的多条库存合并为一行；超出字符预算时按与 prompt 的相关度挑选
+    成员名下已有的用药冲突 (本地规则筛查) 放在最前面，也计入预算
+    """
+    entries = _load_ai_entries(date.today().isoformat(), household_id)
+    if not entries: return "库存为空。"
+
+    lines, used = [], 0
+    conflicts = screen_household(household_id, limit=AI_CONFLICT_LIMIT)
+    if conflicts:
+        lines.append("用药冲突 (本地规则筛查):")
+        lines += [format_warning(w, with_owner=True) for w in conflicts]
+        lines.append("库存:")
+        used = sum(len(line) + 1 for line in lines)
+
+    if prompt:
+        grams = _bigrams(prompt)
+        # sorted 是稳定排序，相关度相同时保持按过期日期的原顺序
+        entries = sorted(entries, key=lambda e: _relevance(e, grams), reverse=True)
+
+    listed = 0
+    for entry in entries:
+        cost = len(entry["line"]) + 1
+        if budget_chars and used + cost > budget_chars and listed:
+            break
+        lines.append(entry["line"])
+        used += cost
+        listed += 1
+
+    omitted = len(entries) - listed
+    if omitted:
+        lines.append(f"(另有 {omitted} 种药品与问题关系不大，未列出)")
+    return "\n".join(lines)
+
+
+# === LLM 调用：共享客户端 + 超时重试 + 回答缓存 ===
+# 这里用同步的 httpx.Client 而不是 AsyncOpenAI：唯一的调用方是 Streamlit 页面，
+# 每个会话的脚本在各自的线程里运行，st.write_stream 消费的是普通迭代器。
+# 异步客户端在这里需要每次提问 asyncio.run 一个新的事件循环，而 httpx 的连接绑定在事件循环上，
+# 连接池就无法跨提问复用了。“不阻塞” 由流式输出保证：边收边显示，一个会话等待回答也不影响其他会话。
+
+DEFAULT_MODEL = "deepseek-chat"
+LLM_TIMEOUT = 60.0          # 单次请求超时 (秒)，连接超时单独更短
+LLM_CONNECT_TIMEOUT = 10.0
+LLM_MAX_ATTEMPTS = 3        # 建立流式请求的最多尝试次数 (指数退避)
+LLM_CACHE_TTL = 3600        # 回答缓存有效期 (秒)
+LLM_CACHE_SIZE = 256        # 回答缓存最多条数 (LRU 淘汰)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_llm_client(api_key, base_url):
+    """
+    按 (api_key, base_url) 复用 OpenAI 兼容客户端
+    底层 httpx 连接池保持 keep-alive，后续提问不再重新握手 TLS
+    openai/httpx 在这里才导入，不用 AI 页面时不加载这套依赖
+    """
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+            http_client = httpx.Client(
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120),
+            )
+            # 重试由下面的 tenacity 统一控制，关闭 SDK 自带重试避免叠加
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+            _clients[key] = client
+        return client
+
+@atexit.register
+def close_llm_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+class ResponseCache:
+    """线程安全的 TTL + LRU 回答缓存"""
+
+    def __init__(self, maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt, context, model):
+        # 库存上下文只取哈希：库存一变，旧回答自然失效
+        ctx_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        raw = "\x00".join((model, " ".join(prompt.split()), ctx_hash))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None: return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+response_cache = ResponseCache()
+
+def _open_stream(client, model, messages):
+    """
+    建立流式请求；连接失败/超时/限流/5xx 时指数退避重试
+    返回 (上下文管理器, 原始响应)。用原始响应自己解析 SSE，
+    是为了读到响应结束：SDK 的 Stream 读到 [DONE] 就关闭，连接无法回到 keep-alive 池
+    """
+    import openai
+    from tenacity import Retrying, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+    retryable = (openai.APIConnectionError, openai.APITimeoutError,
+                 openai.RateLimitError, openai.InternalServerError)
+    for attempt in Retrying(stop=stop_after_attempt(LLM_MAX_ATTEMPTS),
+                            wait=wait_exponential(multiplier=0.5, max=8),
+                            retry=retry_if_exception_type(retryable), reraise=True):
+        with attempt:
+            manager = client.chat.completions.with_streaming_response.create(
+                model=model, messages=messages, stream=True)
+            return manager, manager.__enter__()
+
+def _iter_sse_text(response):
+    """逐行解析 OpenAI 兼容的 SSE 流，产出增量文本"""
+    for line in response.iter_lines():
+        if not line.startswith("data:"): continue
+        data = line[5:].strip()
+        if data == "[DONE]": continue  # 不提前退出，读到流结束
+        chunk = json.loads(data)
+        if chunk.get("error"):
+            raise RuntimeError(chunk["error"].get("message") or "AI 服务返回错误")
+        for choice in chunk.get("choices") or []:
+            text = (choice.get("delta") or {}).get("content")
+            if text: yield text
+
+def stream_chat(api_key, base_url, prompt, context, model=DEFAULT_MODEL, use_cache=True):
+    """
+    向 AI 药剂师提问，逐段产出回答文本 (可直接交给 st.write_stream)
+    相同 (问题, 库存上下文, 模型) 命中缓存时立即返回，不消耗 API 额度
+    只对建立连接做重试；流已经开始输出后出错直接抛出，避免重复内容
+    """
+    key = ResponseCache.make_key(prompt, context, model)
+    if use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    messages = [{"role": "system", "content": f"基于库存回答。库存：\n{context}"},
+                {"role": "user", "content": prompt}]
+    manager, response = _open_stream(get_llm_client(api_key, base_url), model, messages)
+
+    parts = []
+    try:
+        for text in _iter_sse_text(response):
+            parts.append(text)
+            yield text
     finally:
-        conn.close()
\ No newline at end of file
+        manager.__exit__(None, None, None)
+
+    if use_cache and parts:
+        response_cache.set(key, "".join(parts))
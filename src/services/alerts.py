@@ -0,0 +1,182 @@
+# src/services/alerts.py
+"""
+过期分档与到期提醒
+- expiry_buckets 表物化每条库存的分档 (expired / soon / ok)，看板直接读分档计数；
+  后台任务每轮用一条 upsert 语句整体刷新 (只改写分档变化的行)，入库时只刷新新插入的行
+- 读路径从不写库：今天还没刷新过 (没有运行后台任务或刚跨过零点) 时按过期日期现算
+- 提醒按阈值去重：同一条库存在同一阈值、同一通道只提醒一次 (记录在 expiry_alerts)
+"""
+from datetime import date
+from src.database import borrow_connection, write_transaction, get_meta, set_meta
+from src.metrics import timed
+
+EXPIRED, SOON, OK = "expired", "soon", "ok"
+SOON_DAYS = 90  # 与看板的 “临期预警” 一致
+
+# 提醒阈值: 名称 -> 剩余天数 <= 该值时触发 (expired 即剩余天数 < 0)，按从宽到严排列
+ALERT_THRESHOLDS = (("90d", 90), ("30d", 30), ("7d", 7), (EXPIRED, -1))
+
+_META_KEY = "expiry_buckets_on"
+
+def refresh_expiry_buckets(conn, today_iso, household_id=None, inventory_ids=None):
+    """
+    按 today 重新计算分档并写入 expiry_buckets (不提交，由调用方控制事务)
+    ON CONFLICT ... WHERE 只改写分档变化的行，每天大部分库存不会产生写入
+    inventory_ids: 只刷新这些库存 (同步写入的少量行)
+    """
+    where, params = "WHERE true", [today_iso]
+    if household_id is not None:
+        where, params = "WHERE household_id = ?2", params + [household_id]
+    if inventory_ids is not None:
+        ids = list(inventory_ids)
+        marks = ",".join(f"?{n}" for n in range(len(params) + 1, len(params) + len(ids) + 1))
+        where, params = where + f" AND id IN ({marks})", params + ids
+    conn.execute(f"""
+    INSERT INTO expiry_buckets (inventory_id, household_id, bucket)
+    SELECT id, household_id,
+           CASE WHEN expiry_date < DATE(?1) THEN '{EXPIRED}'
+                WHEN expiry_date <= DATE(?1, '+{SOON_DAYS} days') THEN '{SOON}'
+                ELSE '{OK}' END
+    FROM inventory {where}
+    ON CONFLICT(inventory_id) DO UPDATE SET bucket = excluded.bucket, household_id = excluded.household_id
+    WHERE expiry_buckets.bucket IS NOT excluded.bucket OR expiry_buckets.household_id IS NOT excluded.household_id
+    """, params)
+
+@timed
+def ensure_expiry_buckets(today_iso=None):
+    """分档按天生效：今天还没刷新过就整体刷新一次 (跨过零点、或很久没人打开时)"""
+    today_iso = today_iso or date.today().isoformat()
+    with borrow_connection() as conn:
+        if get_meta(conn, _META_KEY) == today_iso:
+            return False
+    with write_transaction() as conn:
+        refresh_expiry_buckets(conn, today_iso)
+        set_meta(conn, _META_KEY, today_iso)
+    return True
+
+# --- 提醒 ---
+
+def _days_left(expiry, today):
+    # SQLite 返回字符串，PostgreSQL 返回 date
+    return (date.fromisoformat(str(expiry)[:10]) - today).days
+
+def _due_thresholds(days_left):
+    """已经跨过的阈值 (从宽到严)"""
+    return [name for name, days in ALERT_THRESHOLDS if days_left <= days]
+
+@timed
+def collect_due_alerts(today=None):
+    """
+    找出临期/过期库存及其已跨过的阈值: [(alert, [阈值...])]
+    只扫描 expiry_buckets 中 expired / soon 两档 (走 bucket 索引)
+    """
+    today = today or date.today()
+    with borrow_connection() as conn:
+        rows = conn.execute(f"""
+        SELECT i.id, i.household_id, h.name AS household, c.name, i.owner, i.expiry_date, i.quantity_val, c.unit
+        FROM expiry_buckets b
+        JOIN inventory i ON i.id = b.inventory_id
+        LEFT JOIN medicine_catalog c ON c.barcode = i.barcode
+        LEFT JOIN households h ON h.id = i.household_id
+        WHERE b.bucket IN ('{EXPIRED}', '{SOON}')
+        ORDER BY i.expiry_date
+        """).fetchall()
+    due = []
+    for r in rows:
+        days_left = _days_left(r['expiry_date'], today)
+        thresholds = _due_thresholds(days_left)
+        if not thresholds: continue
+        alert = {
+            "inventory_id": r['id'], "household_id": r['household_id'], "household": r['household'],
+            "name": r['name'], "owner": r['owner'], "expiry_date": str(r['expiry_date'])[:10],
+            "days_left": days_left, "quantity": f"{r['quantity_val']}{r['unit'] or ''}",
+            "threshold": thresholds[-1],
+        }
+        due.append((alert, thresholds))
+    return due
+
+def _claim(conn, alert, thresholds, channel):
+    """
+    先占位再发送：插入本通道的去重记录，插入成功才说明还没发过
+    同时跨过多个阈值时 (如新入库就只剩 20 天) 只发最严的那一条，较宽的阈值一并记为已发
+    返回本次新占位的阈值 (最严的阈值已发过时返回 None，不需要发送)
+    """
+    claimed = []
+    for threshold in thresholds:
+        row = conn.execute(
+            "INSERT INTO expiry_alerts (inventory_id, threshold, expiry_date, channel) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT DO NOTHING RETURNING threshold",
+            (alert["inventory_id"], threshold, alert["expiry_date"], channel)).fetchone()
+        if row: claimed.append(threshold)
+    return claimed if thresholds[-1] in claimed else None
+
+def _release(conn, claims, channel):
+    """发送失败：撤销这一轮新占位的全部阈值 (包括一并记为已发的较宽阈值)"""
+    conn.executemany(
+        "DELETE FROM expiry_alerts WHERE inventory_id = ? AND threshold = ? AND expiry_date = ? AND channel = ?",
+        [(a["inventory_id"], t, a["expiry_date"], channel) for a, thresholds in claims for t in thresholds])
+
+@timed
+def run_alert_cycle(sinks, today=None):
+    """
+    执行一轮提醒: 刷新分档 -> 找出到期阈值 -> 每个通道认领未发送的提醒 -> 汇总发送
+    认领与发送分开：发送期间不占用写锁；发送失败则撤销认领，下一轮重试
+    多个 worker 同时运行也不会重复发送 (认领依赖主键冲突)
+    返回 {通道名: 发送条数 或 错误信息}
+    """
+    today = today or date.today()
+    ensure_expiry_buckets(today.isoformat())
+    due = collect_due_alerts(today)
+
+    results = {}
+    for sink in sinks:
+        with write_transaction() as conn:
+            claims = [(alert, claimed) for alert, thresholds in due
+                      if (claimed := _claim(conn, alert, thresholds, sink.name))]
+        batch = [alert for alert, _ in claims]
+        if not batch:
+            results[sink.name] = 0
+            continue
+        try:
+            sink.send(batch)
+            results[sink.name] = len(batch)
+        except Exception as e:
+            print(f"❌ 提醒发送失败 ({sink.name}): {e}")
+            with write_transaction() as conn:
+                _release(conn, claims, sink.name)
+            results[sink.name] = str(e)
+    return results
+
+def buckets_current(conn, today_iso):
+    """分档是否已按 today 刷新过 (只有这时物化结果才可信)"""
+    return get_meta(conn, _META_KEY) == today_iso
+
+def buckets_fresh_sql(today_iso):
+    """联表读取分档时的附加条件：分档过期时 JOIN 不到，调用方按天数现算 (today_iso 来自 date.isoformat)"""
+    return f"EXISTS (SELECT 1 FROM app_meta WHERE key = '{_META_KEY}' AND value = '{date.fromisoformat(today_iso)}')"
+
+@timed
+def get_bucket_counts(household_id, today_iso=None):
+    """
+    看板统计用: (总数, 已过期, 临期)
+    分档是今天刷新的：三个计数都走 (household_id, bucket) 索引；
+    否则直接按过期日期计数 (走 (household_id, expiry_date) 索引的范围查找)，不在读路径上刷新
+    """
+    today_iso = today_iso or date.today().isoformat()
+    with borrow_connection() as conn:
+        if buckets_current(conn, today_iso):
+            row = conn.execute(f"""
+            SELECT
+                (SELECT COUNT(*) FROM expiry_buckets WHERE household_id = ?1) AS total,
+                (SELECT COUNT(*) FROM expiry_buckets WHERE household_id = ?1 AND bucket = '{EXPIRED}') AS expired,
+                (SELECT COUNT(*) FROM expiry_buckets WHERE household_id = ?1 AND bucket = '{SOON}') AS soon
+            """, (household_id,)).fetchone()
+        else:
+            row = conn.execute(f"""
+            SELECT
+                (SELECT COUNT(*) FROM inventory WHERE household_id = ?1) AS total,
+                (SELECT COUNT(*) FROM inventory WHERE household_id = ?1 AND expiry_date < DATE(?2)) AS expired,
+                (SELECT COUNT(*) FROM inventory WHERE household_id = ?1
+                  AND expiry_date >= DATE(?2) AND expiry_date <= DATE(?2, '+{SOON_DAYS} days')) AS soon
+            """, (household_id, today_iso)).fetchone()
+        return row['total'], row['expired'], row['soon']
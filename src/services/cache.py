@@ -0,0 +1,45 @@
+# src/services/cache.py
+import threading
+import functools
+from src.database import get_data_version
+
+def cached_by_data_version(func=None, *, maxsize=32):
+    """
+    进程级读缓存：结果按 (参数, 数据版本号) 缓存
+    任何写操作 bump_data_version() 之后缓存整体失效；版本不变时直接返回同一个对象，
+    所以调用方拿到 DataFrame 后不要原地修改 (df = df[mask] 这种写法没问题)。
+    """
+    if func is None:
+        return lambda f: cached_by_data_version(f, maxsize=maxsize)
+
+    lock = threading.Lock()
+    state = {"version": None, "results": {}}
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        # 先读版本号再查询：查询期间若有写入，结果只会记在旧版本下，不会被误用
+        version = get_data_version()
+        with lock:
+            if state["version"] == version and key in state["results"]:
+                return state["results"][key]
+
+        result = func(*args, **kwargs)
+
+        with lock:
+            if state["version"] != version:
+                if state["version"] is not None and state["version"] > version:
+                    return result  # 已有更新的缓存，不要回退
+                state["version"], state["results"] = version, {}
+            results = state["results"]
+            if len(results) >= maxsize:
+                results.pop(next(iter(results)))
+            results[key] = result
+        return result
+
+    def cache_clear():
+        with lock:
+            state["version"], state["results"] = None, {}
+
+    wrapper.cache_clear = cache_clear
+    return wrapper
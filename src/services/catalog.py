@@ -1,78 +1,181 @@
-import pandas as pd
-from src.database import get_connection
+import time
+import threading
+from collections import OrderedDict
+from src.database import borrow_connection, write_transaction, bump_catalog_version, get_catalog_version, sync_catalog_tags, CATALOG_COLUMNS
+from src.services.cache import cached_by_data_version
+from src.services.rows import CatalogRow, CATALOG_SELECT, to_frame
+from src.services.search import search_catalog
+from src.services.tags import tag_filter_sql, barcodes_with_tags
+from src.metrics import timed
 
+# --- 条码快速通道 (扫码入库) ---
+# 条码精确查询只走主键，命中的行以普通 dict 缓存在进程内 LRU 中，整个过程不经过 pandas。
+# 本进程的药库增删改/种子导入会递增药库版本号使缓存失效 (库存写入不影响)；
+# 其他进程的修改最多 CATALOG_CACHE_TTL 秒后可见。
+
+CATALOG_CACHE_SIZE = 2048
+CATALOG_CACHE_TTL = 60.0  # 秒
+
+_CATALOG_COLUMNS = ", ".join(CATALOG_COLUMNS)
+
+_catalog_cache = OrderedDict()  # barcode -> (载入时间, 行 dict)
+_catalog_cache_version = None
+_catalog_cache_lock = threading.Lock()
+
+def _row_to_dict(row):
+    # 与旧版 DataFrame.fillna("") 的结果保持一致：空值一律是空字符串
+    return {k: ("" if v is None else v) for k, v in dict(row).items()}
+
+@timed
+def lookup_barcode(barcode):
+    """
+    按条码精确查询药库 (主键查找 + LRU)，返回行 dict 的副本，找不到返回 None
+    不缓存未命中的条码：扫到新药后通常马上会录入
+    """
+    global _catalog_cache_version
+    barcode = (barcode or "").strip()
+    if not barcode: return None
+    now = time.monotonic()
+    with _catalog_cache_lock:
+        if _catalog_cache_version != get_catalog_version():
+            _catalog_cache.clear()
+            _catalog_cache_version = get_catalog_version()
+        hit = _catalog_cache.get(barcode)
+        if hit and now - hit[0] < CATALOG_CACHE_TTL:
+            _catalog_cache.move_to_end(barcode)
+            return dict(hit[1])
+        version = _catalog_cache_version
+
+    with borrow_connection() as conn:
+        row = conn.execute(f"SELECT {_CATALOG_COLUMNS} FROM medicine_catalog WHERE barcode = ?", (barcode,)).fetchone()
+    if row is None: return None
+    info = _row_to_dict(row)
+    with _catalog_cache_lock:
+        # 查询期间药库被修改过就不回填，避免把旧数据放进新版本的缓存
+        if version == get_catalog_version():
+            _catalog_cache[barcode] = (now, info)
+            _catalog_cache.move_to_end(barcode)
+            while len(_catalog_cache) > CATALOG_CACHE_SIZE:
+                _catalog_cache.popitem(last=False)
+    return dict(info)
+
+@timed
+def find_catalog_by_name(query):
+    """
+    按药名/标签/厂商等搜索，返回排名第一的条目 (排序规则见 search_catalog)，没有返回 None
+    不按条码前缀匹配：未收录的条码不能解析成另一个更长条码的药品 (前缀搜索留给搜索框)
+    """
+    hits = search_catalog(query, limit=1, barcode_prefix=False)
+    return lookup_barcode(hits[0]) if hits else None
+
+@timed
 def get_catalog_info(query):
     """
-    智能查询公共药品库
+    智能查询公共药品库：条码精确匹配优先 (快速通道)，否则取药名等文本搜索排名第一的条目
     """
-    conn = get_connection()
-    try:
-        sql = """
-        SELECT * FROM medicine_catalog 
-        WHERE barcode = ? OR name LIKE ? LIMIT 1
-        """
-        df = pd.read_sql_query(sql, conn, params=(query, f"%{query}%"))
-        if not df.empty:
-            return df.iloc[0].fillna("").to_dict()
-        return None
-    finally:
-        conn.close()
+    return lookup_barcode(query) or find_catalog_by_name(query)
 
 # 👇 核心修改：增加了 tags 参数
+@timed
 def upsert_catalog_item(barcode, name, manufacturer, spec, form, unit, tags, 
                        indications, std_usage, adverse_reactions, 
                        contraindications, precautions, 
                        pregnancy_lactation_use, child_use, elderly_use,
                        is_standard=0):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        # 插入或更新 tags
-        sql = """
-        INSERT INTO medicine_catalog (
-            barcode, name, manufacturer, spec, form, unit, tags, 
-            indications, std_usage, 
-            adverse_reactions, contraindications, precautions, 
-            pregnancy_lactation_use, child_use, elderly_use, is_standard
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(barcode) DO UPDATE SET
-            name=excluded.name, manufacturer=excluded.manufacturer, spec=excluded.spec,
-            form=excluded.form, unit=excluded.unit, tags=excluded.tags,
-            indications=excluded.indications, std_usage=excluded.std_usage, 
-            adverse_reactions=excluded.adverse_reactions, contraindications=excluded.contraindications, 
-            precautions=excluded.precautions, pregnancy_lactation_use=excluded.pregnancy_lactation_use, 
-            child_use=excluded.child_use, elderly_use=excluded.elderly_use, is_standard=excluded.is_standard;
-        """
-        cursor.execute(sql, (
-            barcode, name, manufacturer, spec, form, unit, tags,
-            indications, std_usage, adverse_reactions, contraindications, precautions, 
-            pregnancy_lactation_use, child_use, elderly_use, is_standard
-        ))
-        conn.commit()
+        with write_transaction() as conn:
+            # 插入或更新 tags
+            sql = """
+            INSERT INTO medicine_catalog (
+                barcode, name, manufacturer, spec, form, unit, tags, 
+                indications, std_usage, 
+                adverse_reactions, contraindications, precautions, 
+                pregnancy_lactation_use, child_use, elderly_use, is_standard
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(barcode) DO UPDATE SET
+                name=excluded.name, manufacturer=excluded.manufacturer, spec=excluded.spec,
+                form=excluded.form, unit=excluded.unit, tags=excluded.tags,
+                indications=excluded.indications, std_usage=excluded.std_usage, 
+                adverse_reactions=excluded.adverse_reactions, contraindications=excluded.contraindications, 
+                precautions=excluded.precautions, pregnancy_lactation_use=excluded.pregnancy_lactation_use, 
+                child_use=excluded.child_use, elderly_use=excluded.elderly_use, is_standard=excluded.is_standard;
+            """
+            conn.execute(sql, (
+                barcode, name, manufacturer, spec, form, unit, tags,
+                indications, std_usage, adverse_reactions, contraindications, precautions, 
+                pregnancy_lactation_use, child_use, elderly_use, is_standard
+            ))
+            sync_catalog_tags(conn, [barcode])
+        bump_catalog_version()
         return True
     except Exception as e:
         print(f"❌ 更新失败: {e}")
         return False
-    finally:
-        conn.close()
 
+@timed
 def delete_catalog_item(barcode):
     """删除公共药品库条目"""
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM medicine_catalog WHERE barcode = ?", (barcode,))
-        conn.commit()
+        with write_transaction() as conn:
+            conn.execute("DELETE FROM medicine_catalog WHERE barcode = ?", (barcode,))
+        bump_catalog_version()
         return True
     except Exception as e:
         print(f"❌ 删除失败: {e}")
         return False
-    finally:
-        conn.close()
 
+def iter_catalog_rows(batch_size=500, tags=()):
+    """逐行产出公共药库 (dict)，按条码排序；供 API 流式输出，不构造 DataFrame"""
+    tag_sql, params = tag_filter_sql(tags)
+    where = f"WHERE barcode IN ({tag_sql})" if tag_sql else ""
+    with borrow_connection() as conn:
+        cur = conn.execute(f"SELECT {_CATALOG_COLUMNS} FROM medicine_catalog {where} ORDER BY barcode", params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows: break
+            for r in rows:
+                yield dict(r)
+
+@timed
+@cached_by_data_version
+def load_catalog_rows():
+    """公共药库全部条目 (CatalogRow 元组，官方优先 + 收录时间倒序)"""
+    with borrow_connection() as conn:
+        cur = conn.execute(CATALOG_SELECT + " ORDER BY is_standard DESC, created_at DESC")
+        return tuple(CatalogRow.from_cursor(cur))
+
+@timed
 def load_catalog_data():
-    conn = get_connection()
-    try:
-        return pd.read_sql_query("SELECT * FROM medicine_catalog ORDER BY is_standard DESC, created_at DESC", conn)
-    finally:
-        conn.close()
\ No newline at end of file
+    """公共药库 DataFrame，仅供统计分析；界面和 API 请用 load_catalog_rows / load_catalog_page"""
+    return to_frame(load_catalog_rows(), CatalogRow)
+
+
+@timed
+@cached_by_data_version
+def load_catalog_page(page, page_size, search=None, tags=()):
+    """
+    分页读取公共药库，返回 (当前页 CatalogRow 元组, 符合条件的总条数)
+    无搜索时按 官方优先 + 收录时间倒序 走索引分页；有搜索时按相关度分页
+    tags 为标签元组 (见 tags.normalize_tags)，多个标签取交集
+    """
+    offset = page * page_size
+    with borrow_connection() as conn:
+        if search:
+            ranked = search_catalog(search)
+            if tags:
+                allowed = barcodes_with_tags(tags)
+                ranked = [b for b in ranked if b in allowed]
+            page_barcodes = ranked[offset:offset + page_size]
+            if not page_barcodes: return (), len(ranked)
+            placeholders = ",".join("?" * len(page_barcodes))
+            rows = CatalogRow.from_cursor(
+                conn.execute(CATALOG_SELECT + f" WHERE barcode IN ({placeholders})", page_barcodes))
+            order = {b: i for i, b in enumerate(page_barcodes)}
+            return tuple(sorted(rows, key=lambda r: order[r.barcode])), len(ranked)
+
+        tag_sql, params = tag_filter_sql(tags)
+        where = f"WHERE barcode IN ({tag_sql})" if tag_sql else ""
+        total = conn.execute(f"SELECT COUNT(*) FROM medicine_catalog {where}", params).fetchone()[0]
+        cur = conn.execute(CATALOG_SELECT + f" {where} ORDER BY is_standard DESC, created_at DESC LIMIT ? OFFSET ?",
+                           params + [page_size, offset])
+        return tuple(CatalogRow.from_cursor(cur)), total
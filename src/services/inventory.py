@@ -1,60 +1,135 @@
 # src/services/inventory.py
+# 所有库存操作都限定在 household_id 内：按 id 修改/删除时也校验家庭，防止跨家庭误改
 import sqlite3
-from src.database import get_connection
+from datetime import date
+from src.database import write_transaction, row_lock_clause, DEFAULT_HOUSEHOLD_ID
+from src.services.alerts import refresh_expiry_buckets
+from src.services.usage import record_change, DOSE, ADJUST, SET
+from src.metrics import timed
 
-def add_inventory_item(barcode, expiry_date, quantity_val, owner, my_dosage):
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed
+def add_inventory_item(barcode, expiry_date, quantity_val, owner, my_dosage, household_id=DEFAULT_HOUSEHOLD_ID):
     try:
-        sql = "INSERT INTO inventory (barcode, expiry_date, quantity_val, owner, my_dosage) VALUES (?, ?, ?, ?, ?)"
-        cursor.execute(sql, (barcode, expiry_date, quantity_val, owner, my_dosage))
-        conn.commit()
+        with write_transaction() as conn:
+            sql = """
+            INSERT INTO inventory (household_id, barcode, expiry_date, quantity_val, owner, my_dosage)
+            VALUES (?, ?, ?, ?, ?, ?) RETURNING id
+            """
+            med_id = conn.execute(sql, (household_id, barcode, expiry_date, quantity_val, owner, my_dosage)).fetchone()[0]
+            # 新库存立即计入过期分档 (只算这一行)，看板统计不用等定时任务
+            refresh_expiry_buckets(conn, date.today().isoformat(), inventory_ids=[med_id])
         return True
     except sqlite3.IntegrityError:
         return False
     except Exception as e:
         print(f"❌ 库存添加失败: {e}")
         return False
-    finally:
-        conn.close()
 
-def update_quantity(med_id, new_quantity_val):
-    conn = get_connection()
-    cursor = conn.cursor()
+def _change_quantity(conn, med_id, household_id, expr, value, kind):
+    """
+    锁行取旧值 -> 在 SQL 里改数量 -> 写台账 (不提交)，返回新数量，找不到返回 None
+    先加锁再读旧值，并发修改时台账记录的也是真实变化量 (扣到 0 为止的部分)
+    """
+    old = conn.execute(
+        f"SELECT barcode, owner, quantity_val FROM inventory WHERE id = ? AND household_id = ?{row_lock_clause()}",
+        (med_id, household_id)).fetchone()
+    if not old: return None
+    new = conn.execute(f"UPDATE inventory SET quantity_val = {expr} WHERE id = ? RETURNING quantity_val",
+                       (value, med_id)).fetchone()['quantity_val']
+    record_change(conn, med_id, household_id, old['barcode'], old['owner'],
+                  new - old['quantity_val'], new, kind)
+    return new
+
+@timed
+def update_quantity(med_id, new_quantity_val, household_id=DEFAULT_HOUSEHOLD_ID):
+    """修正数量：直接设为新数量 (不能为负)，台账记为 set"""
+    if new_quantity_val < 0: return False
     try:
-        cursor.execute("UPDATE inventory SET quantity_val = ? WHERE id = ?", (new_quantity_val, med_id))
-        conn.commit()
-        return True
+        with write_transaction() as conn:
+            return _change_quantity(conn, med_id, household_id, "?", new_quantity_val, SET) is not None
     except Exception:
         return False
-    finally:
-        conn.close()
 
-def decrease_quantity(med_id, decrease_amount):
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed
+def decrease_quantity(med_id, decrease_amount, household_id=DEFAULT_HOUSEHOLD_ID):
+    """服药扣减：在 SQL 里原子地扣减 (不低于 0)，并发打卡不会互相覆盖；同一事务里写入台账"""
     try:
-        cursor.execute("SELECT quantity_val FROM inventory WHERE id = ?", (med_id,))
-        row = cursor.fetchone()
-        if not row: return False, "找不到记录"
-        
-        new_qty = max(0, row['quantity_val'] - decrease_amount)
-        cursor.execute("UPDATE inventory SET quantity_val = ? WHERE id = ?", (new_qty, med_id))
-        conn.commit()
-        return True, new_qty
+        with write_transaction() as conn:
+            new = _change_quantity(conn, med_id, household_id, "MAX(0, quantity_val - ?)", decrease_amount, DOSE)
+        if new is None:
+            return False, "找不到记录"
+        return True, new
     except Exception as e:
         return False, str(e)
-    finally:
-        conn.close()
 
-def delete_medicine(med_id):
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed
+def delete_medicine(med_id, household_id=DEFAULT_HOUSEHOLD_ID):
     try:
-        cursor.execute("DELETE FROM inventory WHERE id = ?", (med_id,))
-        conn.commit()
+        with write_transaction() as conn:
+            conn.execute("DELETE FROM inventory WHERE id = ? AND household_id = ?", (med_id, household_id))
         return True
     except Exception:
         return False
-    finally:
-        conn.close()
\ No newline at end of file
+
+
+# === 批量操作：整批在一个事务里完成，只提交一次 ===
+
+@timed
+def add_inventory_items(items, household_id=DEFAULT_HOUSEHOLD_ID):
+    """
+    批量入库
+    items: [(barcode, expiry_date, quantity_val, owner, my_dosage), ...]
+    返回 (成功与否, 入库条数 或 错误信息)；任意一条失败则整批回滚
+    """
+    items = list(items)
+    try:
+        with write_transaction() as conn:
+            before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM inventory").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO inventory (household_id, barcode, expiry_date, quantity_val, owner, my_dosage) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((household_id, *item) for item in items)
+            )
+            # 只刷新这批新行的分档 (按主键区间取 id；并发写入时多刷几行也无妨，结果按日期重算)
+            new_ids = [r[0] for r in conn.execute(
+                "SELECT id FROM inventory WHERE id > ? AND household_id = ?", (before, household_id))]
+            for start in range(0, len(new_ids), 500):
+                refresh_expiry_buckets(conn, date.today().isoformat(), inventory_ids=new_ids[start:start + 500])
+        return True, len(items)
+    except sqlite3.IntegrityError:
+        return False, "条码不存在于公共药库"
+    except Exception as e:
+        print(f"❌ 批量入库失败: {e}")
+        return False, str(e)
+
+@timed
+def delete_medicines(med_ids, household_id=DEFAULT_HOUSEHOLD_ID):
+    """批量删除库存，返回 (成功与否, 实际删除条数 或 错误信息)"""
+    try:
+        with write_transaction() as conn:
+            cur = conn.executemany("DELETE FROM inventory WHERE id = ? AND household_id = ?",
+                                   ((int(i), household_id) for i in med_ids))
+            return True, cur.rowcount
+    except Exception as e:
+        print(f"❌ 批量删除失败: {e}")
+        return False, str(e)
+
+@timed
+def adjust_quantities(adjustments, household_id=DEFAULT_HOUSEHOLD_ID):
+    """
+    批量调整数量 (正数增加，负数扣减，结果不低于 0)
+    adjustments: [(med_id, delta), ...]
+    每条都是 SQL 内的原子读改写并写入台账，返回 (成功与否, {med_id: 新数量} 或 错误信息)；
+    找不到的 id 不会出现在结果里
+    """
+    try:
+        results = {}
+        with write_transaction() as conn:
+            for med_id, delta in adjustments:
+                med_id = int(med_id)
+                new = _change_quantity(conn, med_id, household_id, "MAX(0, quantity_val + ?)", delta, ADJUST)
+                if new is not None: results[med_id] = new
+        return True, results
+    except Exception as e:
+        print(f"❌ 批量调整失败: {e}")
+        return False, str(e)
@@ -1,41 +1,64 @@
 # src/services/members.py
 import sqlite3
-from src.database import get_connection
+from src.database import borrow_connection, write_transaction, DEFAULT_HOUSEHOLD_ID, DEFAULT_MEMBERS
+from src.metrics import timed
 
-def get_all_members():
+@timed
+def get_all_members(household_id=DEFAULT_HOUSEHOLD_ID):
     """获取所有成员名单 (列表)"""
-    conn = get_connection()
-    try:
+    with borrow_connection() as conn:
         # 按 ID 排序，保证顺序稳定
-        rows = conn.execute("SELECT name FROM family_members ORDER BY id").fetchall()
+        rows = conn.execute("SELECT name FROM family_members WHERE household_id = ? ORDER BY id",
+                            (household_id,)).fetchall()
         return [r['name'] for r in rows]
-    finally:
-        conn.close()
 
-def add_member(name):
+@timed
+def add_member(name, household_id=DEFAULT_HOUSEHOLD_ID):
     """添加新成员"""
-    conn = get_connection()
+    name = name.strip()
+    if not name: return False, "名字不能为空"
     try:
-        name = name.strip()
-        if not name: return False, "名字不能为空"
-        conn.execute("INSERT INTO family_members (name) VALUES (?)", (name,))
-        conn.commit()
+        with write_transaction() as conn:
+            conn.execute("INSERT INTO family_members (household_id, name) VALUES (?, ?)", (household_id, name))
         return True, "添加成功"
     except sqlite3.IntegrityError:
         return False, "该成员已存在"
     except Exception as e:
         return False, str(e)
-    finally:
-        conn.close()
 
-def delete_member(name):
+@timed
+def delete_member(name, household_id=DEFAULT_HOUSEHOLD_ID):
     """删除成员"""
-    conn = get_connection()
     try:
-        conn.execute("DELETE FROM family_members WHERE name = ?", (name,))
-        conn.commit()
+        with write_transaction() as conn:
+            conn.execute("DELETE FROM family_members WHERE household_id = ? AND name = ?", (household_id, name))
         return True
     except Exception:
         return False
-    finally:
-        conn.close()
\ No newline at end of file
+
+
+# === 家庭 (Household) ===
+
+@timed
+def get_all_households():
+    """获取所有家庭 [(id, name)]"""
+    with borrow_connection() as conn:
+        return [(r['id'], r['name']) for r in conn.execute("SELECT id, name FROM households ORDER BY id")]
+
+@timed
+def add_household(name):
+    """新建家庭并写入默认成员，返回 (成功与否, 新家庭 id 或 错误信息)"""
+    name = name.strip()
+    if not name: return False, "名字不能为空"
+    try:
+        # 家庭和默认成员一起提交，不会留下没有成员的家庭
+        with write_transaction() as conn:
+            household_id = conn.execute("INSERT INTO households (name) VALUES (?) RETURNING id",
+                                        (name,)).fetchone()['id']
+            conn.executemany("INSERT INTO family_members (household_id, name) VALUES (?, ?)",
+                             [(household_id, m) for m in DEFAULT_MEMBERS])
+        return True, household_id
+    except sqlite3.IntegrityError:
+        return False, "该家庭已存在"
+    except Exception as e:
+        return False, str(e)
@@ -1,34 +1,127 @@
 # src/services/queries.py
-import pandas as pd
-from datetime import date, timedelta
-from src.database import get_connection
-
-def load_data():
-    conn = get_connection()
-    try:
-        # 👇 修改 SQL：增加了 c.tags
-        sql = """
-        SELECT 
-            i.id, i.barcode,
-            c.name, c.manufacturer, c.spec, c.form, c.unit, c.tags, 
-            i.quantity_val, i.expiry_date, i.owner,
-            c.indications, c.child_use, c.contraindications, c.is_standard,
-            i.my_dosage
-        FROM inventory i
-        LEFT JOIN medicine_catalog c ON i.barcode = c.barcode
-        ORDER BY i.expiry_date ASC
-        """
-        df = pd.read_sql_query(sql, conn)
-        if not df.empty:
-            df['quantity_display'] = df['quantity_val'].astype(str) + " " + df['unit'].fillna('')
-            df['expiry_date'] = pd.to_datetime(df['expiry_date'])
-        return df
-    finally:
-        conn.close()
-
-def get_dashboard_metrics():
-    df = load_data()
-    if df.empty: return 0, 0, 0
-    dates = pd.to_datetime(df['expiry_date']).dt.date
-    today = date.today()
-    return len(df), len(dates[dates < today]), len(dates[(dates >= today) & (dates <= (today + timedelta(days=90)))])
\ No newline at end of file
+from datetime import date
+from src.database import borrow_connection, DEFAULT_HOUSEHOLD_ID
+from src.services.rows import InventoryRow, to_frame
+from src.services.cache import cached_by_data_version
+from src.services.search import search_inventory
+from src.services.tags import tag_filter_sql
+from src.services.alerts import get_bucket_counts, buckets_fresh_sql
+from src.metrics import timed
+
+# 看板/操作页共用的库存联表字段 (列顺序与 InventoryRow.__slots__ 一致)
+_INVENTORY_SELECT = """
+SELECT 
+    i.id, i.barcode,
+    c.name, c.manufacturer, c.spec, c.form, c.unit, c.tags, 
+    i.quantity_val, i.expiry_date, i.owner,
+    c.indications, c.child_use, c.contraindications, c.is_standard,
+    i.my_dosage, b.bucket AS expiry_bucket
+FROM inventory i
+LEFT JOIN medicine_catalog c ON i.barcode = c.barcode
+LEFT JOIN expiry_buckets b ON b.inventory_id = i.id AND {buckets_fresh}
+"""
+
+def _inventory_select(today_iso):
+    # 分档今天还没刷新时 expiry_bucket 为 NULL，看板按天数现算
+    return _INVENTORY_SELECT.format(buckets_fresh=buckets_fresh_sql(today_iso))
+
+def inventory_frame(rows):
+    """
+    库存行对象 -> DataFrame (带 quantity_display，expiry_date 转为日期类型)
+    只在需要向量化计算时调用 (看板卡片网格、统计分析)
+    """
+    import pandas as pd
+    df = to_frame(rows, InventoryRow)
+    if not df.empty:
+        df['quantity_display'] = df['quantity_val'].astype(str) + " " + df['unit'].fillna('')
+        df['expiry_date'] = pd.to_datetime(df['expiry_date'])
+    return df
+
+@cached_by_data_version
+def _load_inventory_rows(household_id, today_iso):
+    with borrow_connection() as conn:
+        cur = conn.execute(_inventory_select(today_iso) + " WHERE i.household_id = ? ORDER BY i.expiry_date ASC",
+                           (household_id,))
+        return tuple(InventoryRow.from_cursor(cur))
+
+@timed
+def load_inventory_rows(household_id=DEFAULT_HOUSEHOLD_ID):
+    """本家庭的全部库存 (InventoryRow 元组，按过期日期排序)"""
+    # 日期也作为缓存键：跨过零点后分档是否可信会变
+    return _load_inventory_rows(household_id, date.today().isoformat())
+
+@timed
+def load_data(household_id=DEFAULT_HOUSEHOLD_ID):
+    """本家庭的全部库存 DataFrame，仅供统计分析；界面和 API 请用 load_inventory_rows"""
+    return inventory_frame(load_inventory_rows(household_id))
+
+def _inventory_where(household_id, owner=None, tags=()):
+    """库存列表的 WHERE 子句与参数：家庭 + 可选的归属人 + 可选的标签 (同时具有)"""
+    where, params = "WHERE i.household_id = ?", [household_id]
+    if owner:
+        where, params = where + " AND i.owner = ?", params + [owner]
+    tag_sql, tag_params = tag_filter_sql(tags)
+    if tag_sql:
+        where, params = where + f" AND i.barcode IN ({tag_sql})", params + tag_params
+    return where, params
+
+@timed
+def load_inventory_page(page, page_size, search=None, owner=None, household_id=DEFAULT_HOUSEHOLD_ID, tags=()):
+    """
+    分页读取库存 (按过期日期排序，搜索时按相关度)，返回 (当前页 InventoryRow 元组, 符合条件的总条数)
+    page 从 0 开始；只读出当前页的行。tags 为标签元组 (见 tags.normalize_tags)，多个标签取交集
+    """
+    return _load_inventory_page(page, page_size, search, owner, household_id, tags, date.today().isoformat())
+
+@cached_by_data_version
+def _load_inventory_page(page, page_size, search, owner, household_id, tags, today_iso):
+    select = _inventory_select(today_iso)
+    offset = page * page_size
+    with borrow_connection() as conn:
+        if search:
+            # 搜索结果只是按相关度排好的 id 列表，先按标签过滤、切出当前页，再按 id 取行
+            ids = search_inventory(search, owner=owner, household_id=household_id)
+            if tags:
+                where, params = _inventory_where(household_id, tags=tags)
+                allowed = {r[0] for r in conn.execute(f"SELECT i.id FROM inventory i {where}", params)}
+                ids = [i for i in ids if i in allowed]
+            page_ids = ids[offset:offset + page_size]
+            if not page_ids: return (), len(ids)
+            placeholders = ",".join("?" * len(page_ids))
+            rows = InventoryRow.from_cursor(
+                conn.execute(select + f" WHERE i.id IN ({placeholders})", page_ids))
+            order = {i: n for n, i in enumerate(page_ids)}
+            return tuple(sorted(rows, key=lambda r: order[r.id])), len(ids)
+
+        where, params = _inventory_where(household_id, owner, tags)
+        total = conn.execute(f"SELECT COUNT(*) FROM inventory i {where}", params).fetchone()[0]
+        cur = conn.execute(select + f" {where} ORDER BY i.expiry_date ASC LIMIT ? OFFSET ?",
+                           params + [page_size, offset])
+        return tuple(InventoryRow.from_cursor(cur)), total
+
+def iter_inventory_rows(household_id=DEFAULT_HOUSEHOLD_ID, owner=None, batch_size=500, tags=()):
+    """
+    逐行产出本家庭的库存 (dict)，按过期日期排序；不构造 DataFrame，供 API 流式输出大列表
+    生成器在遍历期间占用一个池化连接，遍历结束或被关闭时归还
+    """
+    where, params = _inventory_where(household_id, owner, tags)
+    with borrow_connection() as conn:
+        cur = conn.execute(_inventory_select(date.today().isoformat()) + f" {where} ORDER BY i.expiry_date ASC",
+                           params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows: break
+            for r in rows:
+                yield dict(r)
+
+@cached_by_data_version
+def _count_expiry_buckets(today_iso, household_id):
+    # 分档由后台任务物化在 expiry_buckets 中，这里只读 (分档不是今天的则按日期现算)；
+    # today_iso 同时用作缓存键，跨过零点后自动重新计数
+    return get_bucket_counts(household_id, today_iso)
+
+@timed
+def get_dashboard_metrics(household_id=DEFAULT_HOUSEHOLD_ID):
+    """看板统计：(总库存, 已过期, 90天内临期)，只读，不刷新分档"""
+    # 用本地日期而不是 DATE('now') (UTC)，与看板卡片上的天数计算保持一致
+    return _count_expiry_buckets(date.today().isoformat(), household_id)
@@ -0,0 +1,71 @@
+# src/services/rows.py
+"""
+服务层的轻量行对象：查询结果直接从游标构造成 __slots__ 对象，不经过 pandas
+- 列表/单条读取 (API、下拉框、卡片循环) 返回行对象，r.name 与 r["name"] 两种写法都可以
+- 需要向量化计算/统计时再显式调用 to_frame() 转成 DataFrame，pandas 在那时才导入
+字段顺序即 SELECT 的列顺序，查询语句要与 __slots__ 保持一致
+"""
+from operator import attrgetter
+
+class Row:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    @classmethod
+    def from_cursor(cls, cur):
+        """游标剩余的所有行 -> 行对象列表 (sqlite3.Row / PG Row 都按位置取值)"""
+        return [cls(*r) for r in cur.fetchall()]
+
+    def __getitem__(self, key):
+        # 兼容旧代码里 row['name'] 的写法 (原先是 DataFrame 的一行)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{f}={getattr(self, f)!r}' for f in self.__slots__)})"
+
+class InventoryRow(Row):
+    """库存 + 药库联表的一行 (列顺序见 queries._INVENTORY_SELECT)"""
+    __slots__ = ("id", "barcode", "name", "manufacturer", "spec", "form", "unit", "tags",
+                 "quantity_val", "expiry_date", "owner",
+                 "indications", "child_use", "contraindications", "is_standard",
+                 "my_dosage", "expiry_bucket")
+
+    @property
+    def quantity_display(self):
+        return f"{self.quantity_val} {self.unit or ''}"
+
+    def to_dict(self):
+        data = super().to_dict()
+        data["quantity_display"] = self.quantity_display
+        return data
+
+class CatalogRow(Row):
+    """公共药库的一行"""
+    __slots__ = ("barcode", "name", "manufacturer", "spec", "form", "unit", "tags",
+                 "indications", "std_usage", "adverse_reactions",
+                 "contraindications", "precautions",
+                 "pregnancy_lactation_use", "child_use", "elderly_use",
+                 "is_standard", "created_at")
+
+CATALOG_SELECT = f"SELECT {', '.join(CatalogRow.__slots__)} FROM medicine_catalog"
+
+def to_frame(rows, row_cls):
+    """行对象列表 -> DataFrame (列即 __slots__)，只给统计/向量化渲染按需使用"""
+    import pandas as pd
+    return pd.DataFrame.from_records(list(map(attrgetter(*row_cls.__slots__), rows)),
+                                     columns=list(row_cls.__slots__))
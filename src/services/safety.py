@@ -0,0 +1,378 @@
+# src/services/safety.py
+"""
+用药安全筛查：本地规则引擎，不依赖 AI
+- 药品画像 (DrugProfile)：从药名识别成分/药理类别，从禁忌、注意事项和儿童/孕妇哺乳/老年用药说明里
+  归纳出各特殊人群的级别 (禁用/慎用/不明确)；按条码编译一次后缓存，药库变化时失效
+- 成员索引：每个成员名下未过期、有剩余的药按 成分 -> 药品、类别 -> 药品 建倒排索引 (数据版本缓存)
+- 筛查：拟用药只和索引里命中的药逐对比对 (成分重复、类别相互作用)，再叠加成员的特殊人群提示
+规则只覆盖常见家庭用药，命中即提示、不命中不代表安全；结论一律建议咨询医生或药师
+"""
+import re
+import functools
+import threading
+from collections import namedtuple
+from datetime import date
+from src.database import borrow_connection, get_catalog_version, DEFAULT_HOUSEHOLD_ID
+from src.services.cache import cached_by_data_version
+from src.metrics import timed
+
+# === 1. 规则数据 ===
+
+# 成分 -> 药理类别 (相互作用规则按类别写)
+DRUG_CLASSES = {
+    "对乙酰氨基酚": ("解热镇痛",),
+    "布洛芬": ("解热镇痛", "NSAID"),
+    "洛索洛芬": ("解热镇痛", "NSAID"),
+    "双氯芬酸": ("NSAID",),
+    "萘普生": ("NSAID",),
+    "阿司匹林": ("解热镇痛", "NSAID", "抗血小板"),
+    "头孢菌素": ("抗菌药", "头孢类"),
+    "阿莫西林": ("抗菌药", "青霉素类"),
+    "青霉素": ("抗菌药", "青霉素类"),
+    "阿奇霉素": ("抗菌药", "大环内酯类"),
+    "罗红霉素": ("抗菌药", "大环内酯类"),
+    "克拉霉素": ("抗菌药", "大环内酯类"),
+    "红霉素": ("抗菌药", "大环内酯类"),
+    "喹诺酮": ("抗菌药", "喹诺酮类"),
+    "甲硝唑": ("抗菌药", "硝基咪唑类"),
+    "替硝唑": ("抗菌药", "硝基咪唑类"),
+    "氯雷他定": ("抗组胺",),
+    "西替利嗪": ("抗组胺",),
+    "氯苯那敏": ("抗组胺",),
+    "苯海拉明": ("抗组胺",),
+    "伪麻黄碱": ("减充血剂",),
+    "右美沙芬": ("中枢镇咳",),
+    "可待因": ("中枢镇咳",),
+    "金刚烷胺": ("抗病毒",),
+    "咖啡因": ("中枢兴奋",),
+    "蒙脱石": ("吸附止泻",),
+    "活菌": ("活菌制剂",),
+    "二甲双胍": ("降糖",),
+    "硝苯地平": ("降压",),
+    "氨氯地平": ("降压",),
+    "华法林": ("抗凝",),
+    "乙醇": ("含酒精",),
+}
+
+# 药名关键词 -> 成分；成分名本身也是关键词。复方制剂的通用名缩写/常见名对应多个成分
+NAME_KEYWORDS = {
+    "扑热息痛": ("对乙酰氨基酚",),
+    "头孢": ("头孢菌素",),
+    "沙星": ("喹诺酮",),
+    "扑尔敏": ("氯苯那敏",),
+    "益生菌": ("活菌",), "双歧杆菌": ("活菌",), "乳酸菌": ("活菌",), "枯草杆菌": ("活菌",),
+    "地衣芽孢杆菌": ("活菌",),
+    "感冒灵": ("对乙酰氨基酚", "氯苯那敏", "咖啡因"),
+    "维C银翘": ("对乙酰氨基酚", "氯苯那敏"),
+    "氨酚黄那敏": ("对乙酰氨基酚", "氯苯那敏"),
+    "酚麻美敏": ("对乙酰氨基酚", "伪麻黄碱", "右美沙芬", "氯苯那敏"),
+    "氨酚烷胺": ("对乙酰氨基酚", "金刚烷胺", "咖啡因", "氯苯那敏"),
+    "氨酚伪麻": ("对乙酰氨基酚", "伪麻黄碱"),
+    "美敏伪麻": ("右美沙芬", "氯苯那敏", "伪麻黄碱"),
+    "藿香正气水": ("乙醇",),
+}
+
+# (类别A, 类别B, 级别, 提示)；A == B 表示同类药物叠加，B 为 "*" 表示与任何口服药
+INTERACTION_RULES = (
+    ("NSAID", "NSAID", "danger", "两种非甾体抗炎药同用，胃肠道出血和肾损伤风险增加"),
+    ("NSAID", "抗凝", "danger", "非甾体抗炎药会增加抗凝药的出血风险"),
+    ("头孢类", "含酒精", "danger", "头孢类与含酒精制剂同用可引起双硫仑样反应"),
+    ("硝基咪唑类", "含酒精", "danger", "甲硝唑类与含酒精制剂同用可引起双硫仑样反应"),
+    ("降糖", "含酒精", "warning", "酒精会增加降糖药的低血糖/乳酸酸中毒风险"),
+    ("抗组胺", "抗组胺", "warning", "多种抗过敏成分叠加，嗜睡、口干等不良反应加重"),
+    ("减充血剂", "减充血剂", "warning", "伪麻黄碱类成分叠加，心悸、血压升高风险增加"),
+    ("减充血剂", "降压", "warning", "伪麻黄碱可升高血压，减弱降压药效果"),
+    ("中枢镇咳", "中枢镇咳", "warning", "两种中枢镇咳药叠加，呼吸抑制、嗜睡风险增加"),
+    ("抗菌药", "活菌制剂", "info", "抗菌药会杀灭活菌制剂中的细菌，两者需间隔 2~3 小时服用"),
+    ("吸附止泻", "*", "info", "蒙脱石会吸附同时服用的其他药物，需间隔 1~2 小时"),
+)
+
+# 级别 -> (排序权重, 图标, 说明)
+LEVELS = {"danger": (3, "🔴", "禁用"), "warning": (2, "🟡", "慎用"), "info": (1, "🔵", "提示")}
+
+# 特殊人群 -> (显示名, 文本里的识别词)
+POPULATIONS = {
+    "child": ("儿童", r"儿童|小儿|婴幼儿|婴儿|新生儿|幼儿|\d+\s*岁以下|未成年"),
+    "pregnancy": ("孕妇", r"孕妇|妊娠|怀孕|孕期"),
+    "lactation": ("哺乳期", r"哺乳|乳汁"),
+    "elderly": ("老年", r"老年|老人|高龄"),
+}
+
+# 成员名 -> 特殊人群的默认推断 (成员表没有年龄等信息，调用方可以显式传 populations 覆盖)
+MEMBER_POPULATIONS = (
+    (r"宝宝|宝贝|孩子|儿子|女儿|小孩|婴儿|儿童", "child"),
+    (r"爷爷|奶奶|外公|外婆|姥姥|姥爷|老人", "elderly"),
+)
+
+# 外用剂型不参与全身性的成分重复/相互作用判断
+_EXTERNAL = re.compile(r"软膏|乳膏|凝胶|喷雾|滴眼|滴耳|滴鼻|贴|外用|洗剂|搽剂|酊")
+
+# === 2. 文本编译 ===
+
+_KEYWORDS = {**{ing: (ing,) for ing in DRUG_CLASSES}, **NAME_KEYWORDS}
+# 长关键词优先 (“罗红霉素” 不会再被识别出 “红霉素”)
+_KEYWORD_RE = re.compile("|".join(map(re.escape, sorted(_KEYWORDS, key=len, reverse=True))))
+_CLAUSE_RE = re.compile(r"[。；;，,\n]|\s*\d+[.．、]\s*")
+_POPULATION_RES = {p: re.compile(pattern) for p, (_, pattern) in POPULATIONS.items()}
+_LEVEL_RES = (
+    ("danger", re.compile(r"禁用|禁服|忌用|忌服|禁止|不得|不宜|不应|不可")),
+    ("warning", re.compile(r"慎用|慎服|减量|酌减|酌情|遵医嘱|医师指导|医生指导|咨询|监护下|权衡|调整剂量|经乳汁|乳汁中")),
+    ("info", re.compile(r"尚不明确|尚未确定|不明确|尚无|未进行|缺乏|尚不清楚")),
+)
+# 特殊人群说明字段 -> 默认人群 (句子里没写人群时归到这里)；禁忌字段里提到的人群默认就是禁用
+_POPULATION_FIELDS = (
+    ("contraindications", None),
+    ("precautions", None),
+    ("child_use", "child"),
+    ("pregnancy_lactation_use", "pregnancy"),
+    ("elderly_use", "elderly"),
+)
+PROFILE_COLUMNS = ("barcode", "name", "form") + tuple(f for f, _ in _POPULATION_FIELDS)
+
+def _clause_level(clause):
+    for level, pattern in _LEVEL_RES:
+        if pattern.search(clause): return level
+    return None
+
+class DrugProfile:
+    """编译好的药品画像；populations: {人群: (级别, 原句)}，conditions: 禁忌里与人群无关的原句"""
+    __slots__ = ("barcode", "name", "external", "ingredients", "classes", "populations", "conditions")
+
+    def __init__(self, barcode, name, external, ingredients, classes, populations, conditions):
+        self.barcode, self.name, self.external = barcode, name, external
+        self.ingredients, self.classes = ingredients, classes
+        self.populations, self.conditions = populations, conditions
+
+    def flags(self):
+        """特殊人群简写，如 “儿童慎用 孕妇禁用”"""
+        return " ".join(f"{POPULATIONS[p][0]}{LEVELS[level][2]}"
+                        for p, (level, _) in self.populations.items() if level != "info")
+
+@functools.lru_cache(maxsize=4096)
+def _parse_name(name, form):
+    """药名/剂型 -> (成分, 类别, 是否外用)"""
+    ingredients = frozenset(ing for kw in _KEYWORD_RE.findall(name) for ing in _KEYWORDS[kw])
+    classes = frozenset(c for ing in ingredients for c in DRUG_CLASSES[ing])
+    return ingredients, classes, bool(_EXTERNAL.search(name) or _EXTERNAL.search(form))
+
+@functools.lru_cache(maxsize=4096)
+def _parse_field(field, text):
+    """
+    一个说明字段 -> (((人群, 级别, 原句), ...), (禁忌里与人群无关的原句, ...))
+    不同厂家同一通用名的说明书大多一字不差，按原文缓存，编译整个药库时大部分字段不用重新分句
+    """
+    default_population = dict(_POPULATION_FIELDS)[field]
+    hits, conditions = [], []
+    for clause in _CLAUSE_RE.split(text):
+        clause = clause.strip()
+        if not clause: continue
+        level = _clause_level(clause)
+        populations = [p for p, pattern in _POPULATION_RES.items() if pattern.search(clause)]
+        if field == "contraindications":
+            level = level or "danger"
+            if not populations:
+                conditions.append(clause)
+                continue
+        elif not level:
+            continue
+        hits.extend((p, level, clause) for p in populations or [default_population] if p)
+    return tuple(hits), tuple(conditions)
+
+def compile_profile(row):
+    """药库一行 (含 PROFILE_COLUMNS 各字段) -> DrugProfile；同一人群在多处出现时取最严重的一句"""
+    name = row["name"] or ""
+    ingredients, classes, external = _parse_name(name, row["form"] or "")
+    populations, conditions = {}, []
+    for field, _ in _POPULATION_FIELDS:
+        hits, clauses = _parse_field(field, row[field] or "")
+        conditions.extend(clauses)
+        for p, level, clause in hits:
+            old = populations.get(p)
+            if old is None or LEVELS[level][0] > LEVELS[old[0]][0]:
+                populations[p] = (level, clause)
+    return DrugProfile(row["barcode"], name, external, ingredients, classes,
+                       {p: populations[p] for p in POPULATIONS if p in populations}, tuple(conditions))
+
+# === 3. 画像缓存 ===
+# 按条码缓存编译结果；本进程的药库修改会递增药库版本号使缓存整体失效
+
+PROFILE_CACHE_SIZE = 16384
+
+_profiles = {}
+_profiles_version = None
+_profiles_lock = threading.Lock()
+
+def load_profiles(conn, barcodes):
+    """条码列表 -> {条码: DrugProfile}，缓存未命中的一次查询补齐；药库里没有的条码不出现在结果中"""
+    global _profiles_version
+    with _profiles_lock:
+        if _profiles_version != get_catalog_version() or len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.clear()
+            _profiles_version = get_catalog_version()
+        found = {b: _profiles[b] for b in barcodes if b in _profiles}
+    missing = [b for b in dict.fromkeys(barcodes) if b not in found]
+    for start in range(0, len(missing), 500):
+        chunk = missing[start:start + 500]
+        sql = (f"SELECT {', '.join(PROFILE_COLUMNS)} FROM medicine_catalog "
+               f"WHERE barcode IN ({','.join('?' * len(chunk))})")
+        for r in conn.execute(sql, chunk):
+            found[r["barcode"]] = compile_profile(r)
+    with _profiles_lock:
+        if _profiles_version == get_catalog_version():
+            _profiles.update((b, found[b]) for b in missing if b in found)
+    return found
+
+def drug_profile(barcode):
+    """单个条码的药品画像，找不到返回 None"""
+    with borrow_connection() as conn:
+        return load_profiles(conn, [barcode]).get(barcode)
+
+# === 4. 成员索引 ===
+
+MemberIndex = namedtuple("MemberIndex", "profiles by_ingredient by_class")
+
+@cached_by_data_version
+def _owners(household_id):
+    with borrow_connection() as conn:
+        return tuple(r[0] for r in conn.execute(
+            "SELECT DISTINCT owner FROM inventory WHERE household_id = ? ORDER BY owner", (household_id,)))
+
+@cached_by_data_version
+def _member_index(today_iso, household_id, owner):
+    """
+    成员名下未过期且有剩余的药 (同一条码只算一次，按条码排序)，外用药不进索引
+    按成员分别缓存，筛查某个人时只编译这个人的药；today_iso 只用作缓存键，跨过零点后自动重建
+    """
+    with borrow_connection() as conn:
+        barcodes = [r[0] for r in conn.execute(
+            "SELECT DISTINCT barcode FROM inventory "
+            "WHERE household_id = ? AND owner = ? AND expiry_date >= ? AND quantity_val > 0 ORDER BY barcode",
+            (household_id, owner, today_iso))]
+        profiles = load_profiles(conn, barcodes)
+
+    items = [profiles[b] for b in barcodes if b in profiles and not profiles[b].external]
+    by_ingredient, by_class = {}, {}
+    for p in items:
+        for ing in p.ingredients: by_ingredient.setdefault(ing, []).append(p)
+        for c in p.classes: by_class.setdefault(c, []).append(p)
+    return MemberIndex(items, by_ingredient, by_class)
+
+# === 5. 筛查 ===
+
+def guess_populations(member):
+    """按成员名推断特殊人群 (如 宝宝 -> child，爷爷 -> elderly)"""
+    return tuple(p for pattern, p in MEMBER_POPULATIONS if re.search(pattern, member or ""))
+
+def _warning(level, kind, message, drug, other=None, owner=None):
+    return {"level": level, "kind": kind, "message": message,
+            "barcode": drug.barcode, "name": drug.name,
+            "other_barcode": other.barcode if other else None, "other_name": other.name if other else None,
+            "owner": owner}
+
+def _duplicate_message(shared):
+    return f"成分重复 ({'、'.join(sorted(shared))})，合用可能超量"
+
+def _rules_between(a, b):
+    """两种药之间命中的 (级别, 提示)；同一成分已经报过重复的，不再报同类叠加"""
+    shared = a.ingredients & b.ingredients
+    if shared:
+        yield "danger", _duplicate_message(shared)
+    for ca, cb, level, message in INTERACTION_RULES:
+        if ca == cb:
+            if not shared and ca in a.classes and ca in b.classes:
+                yield level, message
+        elif cb == "*":
+            if ca in a.classes or ca in b.classes:
+                yield level, message
+        elif (ca in a.classes and cb in b.classes) or (cb in a.classes and ca in b.classes):
+            yield level, message
+
+def _candidates(drug, index):
+    """索引里可能与 drug 冲突的药：共享成分、规则另一侧的类别；有 “与任何药” 规则时就是全部"""
+    wanted = {p.barcode: p for ing in drug.ingredients for p in index.by_ingredient.get(ing, ())}
+    for ca, cb, _, _ in INTERACTION_RULES:
+        if cb == "*" and (ca in drug.classes or ca in index.by_class):
+            return index.profiles
+        for mine, theirs in ((ca, cb), (cb, ca)):
+            if mine in drug.classes:
+                wanted.update((p.barcode, p) for p in index.by_class.get(theirs, ()))
+    return list(wanted.values())
+
+def _member_pairs(index):
+    """
+    成员名下两两冲突的 (药A, 药B, 级别, 提示)，只在索引命中的药之间配对
+    先成分重复、再按 INTERACTION_RULES 的顺序产出，即严重的在前，调用方可以提前停止
+    """
+    seen = set()
+    for items in index.by_ingredient.values():
+        for i, a in enumerate(items):
+            for b in items[i + 1:]:
+                if (a.barcode, b.barcode) in seen: continue
+                seen.add((a.barcode, b.barcode))
+                yield a, b, "danger", _duplicate_message(a.ingredients & b.ingredients)
+    for ca, cb, level, message in INTERACTION_RULES:
+        left = index.by_class.get(ca, ())
+        right = left if ca == cb else index.profiles if cb == "*" else index.by_class.get(cb, ())
+        done = set()
+        for a in left:
+            for b in right:
+                pair = (a.barcode, b.barcode) if a.barcode < b.barcode else (b.barcode, a.barcode)
+                if a.barcode == b.barcode or pair in done: continue
+                done.add(pair)
+                if ca == cb and pair in seen: continue
+                yield a, b, level, message
+
+def _sort(warnings):
+    return sorted(warnings, key=lambda w: -LEVELS[w["level"]][0])
+
+def _screen(drug, owner, index, populations):
+    warnings = []
+    if not drug.external:
+        for other in _candidates(drug, index):
+            if other.barcode == drug.barcode: continue
+            for level, message in _rules_between(drug, other):
+                warnings.append(_warning(level, "interaction", message, drug, other, owner))
+    for p in populations:
+        hit = drug.populations.get(p)
+        if hit:
+            level, clause = hit
+            warnings.append(_warning(level, "population", f"{POPULATIONS[p][0]}：{clause}", drug, owner=owner))
+    return warnings
+
+@timed
+def screen_medicine(barcode, owner=None, household_id=DEFAULT_HOUSEHOLD_ID, populations=None):
+    """
+    拟用药与成员现有库存的冲突检查，返回结构化提示列表 (按严重程度排序)，药库里没有该条码返回 None
+    每条提示: level (danger/warning/info)、kind (interaction/population)、message、
+    barcode/name (拟用药)、other_barcode/other_name (冲突的库存药，人群提示为 None)、owner
+    owner 为空时逐个成员检查；populations 为空时按成员名推断 (见 guess_populations)
+    """
+    drug = drug_profile(barcode)
+    if drug is None: return None
+    today_iso = date.today().isoformat()
+    warnings = []
+    for o in [owner] if owner else _owners(household_id):
+        pops = guess_populations(o) if populations is None else populations
+        warnings.extend(_screen(drug, o, _member_index(today_iso, household_id, o), pops))
+    return _sort(warnings)
+
+@timed
+def screen_household(household_id=DEFAULT_HOUSEHOLD_ID, limit=None):
+    """
+    每个成员名下现有药品两两之间的冲突 (不含人群提示)，按严重程度排序，给 AI 上下文/API 用
+    limit: 最多返回条数；每个成员的配对本身就是严重的在前，够数即停
+    """
+    today_iso = date.today().isoformat()
+    warnings = []
+    for owner in _owners(household_id):
+        for n, (a, b, level, message) in enumerate(_member_pairs(_member_index(today_iso, household_id, owner))):
+            if limit and n >= limit: break
+            warnings.append(_warning(level, "interaction", message, a, b, owner))
+    return _sort(warnings)[:limit]
+
+def format_warning(w, with_owner=False):
+    """一条提示 -> 单行文本 (界面与 AI 上下文共用)"""
+    icon = LEVELS[w["level"]][1]
+    who = f"{w['owner']}: " if with_owner and w["owner"] else ""
+    pair = f"{w['name']} + {w['other_name']}" if w["other_name"] else w["name"]
+    return f"{icon} {who}{pair} — {w['message']}"
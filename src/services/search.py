@@ -0,0 +1,100 @@
+# src/services/search.py
+from src.database import borrow_connection, get_backend, DEFAULT_HOUSEHOLD_ID
+from src.metrics import timed
+
+# trigram 分词至少需要 3 个字符才能走索引，更短的词 (如“感冒”) 回退为 LIKE
+_MIN_FTS_LEN = 3
+
+def _has_fts(conn):
+    if not get_backend().supports_fts: return False
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_fts'").fetchone()
+    return row is not None
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _match_sql(conn, query, barcode_prefix=True):
+    """
+    生成 “匹配的药库条目 + 排名” 子查询: SELECT barcode, score (score 越小越相关)
+    条码前缀命中排最前 (barcode_prefix=False 时不按条码前缀匹配)；文本优先走 FTS，短词或无 FTS 时回退为 LIKE
+    每个部分只用一个参数，用 {p} 占位，最后按顺序编号为 ?1, ?2 ...
+    """
+    parts = []
+
+    # 1. 条码前缀 (区分大小写才能走索引：SQLite 用 GLOB，PostgreSQL 的 LIKE 本身区分大小写)
+    if barcode_prefix and query.isascii() and query.isalnum():
+        op, pattern = ("GLOB", f"{query}*") if get_backend().name == "sqlite" else ("LIKE", f"{query}%")
+        parts.append((f"SELECT barcode, -1e9 AS score FROM medicine_catalog WHERE barcode {op} {{p}}", pattern))
+
+    # 2. 文本匹配 (FTS 的 rank 列即 bm25，列权重在建表迁移中配置)
+    if len(query) >= _MIN_FTS_LEN and _has_fts(conn):
+        # 整体作为短语匹配，避免用户输入被当作 FTS 语法
+        phrase = '"' + query.replace('"', '""') + '"'
+        parts.append(("""
+            SELECT c.barcode, catalog_fts.rank AS score
+            FROM catalog_fts JOIN medicine_catalog c ON c.fts_id = catalog_fts.rowid
+            WHERE catalog_fts MATCH {p}
+        """, phrase))
+    else:
+        parts.append(("""
+            SELECT barcode,
+                   CASE WHEN name LIKE {p} ESCAPE '\\' THEN 0
+                        WHEN tags LIKE {p} ESCAPE '\\' THEN 1
+                        ELSE 2 END AS score
+            FROM medicine_catalog
+            WHERE name LIKE {p} ESCAPE '\\' OR tags LIKE {p} ESCAPE '\\'
+               OR manufacturer LIKE {p} ESCAPE '\\' OR indications LIKE {p} ESCAPE '\\'
+        """, f"%{_escape_like(query)}%"))
+        # 标签完全相同的排在标签子串命中之前 (“感冒” 优先于只标了 “感冒灵” 的药)
+        parts.append(("""
+            SELECT ct.barcode, 0.5 AS score
+            FROM catalog_tags ct JOIN tags t ON t.id = ct.tag_id
+            WHERE t.name = {p}
+        """, query))
+
+    union = " UNION ALL ".join(sql.format(p=f"?{n}") for n, (sql, _) in enumerate(parts, start=1))
+    params = [value for _, value in parts]
+    return f"SELECT barcode, MIN(score) AS score FROM ({union}) GROUP BY barcode", params
+
+@timed
+def search_catalog(query, limit=None, barcode_prefix=True):
+    """
+    搜索公共药库 (药名/厂商/标签/适应症/条码前缀)
+    返回按相关度排序的条码列表；barcode_prefix=False 时只按文本匹配
+    """
+    query = (query or "").strip()
+    if not query: return []
+    with borrow_connection() as conn:
+        match_sql, params = _match_sql(conn, query, barcode_prefix)
+        sql = f"""
+        SELECT m.barcode FROM ({match_sql}) m
+        JOIN medicine_catalog c ON c.barcode = m.barcode
+        ORDER BY m.score, c.is_standard DESC, c.name
+        """
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [r['barcode'] for r in conn.execute(sql, params)]
+
+@timed
+def search_inventory(query, owner=None, household_id=DEFAULT_HOUSEHOLD_ID):
+    """
+    搜索本家庭的库存：命中药库信息 (同 search_catalog) 或归属人完全相同
+    owner 不为空时只在该归属人的库存里找
+    返回库存 id 列表 (按相关度、过期日期排序)
+    """
+    query = (query or "").strip()
+    if not query: return []
+    with borrow_connection() as conn:
+        match_sql, params = _match_sql(conn, query)
+        n = len(params)
+        sql = f"""
+        SELECT i.id FROM inventory i
+        LEFT JOIN ({match_sql}) m ON m.barcode = i.barcode
+        WHERE i.household_id = ?{n + 1} AND (m.barcode IS NOT NULL OR i.owner = ?{n + 2})
+        """
+        params += [household_id, query]
+        if owner:
+            sql += f" AND i.owner = ?{n + 3}"
+            params.append(owner)
+        sql += " ORDER BY COALESCE(m.score, 0), i.expiry_date"
+        return [r['id'] for r in conn.execute(sql, params)]
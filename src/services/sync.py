@@ -0,0 +1,361 @@
+# src/services/sync.py
+"""
+实例之间的增量同步 (基于 database 的变更日志 change_log)
+- 拉取: 对方按游标 (上次同步到的 seq) 返回之后的变化，每批最多 SYNC_BATCH 条，
+  只读变更日志的索引区间和变化行本身，成本与变化量成正比，与库的大小无关
+- 推送: 把本地游标之后、不是对方产生的变化发过去，对方用同样的规则应用
+- 冲突 “后写为准”: 比较 (是否官方条目, changed_at, origin)，官方条目不会被用户数据覆盖，
+  同一时刻的修改按实例 id 决出固定的胜者，两边最终一致
+- 游标按对方实例 id 记在 app_meta (sync_pull:<id> / sync_push:<id>)，与写入在同一事务里提交
+用法:
+  python -m src.services.sync --peer data/other.db
+  python -m src.services.sync --peer http://192.168.1.20:8000 --household 1 --remote-household 2
+  (远端的同步接口需要访问令牌：--token 或环境变量 HOMEMEDS_API_TOKEN)
+"""
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import date
+from src.database import (borrow_connection, write_transaction, open_sqlite_db, get_meta, set_meta,
+                          bump_catalog_version, sync_catalog_tags, set_change_origin, clear_change_origin,
+                          CHANGE_TABLES, SYNC_COLUMNS, DEFAULT_HOUSEHOLD_ID)
+from src.services.alerts import refresh_expiry_buckets
+from src.metrics import timed
+
+UPSERT, DELETE = "upsert", "delete"
+SYNC_BATCH = 500
+MAX_SYNC_BATCH = 5000
+
+_ORDER = {table: n for n, table in enumerate(CHANGE_TABLES)}
+
+def instance_id(conn):
+    return get_meta(conn, "instance_id")
+
+def head_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+# === 1. 读取变化 ===
+
+def _begin_snapshot(conn):
+    """日志和行在同一个快照里读，读到的行内容与日志记录的时间对得上"""
+    if isinstance(conn, sqlite3.Connection):
+        conn.execute("BEGIN")
+    else:
+        conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+def _plain(value):
+    # PostgreSQL 返回 date，统一成 ISO 字符串，与 SQLite 一致也能直接转 JSON
+    return value.isoformat() if isinstance(value, date) else value
+
+def _load_rows(conn, entries):
+    """按表分批取出变化行的当前内容: (表, 家庭, 行键) -> 行 dict"""
+    rows, by_table = {}, {}
+    for e in entries:
+        by_table.setdefault(e["tbl"], []).append(e["row_key"])
+    for table, keys in by_table.items():
+        key, partitioned = CHANGE_TABLES[table]
+        columns = SYNC_COLUMNS[table] + (("household_id",) if partitioned else ())
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for r in conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {key} IN ({marks})", chunk):
+                row = {c: _plain(r[c]) for c in SYNC_COLUMNS[table]}
+                rows[(table, r["household_id"] if partitioned else 0, r[key])] = row
+    return rows
+
+def changes_since(conn, cursor=0, exclude_origin=None, household_id=None, limit=SYNC_BATCH):
+    """
+    游标之后的变化 (按 seq 排序)，返回 {"origin", "cursor", "more", "changes"}
+    下次从返回的 cursor 继续；more 为 True 表示还有下一批
+    household_id: 只要这个家庭的库存/成员 (药库不分家庭，总是带上)
+    exclude_origin: 不返回该实例产生的变化 (推送时不把对方的变化再送回去)
+    """
+    _begin_snapshot(conn)
+    try:
+        head = head_seq(conn)
+        where, params = "WHERE seq > ? AND seq <= ?", [cursor, head]
+        if household_id is not None:
+            where, params = where + " AND household_id IN (0, ?)", params + [household_id]
+        if exclude_origin:
+            where, params = where + " AND origin <> ?", params + [exclude_origin]
+        entries = conn.execute(
+            f"SELECT seq, tbl, household_id, row_key, op, standard, changed_at, origin FROM change_log "
+            f"{where} ORDER BY seq LIMIT ?", params + [limit]).fetchall()
+        rows = _load_rows(conn, [e for e in entries if e["op"] == UPSERT])
+        origin = instance_id(conn)
+    finally:
+        conn.rollback()
+    more = len(entries) == limit
+    changes = []
+    for e in entries:
+        row = rows.get((e["tbl"], e["household_id"], e["row_key"]))
+        if e["op"] == UPSERT and row is None:
+            continue
+        changes.append({"seq": e["seq"], "table": e["tbl"], "household_id": e["household_id"],
+                        "key": e["row_key"], "op": e["op"], "standard": e["standard"],
+                        "changed_at": e["changed_at"], "origin": e["origin"], "row": row})
+    return {"origin": origin, "cursor": entries[-1]["seq"] if more else head, "more": more, "changes": changes}
+
+# === 2. 应用对方的变化 ===
+
+def _validate(change):
+    if change.get("table") not in CHANGE_TABLES or change.get("op") not in (UPSERT, DELETE):
+        raise ValueError(f"无法识别的变化: {change.get('table')} / {change.get('op')}")
+    if not change.get("key") or not change.get("changed_at") or not change.get("origin"):
+        raise ValueError("变化缺少 key / changed_at / origin")
+    if change["op"] == UPSERT:
+        missing = [c for c in SYNC_COLUMNS[change["table"]] if c not in (change.get("row") or {})]
+        if missing:
+            raise ValueError(f"{change['table']} 的变化缺少字段: {', '.join(missing)}")
+
+def _standard(change):
+    row = change.get("row") or {}
+    return int(row.get("is_standard", change.get("standard")) or 0)
+
+def _incoming_wins(conn, change, household_id):
+    """后写为准：(是否官方条目, changed_at, origin) 大的一方胜出；本地没有记录的行视为最旧"""
+    table, key = change["table"], change["key"]
+    local = conn.execute("SELECT standard, changed_at, origin FROM change_log "
+                         "WHERE tbl = ? AND household_id = ? AND row_key = ?", (table, household_id, key)).fetchone()
+    mine = (local["standard"], local["changed_at"], local["origin"]) if local else (0, "", "")
+    if table == "medicine_catalog":
+        # 官方条目由种子导入，不在日志里，以药库里的 is_standard 为准
+        row = conn.execute("SELECT is_standard FROM medicine_catalog WHERE barcode = ?", (key,)).fetchone()
+        if row: mine = (int(row["is_standard"] or 0),) + mine[1:]
+    return (_standard(change), change["changed_at"], change["origin"]) > mine
+
+def _upsert_sql(table, columns, conflict, updates):
+    assignments = ", ".join(f"{c} = excluded.{c}" for c in updates)
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT({conflict}) DO UPDATE SET {assignments}")
+
+def _apply_catalog(conn, change, household_id):
+    if change["op"] == DELETE:
+        # 仍被库存引用的药品不能删 (外键)，留给本地处理
+        if conn.execute("SELECT 1 FROM inventory WHERE barcode = ? LIMIT 1", (change["key"],)).fetchone():
+            return False
+        conn.execute("DELETE FROM medicine_catalog WHERE barcode = ?", (change["key"],))
+        return True
+    columns = SYNC_COLUMNS["medicine_catalog"]
+    conn.execute(_upsert_sql("medicine_catalog", columns, "barcode", columns[1:]),
+                 [change["row"][c] for c in columns])
+    return True
+
+def _apply_member(conn, change, household_id):
+    if change["op"] == DELETE:
+        conn.execute("DELETE FROM family_members WHERE household_id = ? AND name = ?", (household_id, change["key"]))
+        return True
+    conn.execute(_upsert_sql("family_members", ("household_id", "name", "is_default"),
+                             "household_id, name", ("is_default",)),
+                 (household_id, change["key"], change["row"]["is_default"]))
+    return True
+
+def _apply_inventory(conn, change, household_id):
+    if change["op"] == DELETE:
+        conn.execute("DELETE FROM inventory WHERE uid = ?", (change["key"],))
+        return True
+    row = change["row"]
+    # 药品条目还没同步过来 (或被本地删除) 时不能写入库存 (外键)
+    if not conn.execute("SELECT 1 FROM medicine_catalog WHERE barcode = ?", (row["barcode"],)).fetchone():
+        return False
+    columns = ("household_id",) + SYNC_COLUMNS["inventory"]
+    inventory_id = conn.execute(_upsert_sql("inventory", columns, "uid", [c for c in columns if c != "uid"])
+                                + " RETURNING id", [household_id] + [row[c] for c in columns[1:]]).fetchone()[0]
+    return inventory_id
+
+_APPLY = {"medicine_catalog": _apply_catalog, "family_members": _apply_member, "inventory": _apply_inventory}
+
+def apply_changes(conn, changes, household_id=None):
+    """
+    在调用方的事务里应用对方的变化 (不提交)，返回 {"applied", "skipped", "rejected", "catalog"}
+    household_id: 对方的库存/成员写入本地哪个家庭；None 表示沿用对方的家庭编号
+    skipped 为本地更新 (或相同) 的变化，rejected 为违反外键而放弃的变化
+    """
+    for change in changes:
+        _validate(change)
+    local_households = {household_id or c["household_id"] for c in changes if CHANGE_TABLES[c["table"]][1]}
+    for hh in local_households:
+        if not conn.execute("SELECT 1 FROM households WHERE id = ?", (hh,)).fetchone():
+            raise ValueError(f"本地没有编号为 {hh} 的家庭")
+
+    # 新增/修改按 药库 -> 成员 -> 库存 的顺序 (库存引用药库条码)，删除反过来
+    upserts = sorted((c for c in changes if c["op"] == UPSERT), key=lambda c: _ORDER[c["table"]])
+    deletes = sorted((c for c in changes if c["op"] == DELETE), key=lambda c: -_ORDER[c["table"]])
+    stats = {"applied": 0, "skipped": 0, "rejected": 0, "catalog": 0}
+    retag, inventory_ids = [], []
+    for change in upserts + deletes:
+        table = change["table"]
+        hh = (household_id or change["household_id"]) if CHANGE_TABLES[table][1] else 0
+        if not _incoming_wins(conn, change, hh):
+            stats["skipped"] += 1
+            continue
+        # 触发器用对方的 origin / changed_at 记日志：再同步给第三方时时间戳不变
+        set_change_origin(conn, change["origin"], change["changed_at"])
+        result = _APPLY[table](conn, change, hh)
+        if result is False:
+            stats["rejected"] += 1
+            continue
+        # 内容与本地相同的写入不会触发记录，这里补上对方的时间戳，避免下次又把旧记录推回给对方
+        conn.execute("UPDATE change_log SET standard = ?, changed_at = ?, origin = ? "
+                     "WHERE tbl = ? AND household_id = ? AND row_key = ?",
+                     (_standard(change), change["changed_at"], change["origin"], table, hh, change["key"]))
+        stats["applied"] += 1
+        if table == "medicine_catalog":
+            stats["catalog"] += 1
+            retag.append(change["key"])
+        elif table == "inventory" and change["op"] == UPSERT:
+            inventory_ids.append(result)
+    clear_change_origin(conn)
+    if retag:
+        sync_catalog_tags(conn, retag)
+    for start in range(0, len(inventory_ids), 500):
+        refresh_expiry_buckets(conn, date.today().isoformat(), inventory_ids=inventory_ids[start:start + 500])
+    return stats
+
+# === 3. 服务入口 (API 与同步任务共用) ===
+
+@timed
+def sync_info():
+    """本实例的 id 与变更日志的最新 seq"""
+    with borrow_connection() as conn:
+        return {"instance_id": instance_id(conn), "head": head_seq(conn)}
+
+@timed
+def read_changes(cursor=0, exclude_origin=None, household_id=None, limit=SYNC_BATCH):
+    with borrow_connection() as conn:
+        return changes_since(conn, cursor, exclude_origin, household_id, limit)
+
+@timed
+def apply_remote_changes(changes, household_id=None):
+    """在一个写事务里应用一批变化并提交，药库有变化时使条码缓存失效"""
+    with write_transaction() as conn:
+        stats = apply_changes(conn, changes, household_id)
+    if stats["catalog"]:
+        bump_catalog_version()
+    return stats
+
+# === 4. 同步对象 ===
+
+class LocalPeer:
+    """另一个本地 SQLite 文件 (离线拷贝、两个实例之间的测试)"""
+
+    def __init__(self, db_path):
+        # 对方文件可能还不存在 (第一次同步到新拷贝)：完整初始化，与本实例的 init_db 相同
+        self.conn = open_sqlite_db(db_path)
+
+    def info(self):
+        return {"instance_id": instance_id(self.conn), "head": head_seq(self.conn)}
+
+    def pull(self, cursor, exclude_origin=None, household_id=None, limit=SYNC_BATCH):
+        return changes_since(self.conn, cursor, exclude_origin, household_id, limit)
+
+    def push(self, changes, household_id=None):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            stats = apply_changes(self.conn, changes, household_id)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return stats
+
+    def close(self):
+        self.conn.close()
+
+class HttpPeer:
+    """远端实例的 REST API (src/api.py 的 /api/sync)"""
+
+    def __init__(self, base_url, token=None, timeout=30.0):
+        import httpx
+        token = token or os.environ.get("HOMEMEDS_API_TOKEN")
+        headers = {"Authorization": f"Bearer {token}"} if token else None
+        self.client = httpx.Client(base_url=base_url.rstrip("/"), headers=headers, timeout=timeout)
+
+    def _json(self, response):
+        response.raise_for_status()
+        return response.json()
+
+    def info(self):
+        return self._json(self.client.get("/api/sync"))
+
+    def pull(self, cursor, exclude_origin=None, household_id=None, limit=SYNC_BATCH):
+        params = {"since": cursor, "exclude_origin": exclude_origin, "household_id": household_id, "limit": limit}
+        return self._json(self.client.get("/api/sync/changes",
+                                          params={k: v for k, v in params.items() if v is not None}))
+
+    def push(self, changes, household_id=None):
+        return self._json(self.client.post("/api/sync/changes",
+                                           json={"changes": changes, "household_id": household_id}))
+
+    def close(self):
+        self.client.close()
+
+def create_peer(target, token=None):
+    """http(s):// 开头为远端实例 (token 为其访问令牌)，否则视为本地 SQLite 文件路径"""
+    if target.startswith(("http://", "https://")):
+        return HttpPeer(target, token)
+    return LocalPeer(target)
+
+@timed
+def sync_with(peer, household_id=DEFAULT_HOUSEHOLD_ID, remote_household_id=None):
+    """
+    与对方双向同步一个家庭：先拉取再推送，返回 {"pulled": 统计, "pushed": 统计}
+    remote_household_id: 对方对应的家庭编号 (默认与本地相同)
+    """
+    remote_household_id = remote_household_id or household_id
+    remote = peer.info()["instance_id"]
+    with borrow_connection() as conn:
+        me = instance_id(conn)
+        pull_cursor = int(get_meta(conn, f"sync_pull:{remote}", 0))
+        push_cursor = int(get_meta(conn, f"sync_push:{remote}", 0))
+    if remote == me:
+        raise ValueError("不能与本实例自己同步")
+
+    pulled = {"applied": 0, "skipped": 0, "rejected": 0, "catalog": 0}
+    while True:
+        # 网络请求不放在写事务里，避免长时间占住写锁
+        batch = peer.pull(pull_cursor, exclude_origin=me, household_id=remote_household_id)
+        with write_transaction() as conn:
+            stats = apply_changes(conn, batch["changes"], household_id)
+            set_meta(conn, f"sync_pull:{remote}", str(batch["cursor"]))
+        pulled = {k: pulled[k] + stats[k] for k in pulled}
+        pull_cursor = batch["cursor"]
+        if not batch["more"]: break
+    if pulled["catalog"]:
+        bump_catalog_version()
+
+    pushed = {"applied": 0, "skipped": 0, "rejected": 0, "catalog": 0}
+    while True:
+        batch = read_changes(push_cursor, exclude_origin=remote, household_id=household_id)
+        if batch["changes"]:
+            stats = peer.push(batch["changes"], remote_household_id)
+            pushed = {k: pushed[k] + stats[k] for k in pushed}
+        # 推送成功后才前移游标；中途失败下次会重发，对方按 “后写为准” 跳过已有的变化
+        with write_transaction() as conn:
+            set_meta(conn, f"sync_push:{remote}", str(batch["cursor"]))
+        push_cursor = batch["cursor"]
+        if not batch["more"]: break
+    return {"pulled": pulled, "pushed": pushed}
+
+def main(argv=None):
+    from src.database import ensure_db_ready
+    parser = argparse.ArgumentParser(description="与另一个家庭药箱实例增量同步")
+    parser.add_argument("--peer", required=True, help="对方的 SQLite 文件路径或 http(s):// 地址")
+    parser.add_argument("--household", type=int, default=DEFAULT_HOUSEHOLD_ID, help="本地家庭编号")
+    parser.add_argument("--remote-household", type=int, default=None, help="对方家庭编号 (默认与本地相同)")
+    parser.add_argument("--token", default=None, help="远端 API 的访问令牌 (默认取 HOMEMEDS_API_TOKEN)")
+    args = parser.parse_args(argv)
+
+    ensure_db_ready()
+    peer = create_peer(args.peer, args.token)
+    try:
+        result = sync_with(peer, args.household, args.remote_household)
+    finally:
+        peer.close()
+    print(f"🔄 拉取: {result['pulled']}")
+    print(f"🔄 推送: {result['pushed']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# src/services/tags.py
+"""
+标签分面：统计与筛选只走规范化的标签表 (tags / catalog_tags，由 database.sync_catalog_tags 维护)
+- 标签精确匹配：筛选 “感冒” 不会带出只标了 “感冒灵” 的药
+- 多个标签取交集 (同时具有)：每个标签在 catalog_tags 主键上是一段连续索引，用 INTERSECT 求交
+传给带缓存函数的标签参数统一先用 normalize_tags 转成元组 (可哈希、顺序固定)
+"""
+from src.database import borrow_connection, split_tags, DEFAULT_HOUSEHOLD_ID
+from src.services.cache import cached_by_data_version
+from src.metrics import timed
+
+def normalize_tags(tags):
+    """标签原文字符串或列表 -> 去重后的标签元组"""
+    if not tags: return ()
+    if isinstance(tags, str): return tuple(split_tags(tags))
+    return tuple(dict.fromkeys(t for tag in tags for t in split_tags(tag)))
+
+def tag_filter_sql(tags):
+    """
+    “同时具有这些标签的条码” 子查询，返回 (sql, params)；没有标签时返回 (None, [])
+    用法: ... WHERE barcode IN ({sql})，占位符是不带编号的 ?
+    """
+    tags = normalize_tags(tags)
+    if not tags: return None, []
+    part = "SELECT ct.barcode FROM catalog_tags ct JOIN tags t ON t.id = ct.tag_id WHERE t.name = ?"
+    return " INTERSECT ".join([part] * len(tags)), list(tags)
+
+def _facets(conn, counts_sql, params, limit):
+    sql = f"SELECT t.name, f.n FROM ({counts_sql}) f JOIN tags t ON t.id = f.tag_id ORDER BY f.n DESC, t.name"
+    if limit: sql += f" LIMIT {int(limit)}"
+    return [(name, n) for name, n in conn.execute(sql, params)]
+
+@timed
+@cached_by_data_version
+def catalog_tag_facets(tags=(), limit=None):
+    """
+    公共药库各标签的条目数 [(标签, 数量)]，按数量倒序
+    tags 不为空时只统计同时具有这些标签的条目 (即继续筛选后每个标签还剩多少)
+    """
+    filter_sql, params = tag_filter_sql(tags)
+    counts_sql = "SELECT tag_id, COUNT(*) AS n FROM catalog_tags"
+    if filter_sql: counts_sql += f" WHERE barcode IN ({filter_sql})"
+    with borrow_connection() as conn:
+        return _facets(conn, counts_sql + " GROUP BY tag_id", params, limit)
+
+@timed
+@cached_by_data_version
+def inventory_tag_facets(household_id=DEFAULT_HOUSEHOLD_ID, tags=(), owner=None, limit=None):
+    """本家庭库存各标签的条数 [(标签, 数量)]，可按归属人、已选标签缩小范围"""
+    where, params = "WHERE i.household_id = ?", [household_id]
+    if owner:
+        where, params = where + " AND i.owner = ?", params + [owner]
+    filter_sql, tag_params = tag_filter_sql(tags)
+    if filter_sql:
+        where, params = where + f" AND i.barcode IN ({filter_sql})", params + tag_params
+    # 先按条码聚合库存条数 (走 household_id + barcode 复合索引)，再按条码关联标签，
+    # 同一种药有多条库存时只查一次标签
+    counts_sql = (f"SELECT ct.tag_id, CAST(SUM(i.n) AS INTEGER) AS n "
+                  f"FROM (SELECT i.barcode, COUNT(*) AS n FROM inventory i {where} GROUP BY i.barcode) i "
+                  f"JOIN catalog_tags ct ON ct.barcode = i.barcode GROUP BY ct.tag_id")
+    with borrow_connection() as conn:
+        return _facets(conn, counts_sql, params, limit)
+
+@timed
+@cached_by_data_version
+def barcodes_with_tags(tags):
+    """同时具有这些标签的条码集合 (搜索结果再按标签过滤时用)"""
+    filter_sql, params = tag_filter_sql(tags)
+    if not filter_sql: return frozenset()
+    with borrow_connection() as conn:
+        return frozenset(r[0] for r in conn.execute(filter_sql, params))
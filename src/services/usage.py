@@ -0,0 +1,130 @@
+# src/services/usage.py
+"""
+库存变动台账、每日用量汇总与用完时间预测
+- inventory_ledger: 只追加的数量变动记录，与数量修改在同一事务里写入 (record_change)
+- consumption_daily: 按 (家庭, 条码, 归属人, 日期) 汇总的用量 (数量减少都计入，
+  液体/药膏是用 “修正” 记录用量的)，按台账 id 高水位增量汇总，
+  由后台任务定期执行，读预测前也会补一次 (只处理新增的台账行)
+- 预测只读汇总表：日均用量 = 近 N 天用量 / 有记录的天数，剩余天数 = 同药同人库存合计 / 日均用量
+看板永远不扫描原始台账，台账增长到百万行也不影响页面
+"""
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from src.database import borrow_connection, write_transaction, is_sqlite, get_meta, set_meta, DEFAULT_HOUSEHOLD_ID
+from src.services.cache import cached_by_data_version
+from src.metrics import timed
+
+DOSE, ADJUST, SET = "dose", "adjust", "set"
+FORECAST_WINDOW_DAYS = 30
+
+_META_KEY = "ledger_rollup_id"
+
+def record_change(conn, inventory_id, household_id, barcode, owner, delta, quantity_after, kind):
+    """写一条台账 (不提交，由调用方放在修改数量的同一事务里)；数量没变则不记"""
+    if not delta: return
+    conn.execute(
+        "INSERT INTO inventory_ledger (inventory_id, household_id, barcode, owner, kind, delta, quantity_after, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (inventory_id, household_id, barcode, owner, kind, delta, quantity_after,
+         datetime.now().isoformat(sep=" ", timespec="seconds")))
+
+def _pending_range(conn):
+    """(已汇总到的台账 id, 当前最大台账 id)，两次主键查找"""
+    last = int(get_meta(conn, _META_KEY, 0))
+    upto = conn.execute("SELECT MAX(id) FROM inventory_ledger").fetchone()[0] or 0
+    return last, upto
+
+@timed
+def rollup_consumption():
+    """
+    把高水位之后的新台账累加进 consumption_daily，返回本次处理的台账 id 跨度
+    没有新台账时只做两次主键查找，不开写事务 (也就不会让读缓存失效)
+    """
+    with borrow_connection() as conn:
+        last, upto = _pending_range(conn)
+    if upto <= last:
+        return 0
+    with write_transaction() as conn:
+        if not is_sqlite():
+            # 等正在写台账的事务提交，避免未提交的较小 id 被高水位跳过；同时让并发汇总排队
+            conn.execute("LOCK TABLE inventory_ledger IN SHARE ROW EXCLUSIVE MODE")
+        last, upto = _pending_range(conn)
+        if upto <= last:
+            return 0
+        conn.execute("""
+        INSERT INTO consumption_daily (household_id, barcode, owner, day, consumed, doses)
+        SELECT household_id, barcode, COALESCE(owner, ''), DATE(created_at), SUM(-delta), COUNT(*)
+        FROM inventory_ledger
+        WHERE id > ? AND id <= ? AND delta < 0
+        GROUP BY household_id, barcode, COALESCE(owner, ''), DATE(created_at)
+        ON CONFLICT (household_id, barcode, owner, day) DO UPDATE SET
+            consumed = consumption_daily.consumed + excluded.consumed,
+            doses = consumption_daily.doses + excluded.doses
+        """, (last, upto))
+        set_meta(conn, _META_KEY, str(upto))
+    return upto - last
+
+def forecast_runout(stock, rates, today, window_days=FORECAST_WINDOW_DAYS):
+    """
+    向量化预测 (不逐行循环)
+    stock: DataFrame[barcode, owner, quantity]  同药同人的库存合计
+    rates: DataFrame[barcode, owner, consumed, first_day]  近 window_days 天的用量汇总
+    返回 stock 加上 daily_rate / days_until_empty 两列，没有用量记录的为 NaN
+    """
+    df = stock.merge(rates, on=["barcode", "owner"], how="left")
+    first_day = pd.to_datetime(df["first_day"])
+    # 刚开始记录的药按实际有记录的天数算日均，避免被窗口长度摊薄
+    observed = (pd.Timestamp(today) - first_day).dt.days.to_numpy(dtype=float) + 1
+    observed = np.clip(np.nan_to_num(observed, nan=window_days), 1, window_days)
+    rate = df["consumed"].to_numpy(dtype=float) / observed
+    df["daily_rate"] = np.where(rate > 0, rate, np.nan)
+    df["days_until_empty"] = df["quantity"].to_numpy(dtype=float) / df["daily_rate"].to_numpy()
+    return df.drop(columns=["consumed", "first_day"])
+
+@cached_by_data_version
+def _load_forecast(today_iso, household_id, window_days):
+    since = (date.fromisoformat(today_iso) - timedelta(days=window_days - 1)).isoformat()
+    with borrow_connection() as conn:
+        rates = pd.DataFrame(
+            [tuple(r) for r in conn.execute(
+                "SELECT barcode, owner, SUM(consumed), MIN(day) FROM consumption_daily "
+                "WHERE household_id = ? AND day >= ? GROUP BY barcode, owner", (household_id, since))],
+            columns=["barcode", "owner", "consumed", "first_day"])
+        stock = pd.DataFrame(
+            [tuple(r) for r in conn.execute(
+                "SELECT barcode, COALESCE(owner, ''), SUM(quantity_val) FROM inventory "
+                "WHERE household_id = ? GROUP BY barcode, COALESCE(owner, '')", (household_id,))],
+            columns=["barcode", "owner", "quantity"])
+    rates["first_day"] = rates["first_day"].astype(str)
+    return forecast_runout(stock, rates, date.fromisoformat(today_iso), window_days)
+
+@timed
+def get_usage_forecast(household_id=DEFAULT_HOUSEHOLD_ID, window_days=FORECAST_WINDOW_DAYS):
+    """
+    每种药 (条码 + 归属人) 的日均用量与预计用完天数
+    返回 DataFrame[barcode, owner, quantity, daily_rate, days_until_empty] (带版本缓存)
+    """
+    rollup_consumption()
+    return _load_forecast(date.today().isoformat(), household_id, window_days)
+
+@timed
+def attach_usage_forecast(df, household_id=DEFAULT_HOUSEHOLD_ID):
+    """给库存 DataFrame 按 (条码, 归属人) 合并 daily_rate / days_until_empty 两列"""
+    if df.empty: return df
+    forecast = get_usage_forecast(household_id)[["barcode", "owner", "daily_rate", "days_until_empty"]]
+    keys = df[["barcode"]].assign(owner=df["owner"].fillna(""))
+    merged = keys.merge(forecast, on=["barcode", "owner"], how="left")
+    df = df.copy()
+    df["daily_rate"] = merged["daily_rate"].to_numpy()
+    df["days_until_empty"] = merged["days_until_empty"].to_numpy()
+    return df
+
+@timed
+def get_item_history(inventory_id, limit=50):
+    """单条库存最近的变动记录 (详情页用，走 inventory_id 索引，只取最近 limit 条)"""
+    with borrow_connection() as conn:
+        rows = conn.execute(
+            "SELECT kind, delta, quantity_after, created_at FROM inventory_ledger "
+            "WHERE inventory_id = ? ORDER BY id DESC LIMIT ?", (inventory_id, limit)).fetchall()
+        return [dict(r) for r in rows]
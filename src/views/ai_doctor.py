@@ -1,9 +1,10 @@
 # src/views/ai_doctor.py
 import streamlit as st
-from openai import OpenAI
-from src.services.ai_service import get_inventory_str_for_ai
+from src.services.ai_service import get_inventory_str_for_ai, stream_chat
+from src.metrics import timed
 
-def show_ai_doctor():
+@timed(kind="view")
+def show_ai_doctor(household_id):
     st.header("🤖 AI 药剂师")
     if 'api_key' not in st.session_state: st.warning("请在侧边栏设置 API Key"); return
     
@@ -14,17 +15,14 @@ def show_ai_doctor():
         st.session_state.messages.append({"role":"user", "content":prompt})
         st.chat_message("user").write(prompt)
         
-        ctx = get_inventory_str_for_ai()
-        sys = f"基于库存回答。库存：\n{ctx}"
+        ctx = get_inventory_str_for_ai(prompt, household_id=household_id)
         
-        client = OpenAI(api_key=st.session_state['api_key'], base_url=st.session_state['api_base'])
         try:
-            stream = client.chat.completions.create(
-                model="deepseek-chat", 
-                messages=[{"role":"system","content":sys},{"role":"user","content":prompt}], 
-                stream=True
+            stream = stream_chat(
+                st.session_state['api_key'], st.session_state['api_base'], prompt, ctx,
+                use_cache=st.session_state.get('ai_cache', True)
             )
             resp = st.write_stream(stream)
             st.session_state.messages.append({"role":"assistant", "content":resp})
         except Exception as e:
-            st.error(str(e))
\ No newline at end of file
+            st.error(str(e))
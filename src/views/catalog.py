@@ -1,8 +1,12 @@
 # src/views/catalog.py
 
+import html
+import functools
 import streamlit as st
-import pandas as pd
-from src.services.catalog import load_catalog_data, upsert_catalog_item, delete_catalog_item
+from src.database import split_tags
+from src.services.catalog import load_catalog_page, upsert_catalog_item, delete_catalog_item
+from src.views.pagination import render_pager
+from src.metrics import timed
 
 # === 0. 辅助样式: 渲染漂亮的标签 (CSS) ===
 def render_custom_css():
@@ -49,18 +53,10 @@ def render_custom_css():
     </style>
     """, unsafe_allow_html=True)
 
+@functools.lru_cache(maxsize=4096)
 def render_tags_html(tags_str):
-    """将空格分隔的字符串转换为 HTML 标签组"""
-    if not tags_str: 
-        return ""
-    # 分割并过滤空字符
-    tags = [t.strip() for t in tags_str.split() if t.strip()]
-    if not tags: return ""
-    
-    html = ""
-    for t in tags:
-        html += f'<span class="med-tag">{t}</span>'
-    return html
+    """将标签原文转换为 HTML 标签组 (拆分规则与标签索引一致，按原文缓存)"""
+    return "".join(f'<span class="med-tag">{html.escape(t)}</span>' for t in split_tags(tags_str))
 
 # === 1. 定义弹窗组件 (Dialog) ===
 @st.dialog("💊 药品详情档案", width="large")
@@ -115,32 +111,35 @@ def show_detail_modal(item):
 
 
 # === 2. 主视图函数 ===
+@timed(kind="view")
 def show_catalog(dev_mode):
     # 注入 CSS
     render_custom_css()
     
     st.header("📖 药品知识库")
     
-    # 加载数据
-    df = load_catalog_data()
-    if df.empty:
-        st.info("公共药库是空的，请去【药品操作】录入新药。")
-        return
-
     # 搜索框
     search_term = st.text_input("🔍 搜索药库 (支持药名/厂商/条码/标签)", placeholder="输入关键字快速查找...")
-    if search_term:
-        mask = df.astype(str).apply(lambda x: x.str.contains(search_term, case=False)).any(axis=1)
-        df = df[mask]
 
-    st.caption(f"共找到 {len(df)} 种药品")
+    # 只加载当前页 (搜索走全文索引，按相关度排序)
+    # 先按上次的页码取数拿到总条数，翻页/页码被收回时再取一次 (结果带版本缓存)
+    page_state = st.session_state.get("cat_pager_page", 1) - 1
+    page_size = st.session_state.get("cat_pager_size", 24)
+    rows, total = load_catalog_page(page_state, page_size, search_term or None)
+    if total == 0 and not search_term:
+        st.info("公共药库是空的，请去【药品操作】录入新药。")
+        return
+
+    page, page_size = render_pager(total, key="cat_pager")
+    if page != page_state:
+        rows, total = load_catalog_page(page, page_size, search_term or None)
 
     # === 卡片网格布局 (Responsive Grid Simulation) ===
     # 为了更紧凑，我们使用 4 列布局
     COLS_PER_ROW = 4
     cols = st.columns(COLS_PER_ROW)
 
-    for index, row in df.iterrows():
+    for index, row in enumerate(rows):
         col_idx = index % COLS_PER_ROW
         with cols[col_idx]:
             # 创建带边框的卡片容器
@@ -202,13 +201,13 @@ def show_catalog(dev_mode):
     
     with st.expander("点击展开编辑表单"):
         opts = {}
-        for _, r in df.iterrows():
+        for r in rows:
             tag = "🔒官方" if r['is_standard'] else "👤用户"
             manuf = r['manufacturer'] if r['manufacturer'] else "未知"
             label = f"[{tag}] {r['name']} ({manuf}) - {r['barcode']}"
             opts[label] = r 
         
-        selected_label = st.selectbox("选择要编辑的药品", list(opts.keys()), index=None)
+        selected_label = st.selectbox("选择要编辑的药品 (当前页)", list(opts.keys()), index=None)
 
         if selected_label:
             item = opts[selected_label]
@@ -1,10 +1,17 @@
 # src/views/dashboard.py
 
+import html
+import functools
+import numpy as np
 import streamlit as st
 import pandas as pd
-from datetime import date, timedelta
-from src.services.queries import load_data, get_dashboard_metrics
+from src.database import split_tags
+from src.services.queries import load_inventory_page, get_dashboard_metrics, inventory_frame
 from src.services.members import get_all_members
+from src.services.usage import attach_usage_forecast, get_item_history
+from src.services.tags import inventory_tag_facets
+from src.views.pagination import render_pager
+from src.metrics import timed
 
 # === 0. CSS 样式 (复用并微调) ===
 def render_dashboard_css():
@@ -41,21 +48,134 @@ def render_dashboard_css():
     .dash-meta {
         font-size: 0.8rem;
         display: flex;
-        justify_content: space-between;
+        justify-content: space-between;
         align-items: center;
         margin-bottom: 4px;
     }
+    .dash-owner {
+        color: #64748b;
+        background: #f1f5f9;
+        padding: 2px 6px;
+        border-radius: 4px;
+    }
+    /* 卡片网格：每行 4 张，窄屏 2 张 */
+    .dash-grid {
+        display: grid;
+        grid-template-columns: repeat(4, minmax(0, 1fr));
+        gap: 1rem;
+        margin-bottom: 1rem;
+    }
+    @media (max-width: 900px) {
+        .dash-grid { grid-template-columns: repeat(2, minmax(0, 1fr)); }
+    }
+    .dash-card {
+        border: 1px solid rgba(49, 51, 63, 0.2);
+        border-radius: 0.5rem;
+        padding: 0.75rem 1rem;
+    }
+    .dash-row {
+        display: flex;
+        justify-content: space-between;
+        align-items: center;
+        margin-bottom: 8px;
+    }
+    .dash-date {
+        color: #94a3b8;
+        font-size: 0.8rem;
+    }
+    /* 标签栏 (高度统一 32px，超出渐隐) */
+    .dash-tags {
+        margin-top: 4px;
+        height: 32px;
+        overflow: hidden;
+        white-space: nowrap;
+        display: flex;
+        align-items: center;
+        mask-image: linear-gradient(to right, black 80%, transparent 100%);
+        -webkit-mask-image: linear-gradient(to right, black 80%, transparent 100%);
+    }
+    .dash-empty {
+        color: #ccc;
+        font-size: 0.8rem;
+    }
+    /* 预计用完 */
+    .dash-runout {
+        color: #7c3aed;
+        font-size: 0.75rem;
+        margin-left: 6px;
+    }
     </style>
     """, unsafe_allow_html=True)
 
+@functools.lru_cache(maxsize=4096)
 def render_tags_html(tags_str):
-    if not tags_str: return ""
-    tags = [t.strip() for t in tags_str.split() if t.strip()]
-    if not tags: return ""
-    html = ""
-    for t in tags:
-        html += f'<span class="med-tag">{t}</span>'
-    return html
+    """标签 HTML 按药库条目的 tags 字符串缓存，同一种药只拼接一次 (拆分规则与标签索引一致)"""
+    return "".join(f'<span class="med-tag">{html.escape(t)}</span>' for t in split_tags(tags_str))
+
+# 过期分档 -> (图标, 文字颜色, 卡片背景色)
+STATUS_STYLE = {
+    "expired": ("🔴", "#ef4444", "#fef2f2"),
+    "soon": ("🟡", "#f59e0b", "#fffbeb"),
+    "ok": ("🟢", "#10b981", "#ffffff"),
+}
+
+def compute_card_columns(df, today=None):
+    """
+    向量化计算卡片需要的状态列 (不逐行循环)：
+    days_left / bucket / status_text / expiry_label / tags_html / runout_text
+    分档优先取 expiry_buckets 的物化结果，缺失时按天数现算
+    runout_text 来自用量预测 (days_until_empty，见 services.usage)，没有用量记录时为空
+    """
+    today = today if today is not None else pd.Timestamp.today().normalize()
+    df = df.copy()
+    days_left = (df['expiry_date'] - today).dt.days
+    computed = np.select([days_left < 0, days_left <= 90], ["expired", "soon"], "ok")
+    bucket = df['expiry_bucket'].fillna(pd.Series(computed, index=df.index)) if 'expiry_bucket' in df \
+        else pd.Series(computed, index=df.index)
+
+    df['days_left'] = days_left
+    df['bucket'] = bucket
+    df['status_text'] = np.select(
+        [bucket == "expired", bucket == "soon"],
+        ["已过期 " + days_left.abs().astype(str) + "天", "剩 " + days_left.astype(str) + "天"],
+        "正常")
+    df['expiry_label'] = df['expiry_date'].dt.strftime('%Y-%m-%d')
+    # 没有标签的条目是 None，新版 pandas 的字符串列里会变成 NaN
+    df['tags_html'] = df['tags'].fillna('').map(render_tags_html)
+    runout = df['days_until_empty'] if 'days_until_empty' in df else pd.Series(np.nan, index=df.index)
+    df['runout_text'] = np.where(
+        runout.notna(), "≈" + np.ceil(runout.fillna(0)).astype(int).astype(str) + "天用完", "")
+    return df
+
+def build_grid_html(df):
+    """整页卡片拼成一段 HTML (CSS grid)，对 Streamlit 只是一次 markdown 调用"""
+    esc = html.escape
+    cards = []
+    for name, owner, qty, label, bucket, status, tags, runout in zip(
+            df['name'].fillna(''), df['owner'].fillna(''), df['quantity_display'], df['expiry_label'],
+            df['bucket'], df['status_text'], df['tags_html'], df['runout_text']):
+        icon, color, bg = STATUS_STYLE[bucket]
+        runout = f'<span class="dash-runout">{runout}</span>' if runout else ''
+        tags = f'<div class="dash-tags">{tags}</div>' if tags else '<div class="dash-tags dash-empty">无标签</div>'
+        cards.append(
+            f'<div class="dash-card" style="background:{bg};">'
+            f'<div class="dash-meta"><span style="color:{color}; font-weight:bold;">{icon} {status}</span>'
+            f'<span class="dash-owner">👤 {esc(owner)}</span></div>'
+            f'<div class="dash-title" title="{esc(name)}">{esc(name)}</div>'
+            f'<div class="dash-row"><span><span class="dash-qty">{esc(qty)}</span>{runout}</span>'
+            f'<span class="dash-date">{label}</span></div>'
+            f'{tags}</div>')
+    return f'<div class="dash-grid">{"".join(cards)}</div>'
+
+def render_card_grid(df):
+    df = compute_card_columns(df)
+    st.markdown(build_grid_html(df), unsafe_allow_html=True)
+    return df
+
+def _on_pick_detail():
+    # 选择框回调里记下要打开的条目并清空选择，弹窗只打开一次，关闭后可以再次选择同一条
+    st.session_state["dash_detail_open"] = st.session_state.get("dash_detail")
+    st.session_state["dash_detail"] = None
 
 # === 1. 详情弹窗 ===
 @st.dialog("📦 库存详情档案", width="large")
@@ -85,6 +205,14 @@ def show_inventory_modal(row):
     c4, c5 = st.columns(2)
     c4.markdown(f"**👤 归属人:** {row['owner']}")
     # 如果以后加回位置，这里可以放位置
+    if pd.notna(row.get('days_until_empty')):
+        c5.markdown(f"**⏳ 预计用完:** 约 {int(np.ceil(row['days_until_empty']))} 天后 "
+                    f"(日均 {row['daily_rate']:.2f}{row['unit'] or ''})")
+
+    history = get_item_history(int(row['id']), limit=10)
+    if history:
+        with st.expander("🧾 最近变动"):
+            st.dataframe(pd.DataFrame(history), hide_index=True, use_container_width=True)
     
     st.divider()
     
@@ -104,15 +232,33 @@ def show_inventory_modal(row):
         c_k.markdown(f"**👶 儿童:** {row['child_use'] or '详见说明书'}")
         c_p.markdown(f"**🤰 孕妇:** {row.get('pregnancy_lactation_use', '详见说明书')}")
 
+TAG_CHIP_LIMIT = 20  # 标签筛选栏最多显示的标签数 (按库存条数倒序)
+
+def render_tag_filter(household_id, owner=None):
+    """
+    标签胶囊筛选 (可多选，同时具有)，返回选中的标签元组
+    候选标签只按家庭/归属人统计，不随已选标签变化，避免已选的胶囊从选项里消失
+    """
+    facets = inventory_tag_facets(household_id, (), owner, TAG_CHIP_LIMIT)
+    counts = dict(facets)
+    # 已选但不在前 N 名的标签也保留在选项里
+    for tag in st.session_state.get("dash_tags") or ():
+        counts.setdefault(tag, 0)
+    if not counts: return ()
+    selected = st.pills("🏷️ 标签筛选", list(counts), selection_mode="multi", key="dash_tags",
+                        format_func=lambda t: f"{t} · {counts[t]}")
+    return tuple(selected or ())
+
 # === 2. 主看板视图 ===
-def show_dashboard():
+@timed(kind="view")
+def show_dashboard(household_id):
     # 注入 CSS
     render_dashboard_css()
     
     st.header("📊 药箱实时看板")
     
     # 顶部统计卡片
-    total, expired, soon = get_dashboard_metrics()
+    total, expired, soon = get_dashboard_metrics(household_id)
     m1, m2, m3 = st.columns(3)
     m1.metric("🟢 总库存", total)
     m2.metric("🟡 临期预警", soon)
@@ -123,102 +269,38 @@ def show_dashboard():
     # 筛选区
     col_s, col_f = st.columns([3, 1])
     search = col_s.text_input("🔍 搜索库存", placeholder="药名/适应症/标签...")
-    members_list = ["全部"] + get_all_members()
+    members_list = ["全部"] + get_all_members(household_id)
     owner_filter = col_f.selectbox("归属人筛选", members_list)
     
-    # 加载数据
-    df = load_data()
-    
-    if df.empty:
+    if total == 0:
         st.info("📭 药箱现在是空的，快去【药品操作】入库吧！")
         return
 
-    # 执行筛选
-    if search:
-        # 支持搜药名、适应症、标签
-        mask = df.astype(str).apply(lambda x: x.str.contains(search, case=False)).any(axis=1)
-        df = df[mask]
-    if owner_filter != "全部":
-        df = df[df['owner'] == owner_filter]
+    owner = None if owner_filter == "全部" else owner_filter
+    tags = render_tag_filter(household_id, owner)
 
-    st.caption(f"当前展示 {len(df)} 个库存条目")
+    # 只加载当前页 (搜索走全文索引，归属人/标签筛选在 SQL 里完成)
+    # 先按上次的页码取数拿到总条数，翻页/页码被收回时再取一次 (结果带版本缓存)
+    page_state = st.session_state.get("dash_pager_page", 1) - 1
+    page_size = st.session_state.get("dash_pager_size", 24)
+    rows, matched = load_inventory_page(page_state, page_size, search or None, owner, household_id, tags)
+    page, page_size = render_pager(matched, key="dash_pager")
+    if page != page_state:
+        rows, matched = load_inventory_page(page, page_size, search or None, owner, household_id, tags)
 
-    # === 卡片网格 ===
-    today = pd.to_datetime("today").normalize()
-    
-    COLS_PER_ROW = 4
-    cols = st.columns(COLS_PER_ROW)
-
-    for index, row in df.iterrows():
-        col_idx = index % COLS_PER_ROW
-        
-        # 计算过期逻辑
-        exp_date = pd.to_datetime(row['expiry_date'])
-        days_left = (exp_date - today).days
-        
-        # 状态视觉配置
-        if days_left < 0:
-            status_icon = "🔴"
-            status_text = f"已过期 {abs(days_left)}天"
-            status_color = "#ef4444" # 红
-            bg_color = "#fef2f2" # 极淡红背景提示
-        elif days_left <= 90:
-            status_icon = "🟡"
-            status_text = f"剩 {days_left}天"
-            status_color = "#f59e0b" # 黄
-            bg_color = "#fffbeb"
-        else:
-            status_icon = "🟢"
-            status_text = "正常"
-            status_color = "#10b981" # 绿
-            bg_color = "#ffffff"
-
-        with cols[col_idx]:
-            with st.container(border=True):
-                # 1. 顶部：状态 + 归属人
-                st.markdown(f"""
-                <div class="dash-meta">
-                    <span style="color: {status_color}; font-weight:bold;">
-                        {status_icon} {status_text}
-                    </span>
-                    <span style="color: #64748b; background: #f1f5f9; padding: 2px 6px; border-radius: 4px;">
-                        👤 {row['owner']}
-                    </span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # 2. 中部：药名 (大标题)
-                st.markdown(f'<div class="dash-title" title="{row["name"]}">{row["name"]}</div>', unsafe_allow_html=True)
-                
-                # 3. 数据：数量 + 效期
-                # 这里用 caption 或者小字展示效期
-                st.markdown(f"""
-                <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom: 8px;">
-                    <span class="dash-qty">{row['quantity_display']}</span>
-                    <span style="color:#94a3b8; font-size:0.8rem;">{row['expiry_date'].strftime('%Y-%m-%d')}</span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # 4. 底部：Tags (高度统一 32px)
-                tags_html = render_tags_html(row['tags'])
-                if tags_html:
-                    st.markdown(f'''
-                    <div style="
-                        margin-top: 4px; 
-                        height: 32px; 
-                        overflow: hidden; 
-                        white-space: nowrap;
-                        display: flex;
-                        align-items: center;
-                        mask-image: linear-gradient(to right, black 80%, transparent 100%);
-                        -webkit-mask-image: linear-gradient(to right, black 80%, transparent 100%);
-                    ">
-                        {tags_html}
-                    </div>
-                    ''', unsafe_allow_html=True)
-                else:
-                    st.markdown('<div style="margin-top:4px; height: 32px; line-height:32px; color:#ccc; font-size:0.8rem;">无标签</div>', unsafe_allow_html=True)
-
-                # 5. 按钮
-                if st.button("查看详情", key=f"d_btn_{row['id']}", use_container_width=True):
-                    show_inventory_modal(row)
\ No newline at end of file
+    if not rows:
+        st.caption("没有符合条件的库存条目")
+        return
+
+    # === 卡片网格：整页一次性渲染为一段 HTML，详情用一个选择框打开 ===
+    # 卡片的状态列是向量化计算的，这里把当前页转成 DataFrame；
+    # 预计用完天数只读每日汇总表 (带版本缓存)，按 (条码, 归属人) 合并到当前页
+    df = render_card_grid(attach_usage_forecast(inventory_frame(rows), household_id))
+
+    labels = df['name'].fillna('') + " · " + df['owner'].fillna('') + " · " + df['expiry_label']
+    options = dict(zip(df['id'].tolist(), labels))
+    st.selectbox("🔎 查看详情", list(options), index=None, format_func=options.get,
+                 placeholder="选择一条库存查看详情档案", key="dash_detail", on_change=_on_pick_detail)
+    picked = st.session_state.pop("dash_detail_open", None)
+    if picked in options:
+        show_inventory_modal(df[df['id'] == picked].iloc[0])
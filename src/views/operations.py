@@ -1,23 +1,29 @@
 import streamlit as st
-from src.services.queries import load_data
-from src.services.inventory import update_quantity, delete_medicine, decrease_quantity, add_inventory_item
+from src.services.queries import load_inventory_rows
+from src.services.inventory import update_quantity, delete_medicines, decrease_quantity, add_inventory_item
 from src.services.catalog import get_catalog_info, upsert_catalog_item
 from src.services.members import get_all_members
+from src.services.safety import screen_medicine
+from src.views.safety import render_warnings, render_screening_panel
+from src.metrics import timed
 
-def show_operations(dev_mode):
+@timed(kind="view")
+def show_operations(dev_mode, household_id):
     st.header("💊 药品管理")
     tab1, tab2, tab3 = st.tabs(["🥣 吃药/更新", "➕ 新药入库", "🗑️ 删库"])
     
     # --- Tab 1 ---
     with tab1:
         st.subheader("💊 用药打卡与库存管理")
-        df = load_data()
-        if df.empty:
+        rows = load_inventory_rows(household_id)
+        if not rows:
             st.info("📭 暂无库存")
         else:
-            opts = {f"{r['name']} | 剩: {r['quantity_display']}": r['id'] for _, r in df.iterrows()}
-            sel_id = opts[st.selectbox("👉 选择药品", list(opts.keys()))]
-            curr = df[df['id'] == sel_id].iloc[0]
+            opts = {f"{r.name} | 剩: {r.quantity_display}": r for r in rows}
+            curr = opts[st.selectbox("👉 选择药品", list(opts.keys()))]
+            sel_id = curr.id
+            # 与该成员名下其他药品的冲突、成员特殊人群提示
+            render_warnings(screen_medicine(curr.barcode, curr.owner, household_id))
             
             st.divider()
             c1, c2 = st.columns(2)
@@ -26,15 +32,15 @@ def show_operations(dev_mode):
                 if curr['unit'] in ['ml', 'g', '瓶', '支']: st.info("💡 液体建议用右侧修正")
                 val = st.number_input(f"用量 ({curr['unit']})", 0.1, 1.0, 0.5)
                 if st.button("💊 确认服药", type="primary", use_container_width=True):
-                    ok, res = decrease_quantity(sel_id, val)
+                    ok, res = decrease_quantity(sel_id, val, household_id)
                     if ok: st.success(f"剩余: {res}"); st.rerun()
             
             with c2:
                 st.markdown("#### 📝 修正")
                 val = st.number_input(f"实际剩余 ({curr['unit']})", 0.0, float(curr['quantity_val']), 1.0)
                 if st.button("💾 确认修正", use_container_width=True):
-                    if val == 0: st.warning("数量为0"); update_quantity(sel_id, 0); st.rerun()
-                    else: update_quantity(sel_id, val); st.success("已修正"); st.rerun()
+                    if val == 0: st.warning("数量为0"); update_quantity(sel_id, 0, household_id); st.rerun()
+                    else: update_quantity(sel_id, val, household_id); st.success("已修正"); st.rerun()
 
             with st.expander("❓ 药膏怎么办"):
                 st.write("推荐使用百分比法：入库填1，用一半改成0.5")
@@ -127,23 +133,26 @@ def show_operations(dev_mode):
                         st.form_submit_button("🔒 只读", disabled=True)
 
             if catalog_exists:
+                with st.expander("🛡️ 用药安全检查", expanded=True):
+                    render_screening_panel(target_barcode, household_id, key="op_screen")
                 st.markdown("#### 2️⃣ 入库")
                 with st.form("inv_form", clear_on_submit=True):
                     i1, i2 = st.columns(2)
                     qty = i1.number_input("数量", 1.0)
                     exp = i2.date_input("过期日期")
                     i3, i4 = st.columns(2)
-                    own = i3.selectbox("归属", get_all_members())
+                    own = i3.selectbox("归属", get_all_members(household_id))
                     note = i4.text_input("备注")
                     if st.form_submit_button("📥 入库"):
-                        add_inventory_item(target_barcode, exp, qty, own, note)
+                        add_inventory_item(target_barcode, exp, qty, own, note, household_id)
                         st.success("入库成功")
 
     # --- Tab 3 ---
     with tab3:
-        df = load_data()
-        if not df.empty:
-            dels = st.multiselect("删谁", [f"{r['id']}-{r['name']}" for _, r in df.iterrows()])
+        rows = load_inventory_rows(household_id)
+        if rows:
+            dels = st.multiselect("删谁", [f"{r.id}-{r.name}" for r in rows])
             if st.button("确认删除"):
-                for d in dels: delete_medicine(int(d.split('-')[0]))
-                st.success("已删除"); st.rerun()
\ No newline at end of file
+                ok, res = delete_medicines([int(d.split('-')[0]) for d in dels], household_id)
+                if ok: st.success(f"已删除 {res} 条"); st.rerun()
+                else: st.error(f"删除失败: {res}")
\ No newline at end of file
@@ -0,0 +1,22 @@
+# src/views/pagination.py
+import streamlit as st
+
+PAGE_SIZES = [12, 24, 48, 96]
+
+def render_pager(total, key, default_size=24):
+    """
+    分页控件：每页条数 + 页码
+    返回 (page, page_size)，page 从 0 开始
+    """
+    c_info, c_size, c_page = st.columns([4, 1, 1])
+    page_size = c_size.selectbox("每页", PAGE_SIZES, index=PAGE_SIZES.index(default_size), key=f"{key}_size")
+
+    pages = max(1, -(-total // page_size))
+    page_key = f"{key}_page"
+    # 筛选条件变化后总页数可能变少，先把页码收回到合法范围，避免控件越界报错
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = c_page.number_input("页码", min_value=1, max_value=pages, value=1, step=1, key=page_key)
+
+    c_info.caption(f"共 {total} 条，第 {page}/{pages} 页")
+    return int(page) - 1, page_size
@@ -0,0 +1,26 @@
+# src/views/safety.py
+import streamlit as st
+from src.services.safety import screen_medicine, guess_populations, format_warning, POPULATIONS
+from src.services.members import get_all_members
+
+_BOXES = {"danger": st.error, "warning": st.warning, "info": st.info}
+
+def render_warnings(warnings, with_owner=False):
+    """逐条展示筛查提示 (按严重程度)；没有提示时给一行说明"""
+    if not warnings:
+        st.caption("✅ 本地规则未发现用药冲突 (规则有限，仍请遵医嘱)")
+        return
+    for w in warnings:
+        _BOXES[w["level"]](format_warning(w, with_owner))
+
+def render_screening_panel(barcode, household_id, key):
+    """
+    用药安全检查：选择给谁用 + 特殊人群 (默认按成员名推断)，检查拟用药与其现有库存的冲突
+    """
+    c1, c2 = st.columns([1, 2])
+    owner = c1.selectbox("给谁用", get_all_members(household_id), key=f"{key}_owner")
+    labels = {p: name for p, (name, _) in POPULATIONS.items()}
+    # 人群控件的 key 带上成员名，切换成员时默认值重新按成员名推断
+    populations = c2.multiselect("特殊人群", list(labels), default=list(guess_populations(owner)),
+                                 format_func=labels.get, key=f"{key}_pops_{owner}")
+    render_warnings(screen_medicine(barcode, owner, household_id, tuple(populations)))
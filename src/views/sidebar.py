@@ -1,8 +1,27 @@
 # src/views/sidebar.py
 import streamlit as st
 from src.database import export_seed_data
-from src.services.members import get_all_members, add_member, delete_member
+from src.services.members import get_all_members, add_member, delete_member, get_all_households, add_household
+from src import metrics
+from src.metrics import timed
 
+_METRIC_KINDS = {"call": "服务函数", "view": "页面渲染", "sql": "SQL 语句", "pool": "借连接"}
+
+def render_metrics_panel():
+    """性能面板：本进程启动以来各函数/页面/SQL 的耗时统计 (按总耗时排序)"""
+    kind = st.radio("类别", list(_METRIC_KINDS), format_func=_METRIC_KINDS.get, horizontal=True, key="metrics_kind")
+    rows = [{k: v for k, v in r.items() if k != "kind" and (k != "rows" or kind == "sql")}
+            for r in metrics.snapshot(kind)]
+    if rows:
+        st.dataframe(rows[:30], hide_index=True, use_container_width=True)
+    else:
+        st.caption("暂无数据" if metrics.ENABLED else "埋点已关闭 (HOMEMEDS_METRICS=0)")
+    c1, c2 = st.columns(2)
+    c1.download_button("⬇️ 导出", metrics.render_prometheus(), file_name="homemeds_metrics.prom",
+                       mime="text/plain", use_container_width=True)
+    c2.button("🧹 清零", on_click=metrics.reset, use_container_width=True)
+
+@timed(kind="view")
 def show_sidebar():
     with st.sidebar:
         st.title("🏥 家庭药箱助手 Pro")
@@ -10,11 +29,29 @@ def show_sidebar():
         
         menu = st.radio("导航", ["🏠 药箱看板", "💊 药品操作", "📖 公共药库", "🤖 AI 药剂师"])
         st.divider()
+
+        # === 🏠 当前家庭 (库存与成员按家庭隔离，公共药库共享) ===
+        households = dict(get_all_households())
+        household_id = st.selectbox("🏠 当前家庭", list(households.keys()),
+                                    format_func=lambda h: households[h], key="household_id")
+
+        with st.expander("➕ 新建家庭"):
+            def on_add_household():
+                ok, res = add_household(st.session_state.get("add_household_input", ""))
+                if ok:
+                    st.session_state["household_id"] = res
+                    st.session_state["add_household_input"] = ""
+                    st.toast("✅ 家庭已创建")
+                else:
+                    st.toast(f"❌ {res}")
+
+            st.text_input("家庭名称", placeholder="如: 爷爷奶奶家", label_visibility="collapsed", key="add_household_input")
+            st.button("创建家庭", use_container_width=True, on_click=on_add_household)
         
         # === 👨‍👩‍👧‍👦 家庭成员管理 (优化版) ===
         with st.expander("👨‍👩‍👧‍👦 家庭成员管理"):
             # 获取最新列表
-            current_members = get_all_members()
+            current_members = get_all_members(household_id)
             
             # 1. 展示列表
             st.caption("当前成员列表：")
@@ -35,7 +72,7 @@ def show_sidebar():
                 # 从 session_state 获取输入框的值
                 new_name = st.session_state.get("add_mem_input", "").strip()
                 if new_name:
-                    ok, msg = add_member(new_name)
+                    ok, msg = add_member(new_name, household_id)
                     if ok:
                         st.toast(f"✅ {msg}") # 使用 toast 提示，不打断流程
                         st.session_state["add_mem_input"] = "" # 🧹 关键：清空输入框绑定的变量
@@ -59,7 +96,7 @@ def show_sidebar():
             def on_del_click():
                 name_to_del = st.session_state.get("del_mem_select")
                 if name_to_del and name_to_del != "请选择...":
-                    delete_member(name_to_del)
+                    delete_member(name_to_del, household_id)
                     st.toast(f"✅ 已删除成员: {name_to_del}")
             
             st.selectbox("选择要删除的成员", ["请选择..."] + current_members, label_visibility="collapsed", key="del_mem_select")
@@ -79,6 +116,8 @@ def show_sidebar():
                     st.toast(f"✅ 导出 {c} 条数据")
                 except Exception as e:
                     st.error(str(e))
+            if st.checkbox("📈 性能面板", key="show_metrics_panel"):
+                render_metrics_panel()
         else:
             st.info("🔒 用户模式：官方数据只读")
             
@@ -87,5 +126,6 @@ def show_sidebar():
             st.session_state['api_base'] = st.text_input("API Base", value="https://api.deepseek.com")
             key = st.text_input("API Key", type="password")
             if key: st.session_state['api_key'] = key
+            st.session_state['ai_cache'] = st.checkbox("相同问题直接复用回答 (不消耗额度)", value=True)
             
-        return menu, dev_mode
\ No newline at end of file
+        return menu, dev_mode, household_id
\ No newline at end of file
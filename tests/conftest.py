@@ -0,0 +1,56 @@
+# tests/conftest.py
+"""
+测试夹具：每个用例一个全新的数据库
+- db: 同一个用例依次在 SQLite (临时文件) 和 PostgreSQL 上运行；PostgreSQL 需要设置
+  HOMEMEDS_TEST_DATABASE_URL=postgresql://... (用例前后会清空该库的所有表)，未设置时跳过
+运行 (项目根目录): python -m pytest -q
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import database  # noqa: E402
+
+TEST_DATABASE_URL_ENV = "HOMEMEDS_TEST_DATABASE_URL"
+
+def _drop_pg(backend):
+    from src import database_pg
+    with backend.connection() as conn:
+        database_pg.drop_all(conn)
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def db(request, tmp_path):
+    if request.param == "sqlite":
+        backend = database.create_backend(f"sqlite:///{tmp_path / 'medicines.db'}")
+    else:
+        url = os.environ.get(TEST_DATABASE_URL_ENV)
+        if not url:
+            pytest.skip(f"未设置 {TEST_DATABASE_URL_ENV}，跳过 PostgreSQL")
+        backend = database.create_backend(url)
+        _drop_pg(backend)  # 上次中断的运行可能留下了表
+    database.set_backend(backend)
+    database.ensure_db_ready()
+    yield database
+    if request.param != "sqlite":
+        _drop_pg(backend)
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """只在 SQLite 上有意义的用例 (全文索引、本地文件同步等)"""
+    database.set_backend(database.create_backend(f"sqlite:///{tmp_path / 'medicines.db'}"))
+    database.ensure_db_ready()
+    return database
+
+def add_catalog(barcode, name, tags="", form="片剂", **fields):
+    """按 upsert_catalog_item 的参数顺序补齐字段"""
+    from src.services.catalog import upsert_catalog_item
+    cols = database.SEED_COLUMNS[2:]
+    values = {"form": form, "unit": "片", "tags": tags, **fields}
+    assert upsert_catalog_item(barcode, name, *(values.get(c, "") for c in cols))
+
+def days_from_today(days):
+    return (date.today() + timedelta(days=days)).isoformat()
@@ -0,0 +1,167 @@
+# tests/test_ai_service.py
+"""AI 药剂师：库存上下文的合并与字符预算；LLM 调用的 SSE 流解析、建立连接时的退避重试、回答缓存 (httpx.MockTransport 代替真实服务)"""
+import json
+
+import httpx
+import openai
+import pytest
+
+from src.services import ai_service, inventory
+from tests.conftest import add_catalog, days_from_today
+
+API_KEY, BASE_URL = "sk-test", "http://llm.test/v1"
+
+def _sse(*events):
+    return "".join(f"data: {e if isinstance(e, str) else json.dumps(e, ensure_ascii=False)}\n\n"
+                   for e in events).encode("utf-8")
+
+def _delta(*texts):
+    return {"choices": [{"index": i, "delta": {"content": t}} for i, t in enumerate(texts)]}
+
+ANSWER = _sse({"choices": [{"index": 0, "delta": {"role": "assistant"}}]},
+              _delta("多喝水，"), _delta("注意体温。"), "[DONE]")
+
+class StubLLM:
+    """按顺序返回预设响应的 OpenAI 兼容服务，记录收到的请求"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(json.loads(request.content))
+        status, body = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if status == 200:
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body)
+        return httpx.Response(status, json={"error": {"message": "busy"}})
+
+@pytest.fixture
+def llm(monkeypatch):
+    """把共享客户端换成走 StubLLM 的客户端，并记录退避等待的秒数 (不真正等待)"""
+    def install(*responses):
+        stub = StubLLM(*responses)
+        client = openai.OpenAI(api_key=API_KEY, base_url=BASE_URL, max_retries=0,
+                               http_client=httpx.Client(transport=httpx.MockTransport(stub)))
+        monkeypatch.setattr(ai_service, "_clients", {(API_KEY, BASE_URL): client})
+        return stub
+    monkeypatch.setattr(ai_service, "response_cache", ai_service.ResponseCache())
+    install.sleeps = []
+    monkeypatch.setattr("tenacity.nap.time.sleep", install.sleeps.append)
+    return install
+
+def _ask(prompt="宝宝发烧怎么办", context="- 布洛芬", **kwargs):
+    return list(ai_service.stream_chat(API_KEY, BASE_URL, prompt, context, **kwargs))
+
+def test_streams_sse_deltas(llm):
+    stub = llm((200, ANSWER))
+    assert _ask() == ["多喝水，", "注意体温。"]
+    sent = stub.requests[0]
+    assert sent["stream"] is True and sent["model"] == ai_service.DEFAULT_MODEL
+    assert sent["messages"][1] == {"role": "user", "content": "宝宝发烧怎么办"}
+    assert "- 布洛芬" in sent["messages"][0]["content"]
+
+def test_sse_parser_skips_comments_and_empty_deltas():
+    class Raw:
+        def iter_lines(self):
+            yield from [": keep-alive", "", "event: message", f"data: {json.dumps(_delta('甲', '乙'))}",
+                        'data: {"choices": [{"delta": {}}]}', "data:[DONE]", ""]
+    assert list(ai_service._iter_sse_text(Raw())) == ["甲", "乙"]
+
+def test_error_chunk_in_stream_raises(llm):
+    llm((200, _sse(_delta("前半段"), {"error": {"message": "内容过长"}})))
+    with pytest.raises(RuntimeError, match="内容过长"):
+        _ask()
+
+def test_retries_transient_errors_with_backoff(llm):
+    stub = llm((503, None), (429, None), (200, ANSWER))
+    assert "".join(_ask()) == "多喝水，注意体温。"
+    assert len(stub.requests) == 3
+    assert llm.sleeps == [0.5, 1.0]  # 指数退避
+
+def test_gives_up_after_max_attempts(llm):
+    stub = llm((500, None))
+    with pytest.raises(openai.InternalServerError):
+        _ask()
+    assert len(stub.requests) == ai_service.LLM_MAX_ATTEMPTS
+
+def test_client_errors_are_not_retried(llm):
+    stub = llm((401, None))
+    with pytest.raises(openai.AuthenticationError):
+        _ask()
+    assert len(stub.requests) == 1 and llm.sleeps == []
+
+def test_repeated_question_is_served_from_cache(llm):
+    stub = llm((200, ANSWER))
+    first = "".join(_ask("宝宝发烧怎么办"))
+    assert _ask("  宝宝发烧怎么办 ") == [first]  # 空白差异视为同一问题
+    assert len(stub.requests) == 1
+    # 库存上下文或模型变化都不命中旧回答
+    _ask(context="- 对乙酰氨基酚")
+    _ask(model="another-model")
+    _ask(use_cache=False)
+    assert len(stub.requests) == 4
+
+def test_failed_answer_is_not_cached(llm):
+    stub = llm((200, _sse({"error": {"message": "x"}})), (200, ANSWER))
+    with pytest.raises(RuntimeError):
+        _ask()
+    assert "".join(_ask()) == "多喝水，注意体温。"
+    assert len(stub.requests) == 2
+
+def test_response_cache_ttl_and_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ai_service.time, "monotonic", lambda: now[0])
+    cache = ai_service.ResponseCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1   # a 变为最近使用
+    cache.set("c", 3)            # 淘汰最久未用的 b
+    assert cache.get("b") is None and cache.get("c") == 3
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+# --- 库存上下文 ---
+
+def test_context_merges_holdings_and_skips_expired(db):
+    assert ai_service.get_inventory_str_for_ai() == "库存为空。"
+    add_catalog("A0001", "上下文测试片", tags="感冒")
+    assert inventory.add_inventory_items([("A0001", days_from_today(100), 10, "爸爸", ""),
+                                          ("A0001", days_from_today(200), 5, "妈妈", ""),
+                                          ("A0001", days_from_today(-1), 3, "宝宝", "")])
+    assert ai_service.get_inventory_str_for_ai() == "- 上下文测试片[用户] | 剩:爸爸 10.0片, 妈妈 5.0片"
+
+    # 数据版本缓存：库存变化后重建
+    assert inventory.add_inventory_item("A0001", days_from_today(300), 2, "宝宝", "")
+    assert ai_service.get_inventory_str_for_ai().endswith("妈妈 5.0片, 宝宝 2.0片")
+
+def test_context_budget_keeps_the_most_relevant(db):
+    for n in range(20):
+        add_catalog(f"A01{n:02d}", f"填充药品{n:02d}号", indications="用于预算测试的填充说明")
+    add_catalog("A0200", "止咳糖浆", tags="咳嗽", indications="用于咳嗽")
+    items = [(f"A01{n:02d}", days_from_today(10 + n), 1, "爸爸", "") for n in range(20)]
+    assert inventory.add_inventory_items(items + [("A0200", days_from_today(400), 1, "爸爸", "")])
+
+    full = ai_service.get_inventory_str_for_ai(budget_chars=0)
+    assert len(full.splitlines()) == 21 and "未列出" not in full
+
+    context = ai_service.get_inventory_str_for_ai("孩子咳嗽用什么药", budget_chars=200)
+    lines = context.splitlines()
+    assert lines[0].startswith("- 止咳糖浆")  # 过期最晚，但与问题最相关
+    assert sum(len(line) + 1 for line in lines[:-1]) <= 200
+    assert lines[-1] == f"(另有 {22 - len(lines)} 种药品与问题关系不大，未列出)"
+    # 没有问题时按过期日期顺序截取；预算再小也至少列出一种
+    assert ai_service.get_inventory_str_for_ai(budget_chars=200).splitlines()[0].startswith("- 填充药品00号")
+    assert ai_service.get_inventory_str_for_ai(budget_chars=1).splitlines()[0].startswith("- 填充药品00号")
+
+def test_context_lists_conflicts_first(db):
+    add_catalog("A0301", "布洛芬片")
+    add_catalog("A0302", "洛索洛芬钠片")
+    assert inventory.add_inventory_items([("A0301", days_from_today(100), 1, "爸爸", ""),
+                                          ("A0302", days_from_today(100), 1, "爸爸", "")])
+    lines = ai_service.get_inventory_str_for_ai().splitlines()
+    assert lines[0] == "用药冲突 (本地规则筛查):"
+    assert lines[1].startswith("🔴 爸爸: ") and "非甾体抗炎药" in lines[1]
+    assert lines[2] == "库存:"
+    assert {line.split(" |")[0] for line in lines[3:]} == {"- 布洛芬片[用户]", "- 洛索洛芬钠片[用户]"}
+    assert "含:布洛芬" in lines[3] or "含:布洛芬" in lines[4]
@@ -0,0 +1,156 @@
+# tests/test_api.py
+"""REST API：访问令牌、参数校验 (非法输入返回 4xx，不写库、不留下会让看板崩溃的数据) 与基本读写"""
+import pytest
+from starlette.testclient import TestClient
+
+from src.api import app, API_TOKEN_ENV
+from src.services import queries
+from tests.conftest import add_catalog, days_from_today
+
+INV = "/api/households/1/inventory"
+TOKEN = "test-token"
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setenv(API_TOKEN_ENV, TOKEN)
+    add_catalog("T1001", "接口测试药")
+    with TestClient(app, headers={"Authorization": f"Bearer {TOKEN}"}) as c:
+        yield c
+
+WRITES = [
+    ("put", "/api/catalog/T1001", {"name": "改名"}),
+    ("delete", "/api/catalog/T1001", None),
+    ("post", "/api/households", {"name": "新家"}),
+    ("post", "/api/households/1/members", {"name": "新成员"}),
+    ("delete", "/api/households/1/members/爸爸", None),
+    ("post", INV, {"barcode": "T1001", "expiry_date": "2030-01-01", "quantity_val": 1}),
+    ("patch", f"{INV}/1", {"quantity_val": 1}),
+    ("delete", f"{INV}/1", None),
+    ("post", f"{INV}/1/consume", {"amount": 1}),
+    ("get", "/api/sync", None),
+    ("get", "/api/sync/changes", None),
+    ("post", "/api/sync/changes", {"changes": []}),
+]
+
+@pytest.mark.parametrize("method, path, body", WRITES)
+@pytest.mark.parametrize("headers, status", [
+    ({}, 401),
+    ({"Authorization": "Bearer wrong"}, 401),
+    ({"Authorization": TOKEN}, 401),
+])
+def test_writes_and_sync_require_token(client, method, path, body, headers, status):
+    anonymous = TestClient(app, headers=headers)
+    kwargs = {"json": body} if body is not None else {}
+    assert anonymous.request(method, path, **kwargs).status_code == status
+    assert client.get("/api/catalog/T1001").json()["name"] == "接口测试药"
+    assert "爸爸" in client.get("/api/households/1/members").json()["items"]
+
+def test_writes_disabled_without_configured_token(client, monkeypatch):
+    monkeypatch.delenv(API_TOKEN_ENV)
+    assert client.post("/api/households", json={"name": "新家"}).status_code == 403
+    assert client.get("/api/sync").status_code == 403
+    # 只读接口不需要令牌
+    assert TestClient(app).get("/api/catalog/T1001").status_code == 200
+
+def test_is_standard_cannot_be_set_over_http(client):
+    assert client.put("/api/catalog/T1001", json={"name": "x", "is_standard": 1}).status_code == 400
+    assert client.put("/api/catalog/T1001", json={"name": "改名"}).json()["is_standard"] == 0
+    standard = client.get("/api/catalog", params={"page_size": 1}).json()["items"][0]
+    assert standard["is_standard"] == 1
+    resp = client.put(f"/api/catalog/{standard['barcode']}", json={"name": standard["name"]})
+    assert resp.json()["is_standard"] == 1  # 修改官方条目不会把它降级
+
+def _add(client, **fields):
+    body = {"barcode": "T1001", "expiry_date": days_from_today(100), "quantity_val": 5, **fields}
+    return client.post(INV, json=body)
+
+def _only_item(client):
+    items = client.get(INV).json()["items"]
+    assert len(items) == 1
+    return items[0]
+
+def test_inventory_roundtrip(client):
+    assert _add(client, owner=" 爸爸 ").status_code == 201
+    item = _only_item(client)
+    assert item["owner"] == "爸爸" and item["quantity_val"] == 5
+
+    med = f"{INV}/{item['id']}"
+    assert client.post(med + "/consume", json={"amount": 2}).json()["quantity_val"] == 3
+    assert client.patch(med, json={"quantity_val": 8}).json()["quantity_val"] == 8
+    assert client.get("/api/households/1/metrics").json() == {"total": 1, "expired": 0, "expiring_soon": 0}
+    assert client.delete(med).status_code == 204
+
+@pytest.mark.parametrize("fields", [
+    {"expiry_date": "2025-13-45"},
+    {"expiry_date": "明年"},
+    {"expiry_date": 20250101},
+    {"barcode": 123},
+    {"barcode": ["T1001"]},
+    {"owner": {"name": "爸爸"}},
+    {"my_dosage": 2},
+    {"quantity_val": -1},
+    {"quantity_val": "很多"},
+    {"quantity_val": True},
+    {"quantity_val": None},
+])
+def test_create_inventory_rejects_bad_fields(client, fields):
+    resp = _add(client, **fields)
+    assert resp.status_code == 400, resp.text
+    assert queries.load_inventory_rows() == ()
+    assert client.get("/api/households/1/metrics").status_code == 200
+
+def test_create_inventory_normalizes_expiry_date(client):
+    assert _add(client, expiry_date="20300102").status_code == 201
+    assert str(_only_item(client)["expiry_date"]) == "2030-01-02"
+
+def test_unknown_barcode_is_conflict(client):
+    assert _add(client, barcode="NOPE").status_code == 409
+
+@pytest.mark.parametrize("path", ["/api/households", "/api/households/1/members"])
+@pytest.mark.parametrize("name", [123, "", "   ", None, ["名字"]])
+def test_create_named_rejects_bad_name_before_writing(client, path, name):
+    before = client.get(path).json()["items"]
+    assert client.post(path, json={"name": name}).status_code == 400
+    assert client.get(path).json()["items"] == before
+
+def test_create_household_and_member(client):
+    resp = client.post("/api/households", json={"name": " 邻居家 "})
+    assert resp.status_code == 201 and resp.json()["name"] == "邻居家"
+    hh = resp.json()["id"]
+    assert client.post(f"/api/households/{hh}/members", json={"name": "外婆"}).json() == {"name": "外婆"}
+    assert client.post(f"/api/households/{hh}/members", json={"name": "外婆"}).status_code == 409
+
+def test_patch_and_consume_missing_record_is_404(client):
+    assert client.patch(f"{INV}/999999", json={"quantity_val": 1}).status_code == 404
+    assert client.post(f"{INV}/999999/consume", json={"amount": 1}).status_code == 404
+
+@pytest.mark.parametrize("amount", [0, -1, "x"])
+def test_consume_requires_positive_amount(client, amount):
+    _add(client)
+    med = f"{INV}/{_only_item(client)['id']}"
+    assert client.post(med + "/consume", json={"amount": amount}).status_code == 400
+    assert _only_item(client)["quantity_val"] == 5
+
+def test_patch_rejects_negative_quantity(client):
+    _add(client)
+    med = f"{INV}/{_only_item(client)['id']}"
+    assert client.patch(med, json={"quantity_val": -3}).status_code == 400
+    assert _only_item(client)["quantity_val"] == 5
+
+def test_put_catalog_rejects_non_string_fields(client):
+    assert client.put("/api/catalog/T2001", json={"name": 1}).status_code == 400
+    assert client.put("/api/catalog/T2001", json={"name": "新药", "tags": ["a"]}).status_code == 400
+    assert client.get("/api/catalog/T2001").status_code == 404
+    assert client.put("/api/catalog/T2001", json={"name": "新药", "tags": "感冒"}).json()["name"] == "新药"
+
+@pytest.mark.parametrize("query", ["page=-1", "page=x", "page_size=0", "page_size=100000"])
+def test_paging_parameters_are_validated(client, query):
+    assert client.get(f"{INV}?{query}").status_code == 400
+
+def test_paging_past_the_end(client):
+    for n in range(3):
+        assert client.post(INV, json={"barcode": "T1001", "expiry_date": days_from_today(10 + n),
+                                      "quantity_val": 1}).status_code == 201
+    body = client.get(f"{INV}?page=1&page_size=2").json()
+    assert (len(body["items"]), body["page"], body["page_size"], body["total"]) == (1, 1, 2, 3)
+    assert client.get(f"{INV}?page=9&page_size=2").json()["items"] == []
@@ -0,0 +1,370 @@
+# tests/test_backends.py
+"""存储后端：建表/初始化走配置的数据库，服务层的读写在 SQLite 与 PostgreSQL 上行为一致"""
+import sqlite3
+import time
+
+import pytest
+
+from src import database
+from src.services import catalog, inventory, members, queries, search, tags
+from tests.conftest import add_catalog, days_from_today
+
+def test_sqlite_url_from_env_initializes_that_file(tmp_path, monkeypatch):
+    path = tmp_path / "custom.db"
+    monkeypatch.setenv(database.DATABASE_URL_ENV, f"sqlite:///{path}")
+    database.set_backend(None)  # 下次 get_backend 按环境变量重新创建
+
+    assert database.ensure_db_ready()
+    assert database.current_db_path() == str(path)
+    with sqlite3.connect(path) as conn:
+        names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"medicine_catalog", "inventory", "family_members", "households"} <= names
+    assert members.get_all_members() == list(database.DEFAULT_MEMBERS)
+    conn = database.get_connection()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM family_members").fetchone()[0] == len(database.DEFAULT_MEMBERS)
+    finally:
+        conn.close()
+
+def test_seed_import_is_idempotent(db):
+    with db.borrow_connection() as conn:
+        seeded = conn.execute("SELECT COUNT(*) FROM medicine_catalog WHERE is_standard = 1").fetchone()[0]
+        stats = db.import_seed_data(conn, force=True)
+    assert seeded > 0
+    assert stats["inserted"] == 0 and stats["updated"] == 0 and stats["unchanged"] == seeded
+
+def test_catalog_roundtrip(db):
+    add_catalog("T0001", "测试退烧片", tags="发烧 儿童")
+    info = catalog.lookup_barcode("T0001")
+    assert info["name"] == "测试退烧片" and info["is_standard"] == 0
+    assert catalog.get_catalog_info("测试退烧片")["barcode"] == "T0001"
+    assert "fts_id" not in info
+
+    add_catalog("T0001", "测试退烧片(新)", tags="发烧")
+    assert catalog.lookup_barcode("T0001")["name"] == "测试退烧片(新)"
+    assert dict(tags.catalog_tag_facets(("发烧",))).get("发烧") == 1
+
+    assert catalog.delete_catalog_item("T0001")
+    assert catalog.lookup_barcode("T0001") is None
+
+def test_unknown_barcode_does_not_match_by_prefix(db):
+    add_catalog("6901234567890", "前缀测试药")
+    assert catalog.get_catalog_info("690123") is None
+    assert search.search_catalog("690123") == ["6901234567890"]
+
+def _rename_behind_cache(db, barcode, name):
+    """直接改库、不经过服务层 (相当于另一个进程的修改：不会递增本进程的药库版本号)"""
+    with db.write_transaction() as conn:
+        conn.execute("UPDATE medicine_catalog SET name = ? WHERE barcode = ?", (name, barcode))
+
+def test_barcode_cache_is_invalidated_by_local_writes(db, monkeypatch):
+    add_catalog("T0006", "缓存测试药")
+    hit = catalog.lookup_barcode("T0006")
+    hit["name"] = "调用方改了副本"
+    assert catalog.lookup_barcode("T0006")["name"] == "缓存测试药"
+
+    # 其他进程的修改在 TTL 内读到的是缓存
+    _rename_behind_cache(db, "T0006", "外部改名")
+    assert catalog.lookup_barcode("T0006")["name"] == "缓存测试药"
+    # 本进程通过服务层写入药库：立即失效
+    add_catalog("T0006", "本进程改名")
+    assert catalog.lookup_barcode("T0006")["name"] == "本进程改名"
+
+    _rename_behind_cache(db, "T0006", "外部再改名")
+    monkeypatch.setattr(catalog, "CATALOG_CACHE_TTL", 0.0)
+    assert catalog.lookup_barcode("T0006")["name"] == "外部再改名"
+
+def test_unknown_barcode_is_not_cached(db):
+    assert catalog.lookup_barcode("T0007") is None
+    assert "T0007" not in catalog._catalog_cache
+    # 另一个进程随后录入了这个条码：不用等 TTL 也能查到
+    with db.write_transaction() as conn:
+        conn.execute("INSERT INTO medicine_catalog (barcode, name) VALUES ('T0007', '新录入的药')")
+    assert catalog.lookup_barcode("T0007")["name"] == "新录入的药"
+    assert catalog.lookup_barcode("  ") is None
+
+def test_barcode_cache_is_bounded(db, monkeypatch):
+    monkeypatch.setattr(catalog, "CATALOG_CACHE_SIZE", 2)
+    for n in range(3):
+        add_catalog(f"T001{n}", f"容量测试药{n}")
+    for n in range(3):
+        assert catalog.lookup_barcode(f"T001{n}")
+    # 最久未用的被淘汰
+    assert list(catalog._catalog_cache) == ["T0011", "T0012"]
+
+def test_inventory_lifecycle(db):
+    add_catalog("T0002", "测试咳嗽糖浆", tags="咳嗽")
+    assert inventory.add_inventory_item("T0002", days_from_today(365), 10, "爸爸", "")
+    assert inventory.add_inventory_item("T0002", days_from_today(-1), 2, "妈妈", "")
+    assert inventory.add_inventory_item("T0002", days_from_today(30), 5, "宝宝", "")
+    # 条码不在药库里：外键拒绝
+    assert not inventory.add_inventory_item("NOPE", days_from_today(30), 1, "爸爸", "")
+
+    rows = queries.load_inventory_rows()
+    assert [r.owner for r in rows] == ["妈妈", "宝宝", "爸爸"]  # 按过期日期排序
+    assert queries.get_dashboard_metrics() == (3, 1, 1)
+
+    med_id = rows[2].id
+    assert inventory.decrease_quantity(med_id, 3) == (True, 7)
+    assert inventory.decrease_quantity(med_id, 100) == (True, 0)  # 不低于 0
+    assert inventory.update_quantity(med_id, 12)
+    page, total = queries.load_inventory_page(0, 10, owner="爸爸")
+    assert total == 1 and page[0].quantity_val == 12
+
+    assert queries.load_inventory_page(0, 10, search="咳嗽糖浆")[1] == 3
+    assert inventory.delete_medicine(med_id)
+    assert queries.get_dashboard_metrics() == (2, 1, 1)
+
+def test_households_are_isolated(db):
+    add_catalog("T0003", "测试创可贴", form="贴剂")
+    ok, other = members.add_household("邻居家")
+    assert ok
+    assert members.get_all_members(other) == list(database.DEFAULT_MEMBERS)
+    assert inventory.add_inventory_item("T0003", days_from_today(100), 1, "公用", "", household_id=other)
+
+    assert queries.load_inventory_rows() == ()
+    med_id = queries.load_inventory_rows(other)[0].id
+    # 按 id 修改时校验家庭
+    assert not inventory.update_quantity(med_id, 9, household_id=database.DEFAULT_HOUSEHOLD_ID)
+    assert inventory.decrease_quantity(med_id, 1, household_id=database.DEFAULT_HOUSEHOLD_ID)[0] is False
+    assert queries.load_inventory_rows(other)[0].quantity_val == 1
+
+    assert members.add_member("外婆", other) == (True, "添加成功")
+    assert members.add_member("外婆", other)[0] is False
+    assert "外婆" not in members.get_all_members()
+
+def test_pagination_boundaries_within_a_household(db):
+    add_catalog("T0008", "分页测试药")
+    ok, other = members.add_household("分页邻居家")
+    assert ok
+    assert inventory.add_inventory_items(
+        [("T0008", days_from_today(n), 1, "爸爸" if n % 2 else "妈妈", "") for n in range(7)])
+    assert inventory.add_inventory_items([("T0008", days_from_today(n), 1, "爸爸", "") for n in range(3)],
+                                         household_id=other)
+    mine = [r.id for r in queries.load_inventory_rows()]
+
+    pages = [queries.load_inventory_page(page, 3) for page in range(4)]
+    assert [len(rows) for rows, _ in pages] == [3, 3, 1, 0]
+    assert {total for _, total in pages} == {7}
+    # 页与页之间不重不漏，顺序与全量读取一致，不会混入其他家庭的库存
+    assert [r.id for rows, _ in pages for r in rows] == mine
+    assert [r.id for r in queries.load_inventory_page(0, 100)[0]] == mine
+    assert queries.load_inventory_page(0, 3, owner="爸爸")[1] == 3
+    assert queries.load_inventory_page(1, 3, owner="爸爸")[0] == ()
+
+    # 搜索结果同样分页：最后一页不满，越界的页为空但总数不变
+    searched = [queries.load_inventory_page(page, 5, search="分页测试药") for page in range(3)]
+    assert [(len(rows), total) for rows, total in searched] == [(5, 7), (2, 7), (0, 7)]
+    assert sorted(r.id for rows, _ in searched for r in rows) == sorted(mine)
+
+    rows, total = queries.load_inventory_page(0, 2, household_id=other)
+    assert total == 3 and len(rows) == 2 and not {r.id for r in rows} & set(mine)
+    assert queries.load_inventory_page(0, 2, search="分页测试药", household_id=other)[1] == 3
+
+def _quantities(conn):
+    return {r["id"]: r["quantity_val"] for r in conn.execute("SELECT id, quantity_val FROM inventory")}
+
+def test_batch_writes_are_all_or_nothing(db):
+    add_catalog("T0004", "测试维生素")
+    assert inventory.add_inventory_items([("T0004", days_from_today(100), 10, "爸爸", ""),
+                                          ("T0004", days_from_today(200), 20, "妈妈", "")]) == (True, 2)
+    with db.borrow_connection() as conn:
+        before = _quantities(conn)
+        ledger = conn.execute("SELECT COUNT(*) FROM inventory_ledger").fetchone()[0]
+    first, second = sorted(before)
+
+    # 后面的一条 id 无效：前面已经执行的调整/删除也一起回滚
+    assert inventory.adjust_quantities([(first, -3), ("第二条", 1)])[0] is False
+    assert inventory.delete_medicines([first, "x"])[0] is False
+    # 批量入库里有一条条码不在药库：整批都不写入
+    ok, message = inventory.add_inventory_items([("T0004", days_from_today(50), 1, "宝宝", ""),
+                                                 ("NOPE", days_from_today(50), 1, "宝宝", "")])
+    assert (ok, message) == (False, "条码不存在于公共药库")
+    with db.borrow_connection() as conn:
+        assert _quantities(conn) == before
+        assert conn.execute("SELECT COUNT(*) FROM inventory_ledger").fetchone()[0] == ledger
+        assert conn.execute("SELECT COUNT(*) FROM expiry_buckets").fetchone()[0] == 2
+
+    assert inventory.adjust_quantities([(first, -3), (second, 5)]) == (True, {first: 7, second: 25})
+
+def test_quantities_never_go_negative(db):
+    add_catalog("T0005", "测试止咳片")
+    assert inventory.add_inventory_item("T0005", days_from_today(100), 4, "爸爸", "")
+    med_id = queries.load_inventory_rows()[0].id
+
+    assert inventory.decrease_quantity(med_id, 10) == (True, 0)
+    assert inventory.adjust_quantities([(med_id, 3), (med_id, -10)]) == (True, {med_id: 0})
+    assert not inventory.update_quantity(med_id, -1)
+    with db.borrow_connection() as conn:
+        assert _quantities(conn) == {med_id: 0}
+        # 台账只记真实变化量：扣到 0 为止的部分
+        deltas = [r[0] for r in conn.execute("SELECT delta FROM inventory_ledger ORDER BY id")]
+    assert deltas == [-4, 3, -3]
+
+def test_fts_index_survives_rowid_renumbering(sqlite_db):
+    add_catalog("T0004", "全文检索甲药")
+    add_catalog("T0005", "全文检索乙药")
+    with sqlite_db.borrow_connection() as conn:
+        # 模拟 VACUUM 重新编号隐式 rowid
+        conn.execute("UPDATE medicine_catalog SET rowid = rowid + 100000")
+        conn.commit()
+    sqlite_db.bump_catalog_version()
+    assert search.search_catalog("全文检索乙药") == ["T0005"]
+    add_catalog("T0006", "全文检索丙药")
+    assert search.search_catalog("全文检索丙药") == ["T0006"]
+
+def test_writes_from_other_processes_invalidate_cache(db):
+    before = db.get_data_version()
+    assert db.get_data_version() == before  # 没有写入：版本号不变
+    # 绕过服务层 (不调用 bump_data_version)，模拟另一个进程/实例写入
+    url = f"sqlite:///{db.current_db_path()}" if db.is_sqlite() else db.get_backend().url
+    other = db.create_backend(url)
+    try:
+        with other.write_transaction() as conn:
+            conn.execute("INSERT INTO households (name) VALUES (?)", ("另一个进程",))
+    finally:
+        other.close()
+    deadline = time.monotonic() + 5
+    while db.get_data_version() == before and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert db.get_data_version() > before
+
+def test_postgres_change_token_does_not_query(db, monkeypatch):
+    backend = db.get_backend()
+    if db.is_sqlite():
+        pytest.skip("SQLite 的变更标记是一次 stat")
+    monkeypatch.setattr(backend, "connection", None)  # 读变更标记不应借连接
+    backend.change_token()
+    db.get_data_version()
+
+def _sqlite_schema(conn):
+    return sorted(tuple(r) for r in conn.execute(
+        "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"))
+
+def test_hot_queries_use_their_indexes(sqlite_db):
+    with sqlite_db.borrow_connection() as conn:
+        assert sqlite_db.check_query_plans(conn) == []
+    # 校验本身能发现缺失的索引 (新连接：旧连接缓存的 EXPLAIN 语句不会反映删掉的索引)
+    conn = sqlite_db.get_connection()
+    try:
+        conn.execute("DROP INDEX idx_inventory_hh_expiry")
+        failures = sqlite_db.check_query_plans(conn)
+    finally:
+        conn.close()
+    assert [name for name, index, _ in failures if index == "idx_inventory_hh_expiry"] == [
+        name for name, _, _, index in sqlite_db.HOT_QUERY_PLANS if index == "idx_inventory_hh_expiry"]
+    assert len(failures) == 2
+
+def test_migrations_are_idempotent(sqlite_db):
+    latest = max(version for version, _, _ in sqlite_db.MIGRATIONS)
+    conn = sqlite_db.get_connection()
+    try:
+        assert sqlite_db.get_schema_version(conn) == latest
+        schema = _sqlite_schema(conn)
+        assert sqlite_db.migrate(conn) == latest
+        sqlite_db.init_db()
+        assert sqlite_db.get_schema_version(conn) == latest
+        assert _sqlite_schema(conn) == schema
+        # 同一张表上没有列组合完全相同的重复索引
+        indexes = [(table, tuple(r["name"] for r in conn.execute(f"PRAGMA index_info('{name}')")))
+                   for kind, name, table, _ in schema if kind == "index"]
+        assert len(indexes) == len(set(indexes))
+    finally:
+        conn.close()
+
+def test_server_schema_init_is_idempotent(db):
+    if db.is_sqlite():
+        pytest.skip("SQLite 见 test_migrations_are_idempotent")
+    from src import database_pg
+    with db.borrow_connection() as conn:
+        version = database_pg.get_schema_version(conn)
+        indexes = conn.execute("SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() "
+                               "ORDER BY indexname").fetchall()
+        conn.rollback()
+    db.init_db()
+    with db.borrow_connection() as conn:
+        assert database_pg.get_schema_version(conn) == version == max(v for v, _, _ in database_pg.PG_MIGRATIONS)
+        assert conn.execute("SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() "
+                            "ORDER BY indexname").fetchall() == indexes
+        assert conn.execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0] == version
+
+# --- SQL 方言转换 (不需要 PostgreSQL 服务器，只需要装了 requirements-pg.txt) ---
+
+@pytest.fixture
+def dialect():
+    pytest.importorskip("psycopg")
+    from src import database_pg
+    return database_pg
+
+class _Recorder:
+    """只记录语句的假连接，用来取到服务层真正执行的 SQL"""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, list(params)))
+        return self
+
+def _translate(dialect, sql, params=()):
+    pg_sql, numbered = dialect.translate_sql(sql)
+    return " ".join(pg_sql.split()), dialect._bind(params, numbered)
+
+def test_translate_bucket_upsert(dialect):
+    from src.services import alerts
+    conn = _Recorder()
+    alerts.refresh_expiry_buckets(conn, "2026-01-01", household_id=7, inventory_ids=[5, 6])
+    sql, params = _translate(dialect, *conn.statements[0])
+    assert params == {"p1": "2026-01-01", "p2": 7, "p3": 5, "p4": 6}
+    assert "WHEN expiry_date < CAST(%(p1)s AS DATE)" in sql
+    assert f"WHEN expiry_date <= (CAST(%(p1)s AS DATE) + INTERVAL '+{alerts.SOON_DAYS} days')" in sql
+    assert "WHERE household_id = %(p2)s AND id IN (%(p3)s,%(p4)s)" in sql
+    assert "ON CONFLICT(inventory_id) DO UPDATE SET" in sql
+    assert ("WHERE expiry_buckets.bucket IS DISTINCT FROM excluded.bucket "
+            "OR expiry_buckets.household_id IS DISTINCT FROM excluded.household_id") in sql
+    assert "?" not in sql
+
+@pytest.mark.parametrize("sql, expected", [
+    ("INSERT OR IGNORE INTO family_members (household_id, name) VALUES (?, ?)",
+     "INSERT INTO family_members (household_id, name) VALUES (%s, %s) ON CONFLICT DO NOTHING"),
+    (f"INSERT OR IGNORE INTO households (id, name) VALUES ({database.DEFAULT_HOUSEHOLD_ID}, '我的家');",
+     f"INSERT INTO households (id, name) VALUES ({database.DEFAULT_HOUSEHOLD_ID}, '我的家') ON CONFLICT DO NOTHING"),
+    # 不是 OR IGNORE 的 INSERT 原样保留 ON CONFLICT 子句
+    ("INSERT INTO alert_log (inventory_id, threshold, channel) VALUES (?, ?, ?) "
+     "ON CONFLICT DO NOTHING RETURNING threshold",
+     "INSERT INTO alert_log (inventory_id, threshold, channel) VALUES (%s, %s, %s) "
+     "ON CONFLICT DO NOTHING RETURNING threshold"),
+])
+def test_translate_insert_or_ignore(dialect, sql, expected):
+    assert _translate(dialect, sql)[0] == expected
+
+def test_translate_returning_and_positional_params(dialect):
+    sql, params = _translate(dialect, "UPDATE inventory SET quantity_val = MAX(0, quantity_val - ?) "
+                                      "WHERE id = ? RETURNING quantity_val", (2, 10))
+    assert sql == ("UPDATE inventory SET quantity_val = GREATEST(0, quantity_val - %s) "
+                   "WHERE id = %s RETURNING quantity_val")
+    assert params == (2, 10)
+    sql, _ = _translate(dialect, "INSERT INTO households (name) VALUES (?) RETURNING id")
+    assert sql == "INSERT INTO households (name) VALUES (%s) RETURNING id"
+    # 字面量里的 % 要转义，否则会被 psycopg 当成占位符；IS NOT NULL 保持不变
+    sql, _ = _translate(dialect, "SELECT id FROM inventory WHERE owner IS NOT NULL AND my_dosage LIKE '%片' AND id = ?")
+    assert sql == "SELECT id FROM inventory WHERE owner IS NOT NULL AND my_dosage LIKE '%%片' AND id = %s"
+
+@pytest.mark.parametrize("query, expected_params", [
+    ("T30", {"p1": "T30%", "p2": "%T30%", "p3": "T30"}),
+    ("布洛芬缓释", {"p1": "%布洛芬缓释%", "p2": "布洛芬缓释"}),  # 没有 FTS，长词也走 LIKE
+])
+def test_translate_search_like_fallback(dialect, monkeypatch, query, expected_params):
+    from types import SimpleNamespace
+    monkeypatch.setattr(search, "get_backend", lambda: SimpleNamespace(name="postgresql", supports_fts=False))
+    sql, params = _translate(dialect, *search._match_sql(None, query))
+    assert params == expected_params
+    assert "MATCH" not in sql and "catalog_fts" not in sql and "GLOB" not in sql
+    assert "WHERE name LIKE %(p{0})s ESCAPE '\\' OR tags LIKE %(p{0})s ESCAPE '\\'".format(len(params) - 1) in sql
+    if "p3" in params:
+        assert "WHERE barcode LIKE %(p1)s" in sql
+
+def test_explicit_begin_is_ignored(dialect):
+    for sql in ("BEGIN", "BEGIN IMMEDIATE", "begin exclusive;"):
+        assert dialect._BEGIN.match(sql)
+    assert not dialect._BEGIN.match("BEGIN; DELETE FROM inventory")
@@ -0,0 +1,64 @@
+# tests/test_dashboard.py
+"""看板卡片网格：向量化计算状态列、一次拼出整页 HTML (转义、标签、分档样式)"""
+import numpy as np
+import pandas as pd
+
+from src.services import inventory, queries
+from src.views import dashboard
+from tests.conftest import add_catalog, days_from_today
+
+TODAY = pd.Timestamp("2026-03-01")
+
+def _frame(**extra):
+    df = pd.DataFrame({
+        "name": ["过期药", "临期药", "正常药", None],
+        "owner": ["爸爸", "妈妈", "<b>宝宝</b>", None],
+        "quantity_display": ["3片", "1瓶", "20粒", "0片"],
+        "expiry_date": pd.to_datetime(["2026-02-27", "2026-05-30", "2026-05-31", "2027-01-01"]),
+        "tags": ["感冒 发烧", "", "<script>x</script>", None],
+    })
+    return df.assign(**extra)
+
+def test_compute_card_columns():
+    df = dashboard.compute_card_columns(_frame(days_until_empty=[np.nan, 2.2, 10.0, np.nan]), today=TODAY)
+    assert df["days_left"].tolist() == [-2, 90, 91, 306]
+    assert df["bucket"].tolist() == ["expired", "soon", "ok", "ok"]
+    assert df["status_text"].tolist() == ["已过期 2天", "剩 90天", "正常", "正常"]
+    assert df["expiry_label"].tolist() == ["2026-02-27", "2026-05-30", "2026-05-31", "2027-01-01"]
+    assert df["runout_text"].tolist() == ["", "≈3天用完", "≈10天用完", ""]
+    assert df["tags_html"][0] == '<span class="med-tag">感冒</span><span class="med-tag">发烧</span>'
+    assert df["tags_html"][1] == df["tags_html"][3] == ""
+
+def test_materialized_bucket_wins():
+    # 物化的分档优先 (如后台任务还没跨天刷新)，缺失时按天数现算
+    df = dashboard.compute_card_columns(_frame(expiry_bucket=["ok", None, "soon", None]), today=TODAY)
+    assert df["bucket"].tolist() == ["ok", "soon", "soon", "ok"]
+    assert "runout_text" in df and set(df["runout_text"]) == {""}
+
+def test_build_grid_html():
+    grid = dashboard.build_grid_html(dashboard.compute_card_columns(_frame(), today=TODAY))
+    assert grid.startswith('<div class="dash-grid">') and grid.endswith("</div>")
+    assert grid.count('<div class="dash-card"') == 4
+    for bucket in ("expired", "soon", "ok"):
+        icon, color, bg = dashboard.STATUS_STYLE[bucket]
+        assert f"background:{bg};" in grid and f"color:{color};" in grid
+    # 用户输入的药名/归属人/标签一律转义
+    assert "<b>" not in grid and "&lt;b&gt;宝宝&lt;/b&gt;" in grid
+    assert "<script>" not in grid and "&lt;script&gt;x&lt;/script&gt;" in grid
+    assert grid.count('<div class="dash-tags dash-empty">无标签</div>') == 2
+    assert dashboard.build_grid_html(dashboard.compute_card_columns(_frame().iloc[:0], today=TODAY)) == \
+        '<div class="dash-grid"></div>'
+
+def test_grid_from_inventory_rows(db):
+    add_catalog("D0001", "看板测试药", tags="感冒")
+    with db.write_transaction() as conn:  # 同步/旧数据里 tags 可能是 NULL
+        conn.execute("INSERT INTO medicine_catalog (barcode, name) VALUES ('D0002', '无标签测试药')")
+    assert inventory.add_inventory_items([("D0001", days_from_today(-1), 2, "爸爸", ""),
+                                          ("D0001", days_from_today(30), 5, "妈妈", ""),
+                                          ("D0002", days_from_today(300), 1, "妈妈", "")])
+    df = dashboard.compute_card_columns(queries.inventory_frame(queries.load_inventory_rows()))
+    assert df["bucket"].tolist() == ["expired", "soon", "ok"]
+    grid = dashboard.build_grid_html(df)
+    assert grid.count("看板测试药") == 4  # title 属性 + 正文
+    assert '<span class="med-tag">感冒</span>' in grid
+    assert grid.count("无标签</div>") == 1
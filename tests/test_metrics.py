@@ -0,0 +1,71 @@
+# tests/test_metrics.py
+"""性能埋点：SQL 语句的耗时/行数、连接借出耗时、@timed 服务调用都会被记录并导出"""
+import pytest
+
+from src import metrics
+from src.services import members
+
+pytestmark = pytest.mark.skipif(not metrics.ENABLED, reason="HOMEMEDS_METRICS=0")
+
+def _entry(kind, name):
+    matches = [r for r in metrics.snapshot(kind) if r["name"] == name]
+    assert matches, f"没有记录 {kind}: {name}"
+    return matches[0]
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+def test_query_timings_and_row_counts(db):
+    sql = "SELECT barcode FROM medicine_catalog WHERE is_standard = ? ORDER BY barcode"
+    with db.borrow_connection() as conn:
+        rows = conn.execute(sql, (1,)).fetchall()
+        conn.execute(sql, (1,)).fetchone()
+    assert rows
+    entry = _entry("sql", metrics.sql_label(sql))
+    assert entry["count"] == 2
+    assert entry["rows"] == len(rows) + 1
+    assert entry["total_ms"] >= entry["max_ms"] > 0
+    assert _entry("pool", db.get_backend().name)["count"] >= 1
+
+    text = metrics.render_prometheus()
+    label = f'statement="{metrics.sql_label(sql)}"'
+    assert f"homemeds_sql_duration_seconds_count{{{label}}} 2" in text
+    assert f"homemeds_sql_rows_total{{{label}}} {len(rows) + 1}" in text
+
+def test_timed_service_calls(db):
+    members.get_all_households()
+    members.get_all_households()
+    entry = _entry("call", "services.members.get_all_households")
+    assert entry["count"] == 2
+    assert 'homemeds_function_duration_seconds_count{func="services.members.get_all_households"} 2' \
+        in metrics.render_prometheus()
+
+def test_timed_counts_failures():
+    @metrics.timed(name="测试.失败")
+    def boom():
+        raise ValueError("x")
+    with pytest.raises(ValueError):
+        boom()
+    assert _entry("call", "测试.失败")["count"] == 1
+
+def test_sql_labels_collapse_variable_placeholder_lists():
+    a = metrics.sql_label("SELECT *  FROM t\n WHERE id IN (?, ?, ?)")
+    b = metrics.sql_label("SELECT * FROM t WHERE id IN (?,?)")
+    assert a == b == "SELECT * FROM t WHERE id IN (?…)"
+
+def test_histogram_buckets_and_quantiles():
+    for ms in (1, 2, 3, 40):
+        metrics.observe("view", "页面", ms / 1000)
+    entry = _entry("view", "页面")
+    assert entry["count"] == 4 and entry["max_ms"] == 40
+    assert entry["p50_ms"] <= 2.5 < entry["p95_ms"] <= 40
+    assert 'homemeds_view_duration_seconds_bucket{view="页面",le="0.0025"} 2' in metrics.render_prometheus()
+
+def test_write_metrics_file(tmp_path):
+    metrics.observe("call", "落盘", 0.01)
+    path = metrics.write_metrics_file(str(tmp_path / "out" / "homemeds.prom"))
+    with open(path, encoding="utf-8") as f:
+        assert 'homemeds_function_duration_seconds_count{func="落盘"} 1' in f.read()
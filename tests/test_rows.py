@@ -0,0 +1,91 @@
+# tests/test_rows.py
+"""服务层行对象：两种取值写法、to_dict、与旧 read_sql_query 路径的 DataFrame 列/值一致、读路径不加载 pandas"""
+import os
+import sys
+import subprocess
+import warnings
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from src import database
+from src.services import catalog, inventory, queries
+from src.services.rows import InventoryRow, CatalogRow, CATALOG_SELECT, to_frame
+from tests.conftest import add_catalog, days_from_today
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_row_access():
+    row = InventoryRow(*range(len(InventoryRow.__slots__)))
+    assert row.name == row["name"] == 2 and row.get("nope", "默认") == "默认"
+    with pytest.raises(KeyError):
+        row["nope"]
+    assert list(row.to_dict()) == [*InventoryRow.__slots__, "quantity_display"]
+    assert row.quantity_display == "8 6"
+    assert row == InventoryRow(*range(len(InventoryRow.__slots__))) and row != CatalogRow(*range(17))
+    assert repr(row).startswith("InventoryRow(id=0, barcode=1, ")
+    with pytest.raises(AttributeError):
+        row.extra = 1  # __slots__：不能随手加字段
+
+@pytest.fixture
+def stocked(db):
+    add_catalog("R0001", "行对象测试药", tags="感冒", manufacturer="某厂")
+    with db.write_transaction() as conn:  # 只有必填字段的条目：其余列都是 NULL
+        conn.execute("INSERT INTO medicine_catalog (barcode, name) VALUES ('R0002', '空字段测试药')")
+    assert inventory.add_inventory_items([("R0001", days_from_today(10), 2.5, "爸爸", "每次1片"),
+                                          ("R0002", days_from_today(-3), 1, "妈妈", "")])
+    return db
+
+def _legacy(conn, sql, params=()):
+    """旧实现：pd.read_sql_query 直接出 DataFrame"""
+    with warnings.catch_warnings():  # PG 连接不是 SQLAlchemy，pandas 会提示 “未测试”
+        warnings.simplefilter("ignore", UserWarning)
+        return pd.read_sql_query(sql, conn, params=params)
+
+def _same(new, old):
+    assert list(new.columns) == list(old.columns)
+    pd.testing.assert_frame_equal(new.reset_index(drop=True), old.reset_index(drop=True),
+                                  check_dtype=False, check_column_type=False)
+
+def test_inventory_frame_matches_legacy_path(stocked):
+    today = date.today().isoformat()
+    with stocked.borrow_connection() as conn:
+        old = _legacy(conn, queries._inventory_select(today) + " WHERE i.household_id = ? ORDER BY i.expiry_date ASC",
+                      (database.DEFAULT_HOUSEHOLD_ID,))
+    rows = queries.load_inventory_rows()
+    _same(to_frame(rows, InventoryRow), old)
+
+    frame = queries.inventory_frame(rows)
+    assert list(frame.columns) == [*InventoryRow.__slots__, "quantity_display"]
+    assert frame["quantity_display"].tolist() == [r.quantity_display for r in rows]
+    # SQLite 返回 ISO 字符串、PG 返回 date，转成 DataFrame 后都是日期类型
+    assert frame["expiry_date"].tolist() == [pd.Timestamp(r.expiry_date) for r in rows]
+    assert queries.load_data().shape == frame.shape
+
+def test_catalog_frame_matches_legacy_path(stocked):
+    with stocked.borrow_connection() as conn:
+        # 旧实现是 SELECT *，多出的内部列 (全文索引 id 等) 不属于行对象
+        old = _legacy(conn, "SELECT * FROM medicine_catalog")[list(CatalogRow.__slots__)]
+        assert _legacy(conn, CATALOG_SELECT).columns.tolist() == list(CatalogRow.__slots__)
+    new = catalog.load_catalog_data()
+    assert new.columns.tolist() == list(CatalogRow.__slots__)
+    _same(new.sort_values("barcode"), old.sort_values("barcode"))
+    assert to_frame((), CatalogRow).columns.tolist() == list(CatalogRow.__slots__)
+
+def test_read_path_does_not_import_pandas(tmp_path):
+    code = f"""
+import sys
+from src import database
+database.set_backend(database.create_backend("sqlite:///{tmp_path / 'rows.db'}"))
+database.ensure_db_ready()
+from src.services import catalog, queries
+assert catalog.load_catalog_page(0, 10)[1] > 0
+queries.load_inventory_page(0, 10)
+queries.load_inventory_rows()
+catalog.get_catalog_info("感冒")
+print("pandas" in sys.modules)
+"""
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip().splitlines()[-1] == "False"
@@ -0,0 +1,129 @@
+# tests/test_safety.py
+"""用药安全筛查：成分识别、成分重复与类别相互作用、外用药、特殊人群级别、画像缓存失效、家庭筛查"""
+import pytest
+
+from src import database
+from src.services import inventory, safety
+from tests.conftest import add_catalog, days_from_today
+
+HH = database.DEFAULT_HOUSEHOLD_ID
+
+def _hold(barcode, name, owner="爸爸", **fields):
+    """录入药库条目并放一盒到成员名下"""
+    add_catalog(barcode, name, **fields)
+    assert inventory.add_inventory_item(barcode, days_from_today(200), 10, owner, "")
+
+def _profile(name, form="片剂", **fields):
+    row = {c: fields.get(c, "") for c in safety.PROFILE_COLUMNS}
+    row.update(barcode="P0001", name=name, form=form)
+    return safety.compile_profile(row)
+
+def _pairs(warnings):
+    return [(w["level"], w["name"], w["other_name"], w["message"]) for w in warnings]
+
+def test_longest_keyword_wins():
+    assert _profile("罗红霉素胶囊").ingredients == {"罗红霉素"}
+    assert _profile("红霉素肠溶片").ingredients == {"红霉素"}
+    assert _profile("感冒灵颗粒").ingredients == {"对乙酰氨基酚", "氯苯那敏", "咖啡因"}
+    assert _profile("头孢克肟分散片").classes == {"抗菌药", "头孢类"}
+
+def test_duplicate_ingredients(db):
+    _hold("S0001", "感冒灵颗粒")
+    add_catalog("S0002", "对乙酰氨基酚片")
+    warnings = safety.screen_medicine("S0002", owner="爸爸")
+    assert _pairs(warnings) == [("danger", "对乙酰氨基酚片", "感冒灵颗粒", "成分重复 (对乙酰氨基酚)，合用可能超量")]
+
+def test_similar_names_are_not_duplicates(db):
+    _hold("S0001", "罗红霉素胶囊")
+    add_catalog("S0002", "红霉素肠溶片")
+    assert safety.screen_medicine("S0002", owner="爸爸") == []
+
+def test_class_interactions(db):
+    _hold("S0001", "头孢克肟分散片")
+    _hold("S0002", "洛索洛芬钠片")
+    add_catalog("S0003", "藿香正气水", form="合剂")
+    add_catalog("S0004", "布洛芬缓释胶囊")
+
+    warnings = safety.screen_medicine("S0003", owner="爸爸")
+    assert [(w["level"], w["other_name"]) for w in warnings] == [("danger", "头孢克肟分散片")]
+    assert "双硫仑" in warnings[0]["message"]
+
+    # 两种不同的 NSAID：报同类叠加，没有共享成分就不报成分重复
+    warnings = safety.screen_medicine("S0004", owner="爸爸")
+    assert [(w["level"], w["other_name"]) for w in warnings] == [("danger", "洛索洛芬钠片")]
+    assert "非甾体抗炎药" in warnings[0]["message"]
+
+def test_same_ingredient_is_reported_once(db):
+    _hold("S0001", "布洛芬片")
+    add_catalog("S0002", "布洛芬缓释胶囊")
+    warnings = safety.screen_medicine("S0002", owner="爸爸")
+    assert [w["message"] for w in warnings] == ["成分重复 (布洛芬)，合用可能超量"]
+
+def test_external_forms_are_skipped(db):
+    _hold("S0001", "双氯芬酸钠凝胶", form="凝胶剂")
+    _hold("S0002", "布洛芬片")
+    add_catalog("S0003", "洛索洛芬钠贴剂", form="贴剂")
+    add_catalog("S0004", "萘普生片")
+
+    assert safety.drug_profile("S0003").external
+    # 外用的拟用药不做相互作用判断；外用的库存药不进索引
+    assert safety.screen_medicine("S0003", owner="爸爸") == []
+    assert [w["other_name"] for w in safety.screen_medicine("S0004", owner="爸爸")] == ["布洛芬片"]
+    assert safety.screen_household(HH) == []
+
+def test_population_levels_from_usage_fields():
+    profile = _profile("小儿退热栓", child_use="儿童用量请咨询医师或药师。",
+                       pregnancy_lactation_use="孕妇禁用；哺乳期妇女慎用。",
+                       elderly_use="尚不明确。")
+    assert profile.populations == {
+        "child": ("warning", "儿童用量请咨询医师或药师"),
+        "pregnancy": ("danger", "孕妇禁用"),
+        "lactation": ("warning", "哺乳期妇女慎用"),
+        "elderly": ("info", "尚不明确"),
+    }
+    assert profile.flags() == "儿童慎用 孕妇禁用 哺乳期慎用"
+
+    # 禁忌字段里提到的人群默认禁用，且比其他字段里的 “慎用” 更严重；与人群无关的句子记为禁忌条件
+    profile = _profile("某药片", contraindications="对本品过敏者；2岁以下儿童。", child_use="儿童慎用。")
+    assert profile.populations["child"] == ("danger", "2岁以下儿童")
+    assert profile.conditions == ("对本品过敏者",)
+
+def test_population_warnings_follow_the_member(db):
+    _hold("S0001", "维生素C片", owner="宝宝")
+    add_catalog("S0002", "某止咳糖浆", form="糖浆剂", child_use="儿童禁用。")
+    warnings = safety.screen_medicine("S0002")
+    assert [(w["owner"], w["kind"], w["level"]) for w in warnings] == [("宝宝", "population", "danger")]
+    assert safety.screen_medicine("S0002", owner="宝宝", populations=()) == []
+
+def test_profiles_are_invalidated_by_catalog_changes(db):
+    add_catalog("S0001", "布洛芬片")
+    with database.borrow_connection() as conn:
+        first = safety.load_profiles(conn, ["S0001", "NOPE"])
+        assert list(first) == ["S0001"]
+        assert safety.load_profiles(conn, ["S0001"])["S0001"] is first["S0001"]
+
+    add_catalog("S0001", "对乙酰氨基酚片")  # 药库版本号递增
+    with database.borrow_connection() as conn:
+        again = safety.load_profiles(conn, ["S0001"])["S0001"]
+    assert again is not first["S0001"]
+    assert again.ingredients == {"对乙酰氨基酚"}
+
+def test_screen_household_limit(db):
+    # 一个成员名下 4 种 NSAID，两两之间 6 对
+    for n, name in enumerate(("布洛芬片", "洛索洛芬钠片", "萘普生片", "阿司匹林肠溶片"), start=1):
+        _hold(f"S000{n}", name)
+    _hold("S0005", "氯雷他定片", owner="妈妈")
+    _hold("S0006", "西替利嗪片", owner="妈妈")
+
+    everything = safety.screen_household(HH)
+    assert len(everything) == 7
+    assert [w["level"] for w in everything] == ["danger"] * 6 + ["warning"]
+
+    limited = safety.screen_household(HH, limit=3)
+    assert len(limited) == 3
+    assert all(w["level"] == "danger" for w in limited)
+    assert safety.format_warning(limited[0], with_owner=True).startswith("🔴 爸爸: ")
+
+@pytest.mark.parametrize("member, populations", [("宝宝", ("child",)), ("外婆", ("elderly",)), ("爸爸", ())])
+def test_guess_populations(member, populations):
+    assert safety.guess_populations(member) == populations
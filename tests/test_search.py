@@ -0,0 +1,74 @@
+# tests/test_search.py
+"""药库搜索：FTS 全文索引与短词 LIKE 回退的结果一致、排序规则、特殊字符、库存搜索"""
+import pytest
+
+from src.services import inventory, search
+from tests.conftest import add_catalog, days_from_today
+
+@pytest.fixture
+def catalog_items(db):
+    add_catalog("Q0001", "搜索测试退热贴", tags="热测", form="贴剂")
+    add_catalog("Q0002", "小儿搜索测试颗粒", tags="热测 儿测", indications="用于搜索测试引起的发热")
+    add_catalog("Q0003", "某某胶囊", manufacturer="搜索测试制药厂")
+    add_catalog("Q0004", "含量 50%_搜索测试凝胶", form="凝胶剂")
+    add_catalog("Q0005", "标签比对药", tags="热测药")
+    return db
+
+@pytest.fixture
+def match_sql(monkeypatch):
+    """记录每次搜索生成的匹配子查询"""
+    seen = []
+    original = search._match_sql
+
+    def spy(conn, query, barcode_prefix=True):
+        sql, params = original(conn, query, barcode_prefix)
+        seen.append(sql)
+        return sql, params
+    monkeypatch.setattr(search, "_match_sql", spy)
+    return seen
+
+def test_ranking(catalog_items):
+    # 药名命中排在只有厂商命中的前面
+    found = search.search_catalog("搜索测试")
+    assert set(found[:3]) == {"Q0001", "Q0002", "Q0004"} and found[3:] == ["Q0003"]
+    assert search.search_catalog("搜索测试", limit=2) == found[:2]
+    # 条码前缀排最前；barcode_prefix=False 时不按条码匹配
+    assert set(search.search_catalog("Q000")[:5]) == {"Q0001", "Q0002", "Q0003", "Q0004", "Q0005"}
+    assert search.search_catalog("Q000", barcode_prefix=False) == []
+    assert search.search_catalog("   ") == []
+
+def test_short_query_falls_back_to_like(catalog_items, match_sql):
+    # 两个字不够 trigram：走 LIKE；标签完全相同的排在标签子串命中之前
+    found = search.search_catalog("热测")
+    assert "LIKE" in match_sql[-1] and "MATCH" not in match_sql[-1]
+    assert set(found[:2]) == {"Q0001", "Q0002"} and found[2:] == ["Q0005"]
+    found = search.search_catalog("发热")  # 适应症命中
+    assert "Q0002" in found and "Q0001" not in found
+
+def test_fts_and_like_agree(sqlite_db, monkeypatch, match_sql):
+    add_catalog("Q0002", "小儿搜索测试颗粒", indications="用于搜索测试引起的发热")
+    add_catalog("Q0003", "某某胶囊", manufacturer="搜索测试制药厂")
+    fts = search.search_catalog("搜索测试引起")
+    assert "MATCH" in match_sql[-1]
+    monkeypatch.setattr(search, "_MIN_FTS_LEN", 100)  # 强制回退为 LIKE
+    like = search.search_catalog("搜索测试引起")
+    assert "MATCH" not in match_sql[-1]
+    assert fts == like == ["Q0002"]
+
+def test_special_characters_are_literal(catalog_items):
+    # LIKE 通配符和 FTS 语法字符都按普通字符匹配
+    assert search.search_catalog("50%_") == ["Q0004"]
+    assert search.search_catalog("%") == ["Q0004"]
+    assert search.search_catalog('"搜索 OR 测试"') == []
+    assert search.search_catalog("搜索测试*") == []
+
+def test_search_inventory(catalog_items):
+    assert inventory.add_inventory_items([("Q0001", days_from_today(200), 1, "宝宝", ""),
+                                          ("Q0002", days_from_today(100), 1, "宝宝", ""),
+                                          ("Q0003", days_from_today(300), 1, "爸爸", "")])
+    found = search.search_inventory("搜索测试")
+    assert len(found) == 3
+    assert len(search.search_inventory("搜索测试", owner="宝宝")) == 2
+    # 归属人完全相同也算命中
+    assert len(search.search_inventory("爸爸")) == 1
+    assert search.search_inventory("搜索测试", household_id=999) == []
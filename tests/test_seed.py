@@ -0,0 +1,125 @@
+# tests/test_seed.py
+"""官方种子数据：导出/导入往返、哈希未变跳过、按差异更新、移出官方、旧版 JSON 数组流式读取"""
+import io
+import json
+
+import pytest
+
+from src import database
+from src.services import inventory, tags
+from tests.conftest import days_from_today
+
+def _standard_rows(conn):
+    cols = ", ".join(database.SEED_COLUMNS)
+    return [tuple(r) for r in conn.execute(
+        f"SELECT {cols} FROM medicine_catalog WHERE is_standard = 1 ORDER BY barcode")]
+
+@pytest.fixture
+def seed_file(tmp_path, monkeypatch):
+    """把种子文件指向临时目录 (导出写到这里，导入从这里读)"""
+    path = tmp_path / "catalog_seed.jsonl"
+    monkeypatch.setattr(database, "SEED_FILE", str(path))
+    monkeypatch.setattr(database, "LEGACY_SEED_FILE", str(tmp_path / "catalog_seed.json"))
+    return path
+
+def _item(barcode, name, **fields):
+    return {c: fields.get(c, "") for c in database.SEED_COLUMNS} | {"barcode": barcode, "name": name}
+
+def _write_seed(path, items):
+    path.write_text("".join(json.dumps(i, ensure_ascii=False) + "\n" for i in items), encoding="utf-8")
+
+def _standard(conn):
+    return {r["barcode"]: r["name"] for r in conn.execute(
+        "SELECT barcode, name FROM medicine_catalog WHERE is_standard = 1")}
+
+def test_export_import_roundtrip_excludes_internal_columns(sqlite_db, seed_file, tmp_path):
+    with sqlite_db.borrow_connection() as conn:
+        original = _standard_rows(conn)
+    assert original
+    assert sqlite_db.export_seed_data() == len(original)
+
+    items = [json.loads(line) for line in seed_file.read_text(encoding="utf-8").splitlines()]
+    assert [i["barcode"] for i in items] == sorted(i["barcode"] for i in items)
+    for item in items:
+        assert "fts_id" not in item
+        assert set(item) == set(database.CATALOG_COLUMNS)
+
+    # 另一个全新实例从导出的文件导入，得到相同的官方数据
+    database.set_backend(database.create_backend(f"sqlite:///{tmp_path / 'other.db'}"))
+    database.ensure_db_ready()
+    with database.borrow_connection() as conn:
+        assert _standard_rows(conn) == original
+
+def test_unchanged_seed_is_skipped(db, seed_file):
+    # 同一条码出现多次时以最后一条为准
+    _write_seed(seed_file, [_item("S1", "旧名"), _item("S2", "乙药"), _item("S1", "甲药")])
+    with db.borrow_connection() as conn:
+        first = db.import_seed_data(conn)
+        assert first["inserted"] == 2 and first["unchanged"] == 0
+        assert db.import_seed_data(conn) is None
+        assert db.import_seed_data(conn, force=True) == {"inserted": 0, "updated": 0, "removed": 0, "unchanged": 2}
+        assert _standard(conn) == {"S1": "甲药", "S2": "乙药"}
+
+def test_seed_diff_only_rewrites_changed_rows(sqlite_db, seed_file):
+    _write_seed(seed_file, [_item("S1", "甲药", tags="感冒"), _item("S2", "乙药", tags="发烧")])
+    with sqlite_db.borrow_connection() as conn:
+        sqlite_db.import_seed_data(conn)
+        # 记录之后真正被改写的行 (临时触发器只在这个连接上生效)
+        conn.execute("CREATE TEMP TABLE touched (barcode TEXT)")
+        columns = ", ".join(database.SEED_COLUMNS[1:] + ("is_standard",))
+        conn.execute(f"CREATE TEMP TRIGGER seed_touch AFTER UPDATE OF {columns} ON medicine_catalog "
+                     "BEGIN INSERT INTO touched VALUES (new.barcode); END")
+        try:
+            _write_seed(seed_file, [_item("S1", "甲药", tags="感冒"), _item("S2", "乙药", tags="发烧 头痛"),
+                                    _item("S3", "丙药")])
+            stats = sqlite_db.import_seed_data(conn)
+            touched = [r[0] for r in conn.execute("SELECT barcode FROM touched")]
+        finally:
+            conn.execute("DROP TRIGGER temp.seed_touch")
+            conn.execute("DROP TABLE temp.touched")
+    assert stats == {"inserted": 1, "updated": 1, "removed": 0, "unchanged": 1}
+    assert touched == ["S2"]
+    assert tags.barcodes_with_tags(("头痛",)) == {"S2"}
+
+def test_entries_removed_from_seed_are_demoted(db, seed_file):
+    _write_seed(seed_file, [_item("S1", "甲药"), _item("S2", "乙药")])
+    with db.borrow_connection() as conn:
+        db.import_seed_data(conn)
+    assert inventory.add_inventory_item("S2", days_from_today(100), 5, "爸爸", "")
+
+    _write_seed(seed_file, [_item("S1", "甲药")])
+    with db.borrow_connection() as conn:
+        stats = db.import_seed_data(conn)
+        demoted = conn.execute("SELECT name, is_standard FROM medicine_catalog WHERE barcode = 'S2'").fetchone()
+        held = conn.execute("SELECT COUNT(*) FROM inventory WHERE barcode = 'S2'").fetchone()[0]
+    assert stats["removed"] == 1 and stats["unchanged"] == 1
+    # 不物理删除：库存仍然引用它，只是不再是官方条目
+    assert tuple(demoted) == ("乙药", 0) and held == 1
+
+    # 重新出现在种子里时恢复为官方
+    _write_seed(seed_file, [_item("S1", "甲药"), _item("S2", "乙药")])
+    with db.borrow_connection() as conn:
+        assert db.import_seed_data(conn)["updated"] == 1
+        assert _standard(conn) == {"S1": "甲药", "S2": "乙药"}
+
+def test_legacy_json_array_is_streamed(sqlite_db, seed_file, tmp_path):
+    items = [_item(f"S{n}", f"药品{n}", indications="含有 [括号]、逗号, 和 \"引号\" 的说明") for n in range(30)]
+    text = "\n  [\n" + ",\n".join(json.dumps(i, ensure_ascii=False, indent=2) for i in items) + "\n]\n"
+    # 块大小很小时元素会跨块边界，逐个解析的结果仍与整体 json.loads 相同
+    assert list(database._iter_json_array(io.StringIO(text), chunk_size=7)) == json.loads(text)
+    assert list(database._iter_json_array(io.StringIO("[ ]"))) == []
+    with pytest.raises(ValueError):
+        list(database._iter_json_array(io.StringIO('{"barcode": "S1"}')))
+    with pytest.raises(ValueError):
+        list(database._iter_json_array(io.StringIO('[{"barcode": "S1"},')))
+
+    # 只有旧版 JSON 数组文件时从它导入；两种都有时优先 JSON Lines
+    legacy = tmp_path / "catalog_seed.json"
+    legacy.write_text(text, encoding="utf-8")
+    assert database.seed_file_path() == str(legacy)
+    with sqlite_db.borrow_connection() as conn:
+        assert sqlite_db.import_seed_data(conn)["inserted"] == 30
+        assert len(_standard(conn)) == 30
+    _write_seed(seed_file, items[:1])
+    assert database.seed_file_path() == str(seed_file)
+    assert [i["barcode"] for i in database.iter_seed_items(database.seed_file_path())] == ["S0"]
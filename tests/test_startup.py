@@ -0,0 +1,48 @@
+# tests/test_startup.py
+"""冷启动：页面模块按需导入、openai/httpx 延迟到第一次提问、表结构检查每个进程只做一次"""
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from src import database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY = ("openai", "httpx", "tenacity")
+
+def _loaded(code, env=None):
+    """在全新的子进程里执行 code，返回其中关心的模块哪些已加载"""
+    code += "\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                          env={**os.environ, **(env or {})}, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    return set(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+@pytest.mark.parametrize("module", ["src.views.sidebar", "src.views.dashboard", "src.views.operations",
+                                    "src.views.catalog", "src.views.ai_doctor", "src.api", "src.worker"])
+def test_llm_client_is_not_imported_at_startup(module):
+    assert not _loaded(f"import {module}") & set(LAZY)
+
+def test_app_imports_only_the_selected_page(tmp_path):
+    code = f"""
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({os.path.join(ROOT, "app.py")!r}, default_timeout=60).run()
+assert not at.exception, [e.value for e in at.exception]
+at.sidebar.radio[0].set_value("📖 公共药库").run()
+assert not at.exception, [e.value for e in at.exception]
+"""
+    loaded = _loaded(code, env={database.DATABASE_URL_ENV: f"sqlite:///{tmp_path / 'app.db'}"})
+    # 看板 (默认页) 和切换到的药库页面被导入；没打开的页面和 AI 依赖都没有加载
+    assert {"src.views.dashboard", "src.views.catalog"} <= loaded
+    assert not loaded & {"src.views.operations", "src.views.ai_doctor", *LAZY}
+
+def test_schema_check_runs_once_per_backend(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(database, "init_db", lambda: calls.append(database.get_backend()))
+    for name in ("one", "two"):
+        database.set_backend(database.create_backend(f"sqlite:///{tmp_path / name}.db"))
+        assert database.ensure_db_ready()
+        assert not database.ensure_db_ready()
+    assert len(calls) == 2 and calls[0] is not calls[1]
@@ -0,0 +1,158 @@
+# tests/test_sync.py
+"""两个 SQLite 实例之间的增量同步：增删改的传播、后写为准的冲突裁决、重复应用幂等"""
+import time
+
+import pytest
+
+from src import database
+from src.services import catalog, inventory, members, sync
+from tests.conftest import add_catalog, days_from_today
+
+HH = database.DEFAULT_HOUSEHOLD_ID
+
+def _use(path):
+    """把当前后端切换到某个实例的数据库文件 (服务层随之读写该实例)"""
+    database.set_backend(database.create_backend(f"sqlite:///{path}"))
+    database.ensure_db_ready()
+
+@pytest.fixture
+def instances(tmp_path):
+    """home / laptop 两个独立初始化的实例 (各自的 instance_id)"""
+    paths = {name: str(tmp_path / f"{name}.db") for name in ("home", "laptop")}
+    for path in paths.values():
+        _use(path)
+    return paths
+
+def _sync(paths):
+    """在 home 上与 laptop 双向同步"""
+    _use(paths["home"])
+    peer = sync.LocalPeer(paths["laptop"])
+    try:
+        return sync.sync_with(peer)
+    finally:
+        peer.close()
+
+def _state(path):
+    _use(path)
+    with database.borrow_connection() as conn:
+        return {
+            "catalog": conn.execute("SELECT barcode, name, tags FROM medicine_catalog "
+                                    "WHERE is_standard = 0 ORDER BY barcode").fetchall(),
+            "members": conn.execute("SELECT name, is_default FROM family_members "
+                                    "WHERE household_id = ? ORDER BY name", (HH,)).fetchall(),
+            "inventory": conn.execute("SELECT uid, barcode, expiry_date, quantity_val, owner FROM inventory "
+                                      "WHERE household_id = ? ORDER BY uid", (HH,)).fetchall(),
+        }
+
+def _only_inventory(path):
+    rows = _state(path)["inventory"]
+    assert len(rows) == 1
+    return rows[0]
+
+def _inventory_id(uid):
+    with database.borrow_connection() as conn:
+        return conn.execute("SELECT id FROM inventory WHERE uid = ?", (uid,)).fetchone()[0]
+
+def _seed_home(paths):
+    _use(paths["home"])
+    add_catalog("T3001", "同步测试药", tags="感冒")
+    assert inventory.add_inventory_item("T3001", days_from_today(200), 10, "爸爸", "每次1片")
+    assert members.add_member("外婆", HH)[0]
+
+def test_inserts_updates_and_deletes_propagate(instances):
+    _seed_home(instances)
+    result = _sync(instances)
+    # 两边初始化时各自写入了默认成员，内容相同，只按时间戳对齐
+    assert result["pushed"]["applied"] == 3 and result["pushed"]["rejected"] == 0
+    assert _state(instances["laptop"]) == _state(instances["home"])
+    assert catalog.lookup_barcode("T3001")["name"] == "同步测试药"  # 当前为 laptop
+
+    # 对方修改：数量、药库条目、删除成员
+    uid = _only_inventory(instances["laptop"])["uid"]
+    assert inventory.update_quantity(_inventory_id(uid), 4)
+    add_catalog("T3001", "同步测试药(改)", tags="感冒 发烧")
+    assert members.delete_member("外婆", HH)
+    _sync(instances)
+    home = _state(instances["home"])
+    assert home == _state(instances["laptop"])
+    assert home["inventory"][0]["quantity_val"] == 4
+    assert "外婆" not in [m["name"] for m in home["members"]]
+    _use(instances["home"])
+    assert catalog.lookup_barcode("T3001")["name"] == "同步测试药(改)"
+
+    # 本地删除库存后再删药库条目
+    assert inventory.delete_medicine(_inventory_id(uid))
+    assert catalog.delete_catalog_item("T3001")
+    _sync(instances)
+    laptop = _state(instances["laptop"])
+    assert laptop == _state(instances["home"])
+    assert laptop["inventory"] == [] and laptop["catalog"] == []
+
+@pytest.mark.parametrize("first, last", [("home", "laptop"), ("laptop", "home")])
+def test_concurrent_edits_last_writer_wins(instances, first, last):
+    _seed_home(instances)
+    _sync(instances)
+    uid = _only_inventory(instances["home"])["uid"]
+
+    # 两边在同步之前各自修改同一条库存，后改的一方胜出
+    for side, quantity in ((first, 3), (last, 7)):
+        _use(instances[side])
+        assert inventory.update_quantity(_inventory_id(uid), quantity)
+        time.sleep(0.01)  # changed_at 精确到毫秒
+    _sync(instances)
+    assert _only_inventory(instances["home"])["quantity_val"] == 7
+    assert _only_inventory(instances["laptop"])["quantity_val"] == 7
+
+    # 再同步一次没有任何变化 (胜出的一方不会被旧值推回)
+    result = _sync(instances)
+    assert result["pulled"]["applied"] == result["pushed"]["applied"] == 0
+
+def test_user_data_does_not_override_official_entries(instances):
+    _use(instances["home"])
+    with database.borrow_connection() as conn:
+        standard = conn.execute("SELECT barcode, name FROM medicine_catalog WHERE is_standard = 1 LIMIT 1").fetchone()
+    _use(instances["laptop"])
+    # laptop 上把官方条目改成了用户数据
+    add_catalog(standard["barcode"], "被改名的官方药")
+    _sync(instances)
+    _use(instances["home"])
+    assert catalog.lookup_barcode(standard["barcode"])["name"] == standard["name"]
+
+def test_reapplying_the_same_changes_is_idempotent(instances):
+    _sync(instances)  # 先对齐两边的默认成员
+    _use(instances["home"])
+    head = sync.sync_info()["head"]
+    _seed_home(instances)
+    batch = sync.read_changes(head)
+    assert batch["changes"]
+
+    _use(instances["laptop"])
+    first = sync.apply_remote_changes(batch["changes"])
+    state = _state(instances["laptop"])
+    again = sync.apply_remote_changes(batch["changes"])
+    assert first["applied"] == 3
+    assert again["applied"] == 0 and again["skipped"] == len(batch["changes"])
+    assert _state(instances["laptop"]) == state
+
+    # 已经通过 apply 收到的变化，正式同步时也不会重复写入或回推
+    result = _sync(instances)
+    assert result["pulled"]["applied"] == 0 and result["pushed"]["applied"] == 0
+    assert _state(instances["home"]) == _state(instances["laptop"])
+
+def test_sync_to_a_new_file_initializes_it(instances, tmp_path):
+    _seed_home(instances)
+    target = tmp_path / "backup" / "new.db"
+    assert not target.exists()
+    result = _sync({"home": instances["home"], "laptop": str(target)})
+    assert result["pushed"]["rejected"] == 0
+
+    # 新文件和 init_db 建出来的库一样完整：最新 schema、官方药库、默认成员，之后能正常同步
+    conn = database.get_connection(str(target))
+    try:
+        assert database.get_schema_version(conn) == database.MIGRATIONS[-1][0]
+        assert conn.execute("SELECT COUNT(*) FROM medicine_catalog WHERE is_standard = 1").fetchone()[0] > 0
+    finally:
+        conn.close()
+    assert _state(str(target)) == _state(instances["home"])
+    result = _sync({"home": instances["home"], "laptop": str(target)})
+    assert result["pulled"]["applied"] == result["pushed"]["applied"] == 0
@@ -0,0 +1,71 @@
+# tests/test_tags.py
+"""标签分面：标签原文的规范化、精确匹配、多个标签取交集、药库/库存的分面计数与筛选"""
+import pytest
+
+from src.services import catalog, inventory, queries, tags
+from tests.conftest import add_catalog, days_from_today
+
+@pytest.mark.parametrize("raw, expected", [
+    (None, ()),
+    ("", ()),
+    ("感冒, 发烧、感冒；儿童", ("感冒", "发烧", "儿童")),
+    ("  感冒，，发烧;  ", ("感冒", "发烧")),
+    (["感冒 发烧", "感冒", ""], ("感冒", "发烧")),
+])
+def test_normalize_tags(raw, expected):
+    assert tags.normalize_tags(raw) == expected
+
+def test_tag_filter_sql_intersects():
+    assert tags.tag_filter_sql(()) == (None, [])
+    sql, params = tags.tag_filter_sql("甲 乙 甲")
+    assert params == ["甲", "乙"]
+    assert sql.count(" INTERSECT ") == 1 and sql.count("?") == 2
+
+@pytest.fixture
+def tagged(db):
+    # 标签都带 “测” 前缀，不和种子数据里的标签混在一起
+    add_catalog("G0001", "标签测试药一", tags="测感冒 测儿童")
+    add_catalog("G0002", "标签测试药二", tags="测感冒灵，测儿童")
+    add_catalog("G0003", "标签测试药三", tags="测感冒、测发烧")
+    add_catalog("G0004", "标签测试药四")
+    return db
+
+def _mine(facets):
+    return {name: n for name, n in facets if name.startswith("测")}
+
+def test_catalog_tags_match_exactly_and_intersect(tagged):
+    assert tags.barcodes_with_tags(("测感冒",)) == {"G0001", "G0003"}  # 不含只标了 “测感冒灵” 的
+    assert tags.barcodes_with_tags(("测感冒", "测儿童")) == {"G0001"}
+    assert tags.barcodes_with_tags(("测感冒", "不存在")) == frozenset()
+
+    assert _mine(tags.catalog_tag_facets()) == {"测感冒": 2, "测儿童": 2, "测感冒灵": 1, "测发烧": 1}
+    # 选了 “测感冒” 之后，每个标签还剩多少条
+    assert _mine(tags.catalog_tag_facets(("测感冒",))) == {"测感冒": 2, "测儿童": 1, "测发烧": 1}
+
+    rows, total = catalog.load_catalog_page(0, 10, tags=("测儿童", "测感冒"))
+    assert total == 1 and [r.barcode for r in rows] == ["G0001"]
+    rows, total = catalog.load_catalog_page(0, 10, search="标签测试药", tags=("测儿童",))
+    assert total == 2 and {r.barcode for r in rows} == {"G0001", "G0002"}
+    assert [r["barcode"] for r in catalog.iter_catalog_rows(tags=("测发烧",))] == ["G0003"]
+
+def test_retagging_and_deleting_update_the_index(tagged):
+    add_catalog("G0001", "标签测试药一", tags="测发烧")
+    assert tags.barcodes_with_tags(("测感冒",)) == {"G0003"}
+    assert tags.barcodes_with_tags(("测发烧",)) == {"G0001", "G0003"}
+
+    assert catalog.delete_catalog_item("G0002")
+    assert tags.barcodes_with_tags(("测感冒灵",)) == frozenset()
+    assert "测感冒灵" not in _mine(tags.catalog_tag_facets())
+
+def test_inventory_tag_facets_and_filter(tagged):
+    assert inventory.add_inventory_items([("G0001", days_from_today(100), 1, "爸爸", ""),
+                                          ("G0001", days_from_today(200), 1, "妈妈", ""),
+                                          ("G0003", days_from_today(300), 1, "爸爸", "")])
+    assert _mine(tags.inventory_tag_facets()) == {"测感冒": 3, "测儿童": 2, "测发烧": 1}
+    assert _mine(tags.inventory_tag_facets(owner="爸爸")) == {"测感冒": 2, "测儿童": 1, "测发烧": 1}
+    assert _mine(tags.inventory_tag_facets(tags=("测发烧",))) == {"测感冒": 1, "测发烧": 1}
+
+    rows, total = queries.load_inventory_page(0, 10, tags=("测感冒", "测儿童"))
+    assert total == 2 and {r.owner for r in rows} == {"爸爸", "妈妈"}
+    rows, total = queries.load_inventory_page(0, 10, owner="爸爸", tags=("测儿童",))
+    assert total == 1 and rows[0].barcode == "G0001"
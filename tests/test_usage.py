@@ -0,0 +1,73 @@
+# tests/test_usage.py
+"""库存台账与用量预测：数量变动写台账、按高水位增量汇总、日均用量与预计用完天数"""
+import math
+from datetime import date, timedelta
+
+import pandas as pd
+
+from src import database
+from src.services import inventory, queries, usage
+from tests.conftest import add_catalog, days_from_today
+
+def _daily(conn):
+    return [tuple(r) for r in conn.execute(
+        "SELECT barcode, owner, consumed, doses FROM consumption_daily ORDER BY barcode, owner")]
+
+def test_forecast_runout():
+    today = date(2026, 3, 31)
+    stock = pd.DataFrame([("A", "爸爸", 10.0), ("B", "妈妈", 8.0), ("C", "宝宝", 5.0), ("D", "", 3.0)],
+                         columns=["barcode", "owner", "quantity"])
+    rates = pd.DataFrame([("A", "爸爸", 30.0, (today - timedelta(days=29)).isoformat()),
+                          ("B", "妈妈", 4.0, today.isoformat()),   # 今天才开始记录：按 1 天算日均
+                          ("D", "", 0.0, today.isoformat())],
+                         columns=["barcode", "owner", "consumed", "first_day"])
+    result = usage.forecast_runout(stock, rates, today, window_days=30).set_index("barcode")
+    assert list(result.columns) == ["owner", "quantity", "daily_rate", "days_until_empty"]
+    assert result.loc["A", "daily_rate"] == 1.0 and result.loc["A", "days_until_empty"] == 10.0
+    assert result.loc["B", "daily_rate"] == 4.0 and result.loc["B", "days_until_empty"] == 2.0
+    # 没有用量记录、或用量为 0 的不做预测
+    for barcode in ("C", "D"):
+        assert math.isnan(result.loc[barcode, "daily_rate"]) and math.isnan(result.loc[barcode, "days_until_empty"])
+
+def test_rollup_is_incremental(db):
+    add_catalog("U0001", "测试降压片")
+    assert inventory.add_inventory_item("U0001", days_from_today(300), 20, "爷爷", "每日1片")
+    med_id = queries.load_inventory_rows()[0].id
+
+    assert inventory.decrease_quantity(med_id, 2) == (True, 18)
+    assert inventory.decrease_quantity(med_id, 3) == (True, 15)
+    assert inventory.adjust_quantities([(med_id, 5)]) == (True, {med_id: 20})  # 补货不算用量
+    assert inventory.update_quantity(med_id, 16)  # 修正减少的部分算用量 (液体/药膏)
+    history = usage.get_item_history(med_id)
+    assert [(h["kind"], h["delta"], h["quantity_after"]) for h in history] == [
+        (usage.SET, -4, 16), (usage.ADJUST, 5, 20), (usage.DOSE, -3, 15), (usage.DOSE, -2, 18)]
+    assert len(usage.get_item_history(med_id, limit=2)) == 2
+
+    assert usage.rollup_consumption() > 0
+    assert usage.rollup_consumption() == 0  # 没有新台账：不重复累加
+    with database.borrow_connection() as conn:
+        assert _daily(conn) == [("U0001", "爷爷", 9, 3)]
+
+    assert inventory.decrease_quantity(med_id, 1) == (True, 15)
+    assert usage.rollup_consumption() == 1
+    with database.borrow_connection() as conn:
+        assert _daily(conn) == [("U0001", "爷爷", 10, 4)]
+
+def test_usage_forecast(db):
+    add_catalog("U0002", "测试钙片")
+    assert inventory.add_inventory_items([("U0002", days_from_today(300), 30, "奶奶", ""),
+                                          ("U0002", days_from_today(400), 30, "奶奶", ""),
+                                          ("U0002", days_from_today(400), 10, "爸爸", "")])
+    rows = queries.load_inventory_rows()
+    grandma = [r.id for r in rows if r.owner == "奶奶"]
+    assert inventory.decrease_quantity(grandma[0], 6)[0]
+
+    # 预测前会先补一次汇总；同药同人的库存合计后再除以日均用量
+    forecast = usage.get_usage_forecast().set_index("owner")
+    assert forecast.loc["奶奶", "quantity"] == 54 and forecast.loc["奶奶", "daily_rate"] == 6
+    assert forecast.loc["奶奶", "days_until_empty"] == 9
+    assert math.isnan(forecast.loc["爸爸", "daily_rate"])
+
+    frame = usage.attach_usage_forecast(queries.inventory_frame(rows))
+    assert frame.loc[frame["owner"] == "奶奶", "days_until_empty"].tolist() == [9, 9]
+    assert frame.loc[frame["owner"] == "爸爸", "days_until_empty"].isna().all()